@@ -1,3 +1,6 @@
+import threading
+from collections import OrderedDict
+
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.utils import timezone
@@ -14,7 +17,33 @@ def _get_client_ip(request):
     return request.META.get("REMOTE_ADDR", "")
 
 
+# Cada cuánto se apunta `last_seen_at` como mucho. Entre medias la sesión se
+# da por vista sin tocar la base de datos.
+HEARTBEAT_SECONDS = 60
+# Sesiones que recuerda cada proceso. Pasado el tope se olvidan las más
+# antiguas, que solo cuesta volver a escribirlas una vez.
+HEARTBEAT_MAX_SESSIONS = 10_000
+
+_vistos = OrderedDict()
+_vistos_lock = threading.Lock()
+
+
 class UserSessionMiddleware:
+    """Registra la sesión del usuario y cuándo se le vio por última vez.
+
+    Esto corre en cada petición autenticada, sondeos AJAX incluidos, y antes
+    hacía siempre un `get_or_create` y un `save`. Ahora lo último escrito se
+    recuerda en la memoria del proceso: mientras el usuario, la IP y el
+    navegador sean los mismos, solo se escribe una vez por `HEARTBEAT_SECONDS`,
+    y con un `update` directo. Un cambio de IP o de navegador se guarda en el
+    momento.
+
+    No va a la caché de Django porque por defecto es la de base de datos
+    (`django_cache`): leerla en cada petición era cambiar un SELECT por otro.
+    Con varios workers cada uno lleva su memoria, así que una sesión se puede
+    escribir una vez por minuto y worker; sigue siendo una cota fija.
+    """
+
     def __init__(self, get_response):
         self.get_response = get_response
 
@@ -24,34 +53,56 @@ class UserSessionMiddleware:
             return self.get_response(request)
 
         if request.user.is_authenticated:
-            if not request.session.session_key:
-                request.session.save()
-            session_key = request.session.session_key
-            ip_address = _get_client_ip(request)
-            user_agent = request.META.get("HTTP_USER_AGENT", "")
-            session, _ = UserSession.objects.get_or_create(
-                session_key=session_key,
-                defaults={
-                    "user": request.user,
-                    "ip_address": ip_address,
-                    "user_agent": user_agent[:512],
-                },
-            )
-            if session.user_id != request.user.id:
-                session.user = request.user
-            if session.ip_address != ip_address:
-                session.ip_address = ip_address
-            if session.user_agent != user_agent[:512]:
-                session.user_agent = user_agent[:512]
-            now = timezone.now()
-            if session.last_seen_at <= now - timezone.timedelta(seconds=60):
-                session.last_seen_at = now
-            if session.ended_at:
-                session.ended_at = None
-            session.save(update_fields=["user", "ip_address", "user_agent", "last_seen_at", "ended_at"])
+            self._heartbeat(request)
 
         return self.get_response(request)
 
+    def _heartbeat(self, request):
+        if not request.session.session_key:
+            request.session.save()
+        session_key = request.session.session_key
+        ip_address = _get_client_ip(request)
+        user_agent = request.META.get("HTTP_USER_AGENT", "")[:512]
+        firma = (request.user.id, ip_address, user_agent)
+        now = timezone.now()
+
+        with _vistos_lock:
+            visto = _vistos.get(session_key)
+        if visto and visto["firma"] == firma:
+            if now - visto["escrito"] < timezone.timedelta(seconds=HEARTBEAT_SECONDS):
+                return
+            # Sin `save()`: un latido no es un cambio que deba pasar por la auditoría.
+            actualizadas = UserSession.objects.filter(session_key=session_key, user_id=request.user.id).update(
+                last_seen_at=now,
+                ended_at=None,
+            )
+            if actualizadas:
+                self._remember(session_key, firma, now)
+                return
+
+        session, _ = UserSession.objects.get_or_create(
+            session_key=session_key,
+            defaults={
+                "user": request.user,
+                "ip_address": ip_address,
+                "user_agent": user_agent,
+            },
+        )
+        session.user = request.user
+        session.ip_address = ip_address
+        session.user_agent = user_agent
+        session.last_seen_at = now
+        session.ended_at = None
+        session.save(update_fields=["user", "ip_address", "user_agent", "last_seen_at", "ended_at"])
+        self._remember(session_key, firma, now)
+
+    def _remember(self, session_key, firma, now):
+        with _vistos_lock:
+            _vistos[session_key] = {"firma": firma, "escrito": now}
+            _vistos.move_to_end(session_key)
+            while len(_vistos) > HEARTBEAT_MAX_SESSIONS:
+                _vistos.popitem(last=False)
+
 
 class RoleAccessMiddleware:
     def __init__(self, get_response):
@@ -1,3 +1,6 @@
+import unicodedata
+from functools import lru_cache
+
 ROLE_ADMIN = "administracion"
 ROLE_ADMIN_ALIAS = "admin"
 ROLE_DIRECCION = "direccion"
@@ -6,29 +9,53 @@ ROLE_COMERCIAL = "comercial"
 ROLE_MODERATORS = "moderators"
 
 
-def _get_role(user):
-    access = get_user_access(user)
-    if not access:
-        return ""
-    raw = (access.role or "").strip().lower()
+# Los helpers de abajo se consultan muchas veces en una misma petición (el
+# middleware, cada `_user_can_*` de las vistas, el panel financiero). El rol y
+# los permisos se resuelven una vez y se guardan en el propio objeto `user`, que
+# el middleware de autenticación crea de nuevo en cada petición: el resultado
+# vive lo que vive la petición.
+_RESOLVED_ATTR = "_resolved_access"
+
+
+@lru_cache(maxsize=64)
+def _normalize_role(raw: str) -> str:
+    raw = (raw or "").strip().lower()
     if not raw:
         return ""
     # Normaliza acentos (p.ej. "dirección" -> "direccion") para evitar roles no reconocidos.
-    try:
-        import unicodedata
+    return "".join(ch for ch in unicodedata.normalize("NFKD", raw) if not unicodedata.combining(ch))
 
-        raw = "".join(ch for ch in unicodedata.normalize("NFKD", raw) if not unicodedata.combining(ch))
+
+def _resolved_access(user) -> dict:
+    resolved = getattr(user, _RESOLVED_ATTR, None)
+    if resolved is not None:
+        return resolved
+    access = get_user_access(user)
+    role = _normalize_role(access.role) if access else ""
+    is_admin = bool(getattr(user, "is_superuser", False)) or role in {ROLE_ADMIN, ROLE_ADMIN_ALIAS}
+    resolved = {
+        "role": role,
+        "is_admin": is_admin,
+        "use_custom_perms": bool(access and access.use_custom_perms),
+        "permissions": _build_permissions(access, role, is_admin),
+    }
+    try:
+        setattr(user, _RESOLVED_ATTR, resolved)
     except Exception:
         pass
-    return raw
+    return resolved
+
+
+def _get_role(user):
+    if not user or not user.is_authenticated:
+        return ""
+    return _resolved_access(user)["role"]
 
 
 def is_admin_user(user) -> bool:
     if not user or not user.is_authenticated:
         return False
-    if user.is_superuser:
-        return True
-    return _get_role(user) in {ROLE_ADMIN, ROLE_ADMIN_ALIAS}
+    return _resolved_access(user)["is_admin"]
 
 
 def is_direccion_user(user) -> bool:
@@ -62,11 +89,19 @@ def get_user_access(user):
 
 
 def use_custom_permissions(user) -> bool:
-    access = get_user_access(user)
-    return bool(access and access.use_custom_perms)
+    if not user or not user.is_authenticated:
+        return False
+    return _resolved_access(user)["use_custom_perms"]
 
 
 def resolve_permissions(user) -> dict:
+    if not user or not user.is_authenticated:
+        return _build_permissions(None, "", False)
+    # Copia: hay quien ajusta el dict que recibe.
+    return dict(_resolved_access(user)["permissions"])
+
+
+def _build_permissions(access, role: str, is_admin: bool) -> dict:
     perms = {
         "can_simulador": False,
         "can_estudios": False,
@@ -77,13 +112,9 @@ def resolve_permissions(user) -> dict:
         "can_cms": False,
         "can_facturas_preview": False,
     }
-    if not user or not user.is_authenticated:
-        return perms
-
-    if is_admin_user(user):
+    if is_admin:
         return {k: True for k in perms}
 
-    access = get_user_access(user)
     if access and access.use_custom_perms:
         return {
             "can_simulador": bool(access.can_simulador),
@@ -96,7 +127,6 @@ def resolve_permissions(user) -> dict:
             "can_facturas_preview": bool(access.can_facturas_preview),
         }
 
-    role = _get_role(user)
     if role == ROLE_DIRECCION:
         perms.update(
             {
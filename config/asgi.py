@@ -3,6 +3,10 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+El flujo de eventos del sorteo (`SORTEO_EVENTOS`) necesita servirse por aquí:
+``gunicorn config.asgi:application -k uvicorn_worker.UvicornWorker``
+(uvicorn y uvicorn-worker van en requirements.txt).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -40,6 +40,15 @@ _IS_RENDER = str(os.environ.get("RENDER") or "").strip().lower() in {"1", "true"
 DEBUG = _env_bool("DJANGO_DEBUG", _env_bool("DEBUG", not _IS_RENDER))
 
 PDF_MESSAGE_SANITIZE = _env_bool("PDF_MESSAGE_SANITIZE", _IS_RENDER)
+# Procesos dedicados a maquetar PDF con WeasyPrint (ver `core/pdf.py`). Con 0 se
+# maquetan en el propio hilo de la petición, que es lo que hacen los tests.
+PDF_PROCESOS = int(os.environ.get("PDF_PROCESOS", "0") or 0)
+PDF_TIMEOUT = float(os.environ.get("PDF_TIMEOUT", "120") or 120)
+PDF_COLA_MAXIMA = int(os.environ.get("PDF_COLA_MAXIMA", "0") or 0)
+# Caché en disco de los PDF ya maquetados, por huella de su HTML. 0 la apaga.
+# Solo la usan los documentos que la piden (`render_pdf(..., cachear=True)`).
+PDF_CACHE_DIR = os.environ.get("PDF_CACHE_DIR") or str(BASE_DIR / "tmp" / "pdf_cache")
+PDF_CACHE_MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_BYTES", str(256 * 1024 * 1024)) or 0)
 DEBUG_TOOLBAR_ENABLED = DEBUG and _env_bool("DJANGO_DEBUG_TOOLBAR", False)
 DEV_APPS_ENABLED = DEBUG and _env_bool("DJANGO_DEV_APPS", False)
 
@@ -49,6 +58,14 @@ DEV_APPS_ENABLED = DEBUG and _env_bool("DJANGO_DEV_APPS", False)
 # en un entorno de pruebas, nunca con una rifa abierta al público.
 SORTEO_PAGO_SIMULADO = _env_bool("SORTEO_PAGO_SIMULADO", DEBUG)
 
+# Flujo de eventos (SSE) con la ocupación en vivo de la portada del sorteo.
+# Cada flujo abierto es una petición larga: con workers síncronos de gunicorn
+# ocuparía uno entero, así que solo se enciende sirviendo `config.asgi`. Sin
+# él, la portada sigue sondeando `sorteo:estado`. Cada flujo se cierra a los
+# SORTEO_EVENTOS_SEGUNDOS y el navegador se reconecta donde lo dejó.
+SORTEO_EVENTOS = _env_bool("SORTEO_EVENTOS", False)
+SORTEO_EVENTOS_SEGUNDOS = int(os.environ.get("SORTEO_EVENTOS_SEGUNDOS", "55"))
+
 # =========================
 # CONTRATO DE PRÉSTAMO
 # =========================
@@ -307,6 +324,53 @@ def _build_database_config(database_url: str | None) -> dict[str, dict[str, obje
 DATABASES = _build_database_config(DATABASE_URL)
 
 
+# =========================
+# CACHÉ
+# =========================
+# La caché por defecto de Django vive en la memoria de cada proceso: con varios
+# workers de gunicorn cada uno tenía la suya, y lo que uno guardaba los demás no
+# lo veían ni podían invalidarlo. Por defecto va a la base de datos (tabla
+# `django_cache`, que crea la migración `core.0052`); en local se puede elegir
+# fichero o memoria con `DJANGO_CACHE_BACKEND`.
+_CACHE_BACKEND = (os.environ.get("DJANGO_CACHE_BACKEND") or "database").strip().lower()
+if _CACHE_BACKEND == "file":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get("DJANGO_CACHE_LOCATION") or str(BASE_DIR / "tmp" / "django_cache"),
+        }
+    }
+elif _CACHE_BACKEND == "locmem":
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "django_cache",
+        }
+    }
+
+# Segundos que se reutiliza un payload del panel financiero. Cualquier cambio en
+# los modelos económicos lo invalida antes; esto solo acota lo que puede tardar
+# en reflejarse algo que no pasa por ellos. 0 desactiva la caché del panel.
+FINANCIAL_DASHBOARD_CACHE_SECONDS = int(os.environ.get("FINANCIAL_DASHBOARD_CACHE_SECONDS", "300"))
+
+# Consultas al Catastro (ver `core/catastro.py`): días que vale una respuesta
+# guardada y, tras cuántos fallos seguidos, cuántos segundos se deja de llamar.
+CATASTRO_BASE_URL = os.environ.get("CATASTRO_BASE_URL", "https://ovc.catastro.meh.es")
+CATASTRO_CACHE_DIAS = int(os.environ.get("CATASTRO_CACHE_DIAS", "30"))
+CATASTRO_FALLOS_PARA_CORTAR = int(os.environ.get("CATASTRO_FALLOS_PARA_CORTAR", "3"))
+CATASTRO_SEGUNDOS_CORTE = int(os.environ.get("CATASTRO_SEGUNDOS_CORTE", "120"))
+
+# Con COMUNICACIONES_EN_SEGUNDO_PLANO=1 los envíos masivos a inversores (cartas
+# en PDF y correos) se encolan y los manda el comando `procesar_comunicaciones`,
+# que tiene que estar corriendo como proceso aparte. Solo se activa donde ese
+# proceso exista: la imagen de Docker arranca únicamente gunicorn, y sin él los
+# envíos se quedarían en cola para siempre. Por defecto se mandan dentro de la
+# propia petición, como antes.
+COMUNICACIONES_EN_SEGUNDO_PLANO = _env_bool("COMUNICACIONES_EN_SEGUNDO_PLANO", False)
+
+
 # =========================
 # PASSWORDS
 # =========================
@@ -349,6 +413,21 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 # Media (subidas)
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+# Miniaturas y vistas PNG de los documentos PDF (ver `core/derivados.py`):
+# lado mayor en píxeles de cada variante.
+DERIVADOS_TAMANOS = {"miniatura": 480, "vista": 1600}
+DERIVADOS_DPI = int(os.environ.get("DERIVADOS_DPI", "150") or 150)
+# Copias de las fotografías para los PDF: caja de destino en milímetros,
+# resolución a la que se imprimen y calidad del JPEG (o WEBP).
+DERIVADOS_CAJAS = {
+    "portada": (140, 140),
+    "cabecera": (190, 65),
+    "detalle": (95, 60),
+    "pagina": (170, 257),
+}
+DERIVADOS_DPI_FOTOS = int(os.environ.get("DERIVADOS_DPI_FOTOS", "200") or 200)
+DERIVADOS_CALIDAD_FOTOS = int(os.environ.get("DERIVADOS_CALIDAD_FOTOS", "82") or 82)
+DERIVADOS_FORMATO_FOTOS = os.environ.get("DERIVADOS_FORMATO_FOTOS", "JPEG")
 
 # =========================
 # LÍMITES DE SUBIDA
@@ -443,6 +522,11 @@ EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD", "")
 EMAIL_USE_TLS = os.environ.get("EMAIL_USE_TLS", "1") == "1"
 EMAIL_USE_SSL = os.environ.get("EMAIL_USE_SSL", "0") == "1"
 DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL", "Inversure <no-reply@inversurehomes.es>")
+# Reutilización de la conexión SMTP (ver `core/correo.py`): segundos que se
+# conserva abierta entre correos sueltos (0 = una por correo) y mensajes que se
+# mandan por cada conexión antes de abrir otra.
+EMAIL_CONEXION_SEGUNDOS = float(os.environ.get("EMAIL_CONEXION_SEGUNDOS", "30") or 0)
+EMAIL_LOTE = int(os.environ.get("EMAIL_LOTE", "50") or 0)
 LANDING_LEAD_NOTIFY_EMAILS = [
     email.strip()
     for email in os.environ.get("LANDING_LEAD_NOTIFY_EMAILS", "comunicaciones@inversurehomes.es").split(",")
@@ -23,6 +23,9 @@ def use_manifest_staticfiles_storage(settings):
     global _STATICFILES_COLLECTED
 
     settings.STATIC_ROOT = _STATIC_ROOT
+    # Muchos tests sustituyen `weasyprint` por dobles: con la caché de PDF
+    # encendida, uno podría recibir el documento que generó otro.
+    settings.PDF_CACHE_MAX_BYTES = 0
     _clear_staticfiles_cache()
 
     if not _STATICFILES_COLLECTED:
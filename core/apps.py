@@ -1,6 +1,10 @@
 from django.apps import AppConfig
 
 
+def _register_signals():
+    from . import signals  # noqa: F401
+
+
 def _register_auditlog():
     from auditlog.registry import auditlog
     from . import models
@@ -33,4 +37,5 @@ class CoreConfig(AppConfig):
     name = 'core'
 
     def ready(self):
+        _register_signals()
         _register_auditlog()
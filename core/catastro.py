@@ -0,0 +1,288 @@
+"""
+Consultas a la Sede Electrónica del Catastro.
+
+Para una referencia catastral se prueban varias formas de escribirla (completa,
+14 y 18 caracteres) y, para cada una, varias variantes de consulta o de
+servicio. Hacerlo en serie, con dos segundos por intento, podía sumar más de
+treinta segundos a la ficha catastral o a una presentación cuando el Catastro
+iba lento o estaba caído. Aquí:
+
+- las respuestas se guardan en `ConsultaCatastro` y no se vuelve a preguntar
+  hasta que caducan (`CATASTRO_CACHE_DIAS`);
+- las variantes se lanzan a la vez y vale la primera que trae datos;
+- si el servicio falla varias veces seguidas se deja de llamar durante un rato
+  (cortacircuitos compartido por todos los procesos a través de la caché), y
+  mientras tanto se contesta con lo guardado aunque haya caducado.
+"""
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+log = logging.getLogger(__name__)
+
+RUTA_COORDENADAS = "/OVCServWeb/OVCWcfCallejero/COVCCoordenadas.svc/json/Consulta_CPMRC"
+RUTAS_DATOS = (
+    "/OVCServWeb/OVCWcfCallejero/COVCCallejero.svc/json/Consulta_DNPRC",
+    "/OVCServWeb/OVCWcfCallejero/COVCCallejeroCodigos.svc/json/Consulta_DNPRC_Codigos",
+)
+
+# Una referencia que el Catastro dice no conocer se vuelve a preguntar antes
+# que una que sí tiene datos: puede ser un error de tecleo que ya se corrigió.
+DIAS_NO_ENCONTRADA = 1
+
+_CLAVE_FALLOS = "catastro:circuito:fallos"
+_CLAVE_ABIERTO = "catastro:circuito:abierto"
+
+_PENDIENTE = object()
+
+
+class _SinServicio(Exception):
+    """El Catastro no contestó (red, tiempo agotado o error 5xx)."""
+
+
+def buscar_clave(obj, key):
+    """El primer valor de `key` en cualquier nivel de un JSON."""
+    if isinstance(obj, dict):
+        if key in obj:
+            return obj.get(key)
+        for v in obj.values():
+            found = buscar_clave(v, key)
+            if found is not None:
+                return found
+    elif isinstance(obj, list):
+        for item in obj:
+            found = buscar_clave(item, key)
+            if found is not None:
+                return found
+    return None
+
+
+def buscar_primera_clave(obj, keys):
+    for key in keys:
+        found = buscar_clave(obj, key)
+        if found is not None:
+            return found
+    return None
+
+
+def normalizar_refcat(refcat) -> str:
+    return (refcat or "").replace(" ", "").strip().upper()
+
+
+def _candidatas(refcat: str) -> list[str]:
+    candidatas = [refcat]
+    if len(refcat) >= 14:
+        candidatas.append(refcat[:14])
+    if len(refcat) >= 18:
+        candidatas.append(refcat[:18])
+    return list(dict.fromkeys(c for c in candidatas if c))
+
+
+def _interpretar_coordenadas(data, candidata):
+    xcen = buscar_clave(data, "xcen")
+    ycen = buscar_clave(data, "ycen")
+    if xcen is None or ycen is None:
+        return None
+    return [float(str(xcen).replace(",", ".")), float(str(ycen).replace(",", "."))]
+
+
+def _interpretar_datos(data, candidata):
+    luso = buscar_clave(data, "luso")
+    ant = buscar_clave(data, "ant")
+    sfc = buscar_clave(data, "sfc")
+    ss = buscar_primera_clave(data, ["ssf", "ss"])
+    cpt = buscar_primera_clave(data, ["cpt", "cup"])
+    ldt = buscar_primera_clave(data, ["ldt", "dir", "ldir"])
+    np = buscar_clave(data, "np")
+    nm = buscar_clave(data, "nm")
+    nombre_provincia = buscar_primera_clave(data, ["npn", "npv", "provincia"])
+    if not any(v is not None for v in (luso, ant, sfc, ss, ldt, nm, np)):
+        return None
+    return {
+        "ref_catastral": candidata,
+        "uso": luso,
+        "antiguedad": ant,
+        "superficie_construida": sfc,
+        "superficie_solar": ss,
+        "coef_participacion": cpt,
+        "direccion": ldt,
+        "municipio": nm,
+        "provincia": nombre_provincia,
+        "numero": np,
+        "raw": data,
+    }
+
+
+class CatastroClient:
+    """Coordenadas y datos no protegidos de una finca, con caché y cortacircuitos."""
+
+    def __init__(self, base_url=None, *, timeout=(2, 2), hilos=6, session=None):
+        self.base_url = (base_url or getattr(settings, "CATASTRO_BASE_URL", "") or "https://ovc.catastro.meh.es").rstrip("/")
+        self.timeout = timeout
+        self.hilos = max(1, hilos)
+        self.session = session or requests
+        self.cache_dias = int(getattr(settings, "CATASTRO_CACHE_DIAS", 30))
+        self.umbral_fallos = int(getattr(settings, "CATASTRO_FALLOS_PARA_CORTAR", 3))
+        self.segundos_corte = int(getattr(settings, "CATASTRO_SEGUNDOS_CORTE", 120))
+
+    # --- Consultas ---------------------------------------------------------
+
+    def coordenadas(self, refcat):
+        """(x, y) en EPSG:4326, o None."""
+        consultas = []
+        for candidata in _candidatas(normalizar_refcat(refcat)):
+            variantes = [{"RefCat": candidata, "SRS": "EPSG:4326"}]
+            rc14 = candidata[:14] if len(candidata) >= 14 else ""
+            if rc14:
+                variantes.append({"RC1": rc14[:7], "RC2": rc14[7:14], "SRS": "EPSG:4326"})
+                variantes.append({"RC": rc14, "SRS": "EPSG:4326"})
+            consultas.extend((RUTA_COORDENADAS, params, candidata) for params in variantes)
+        resultado = self._consultar("coordenadas", refcat, consultas, _interpretar_coordenadas)
+        return tuple(resultado) if resultado else None
+
+    def datos_no_protegidos(self, refcat):
+        """Uso, antigüedad, superficies, dirección... de la finca, o None."""
+        consultas = [
+            (ruta, {"RefCat": candidata}, candidata)
+            for candidata in _candidatas(normalizar_refcat(refcat))
+            for ruta in RUTAS_DATOS
+        ]
+        return self._consultar("datos", refcat, consultas, _interpretar_datos)
+
+    # --- Caché ---------------------------------------------------------------
+
+    def _consultar(self, tipo, refcat, consultas, interpretar):
+        from core.models import ConsultaCatastro
+
+        ref = normalizar_refcat(refcat)
+        if not ref:
+            return None
+        guardada = ConsultaCatastro.objects.filter(ref_catastral=ref[:32], tipo=tipo).first()
+        if guardada is not None and self._vigente(guardada):
+            return guardada.resultado if guardada.encontrado else None
+        anterior = guardada.resultado if guardada is not None and guardada.encontrado else None
+
+        if self._circuito_abierto():
+            return anterior
+        try:
+            resultado = self._primera_respuesta(consultas, interpretar)
+        except _SinServicio:
+            self._anotar_fallo()
+            return anterior
+        self._anotar_exito()
+        ConsultaCatastro.objects.update_or_create(
+            ref_catastral=ref[:32],
+            tipo=tipo,
+            defaults={"encontrado": resultado is not None, "resultado": resultado, "consultado": timezone.now()},
+        )
+        return resultado
+
+    def _vigente(self, guardada) -> bool:
+        dias = self.cache_dias if guardada.encontrado else min(self.cache_dias, DIAS_NO_ENCONTRADA)
+        return guardada.consultado >= timezone.now() - timedelta(days=dias)
+
+    # --- Peticiones ------------------------------------------------------------
+
+    def _pedir(self, ruta, params):
+        try:
+            resp = self.session.get(
+                self.base_url + ruta,
+                params=params,
+                headers={"User-Agent": "Inversure/1.0"},
+                timeout=self.timeout,
+            )
+        except requests.RequestException as exc:
+            raise _SinServicio(str(exc)) from exc
+        if resp.status_code >= 500:
+            raise _SinServicio(f"HTTP {resp.status_code}")
+        if resp.status_code != 200:
+            return None
+        try:
+            return resp.json()
+        except ValueError:
+            return None
+
+    def _primera_respuesta(self, consultas, interpretar):
+        """
+        Lanza todas las variantes a la vez y devuelve el resultado útil de la
+        que va antes en `consultas`.
+
+        El orden manda, no quién llega antes: la referencia completa (el
+        inmueble) va por delante de la de 14 caracteres (la parcela entera), y
+        si la de la parcela contesta primero no puede ganar. Un resultado se
+        acepta en cuanto todas las variantes anteriores han terminado sin
+        datos, así que lo rápido solo espera a lo que tiene delante.
+
+        None si el Catastro contestó pero ninguna variante trae datos;
+        `_SinServicio` si no contestó a ninguna.
+        """
+        if not consultas:
+            return None
+        contesto = False
+        resultados = [_PENDIENTE] * len(consultas)
+        grupo = ThreadPoolExecutor(max_workers=min(self.hilos, len(consultas)))
+        try:
+            pendientes = {
+                grupo.submit(self._pedir, ruta, params): (i, candidata)
+                for i, (ruta, params, candidata) in enumerate(consultas)
+            }
+            while pendientes:
+                hechos, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+                for futuro in hechos:
+                    i, candidata = pendientes.pop(futuro)
+                    resultados[i] = None
+                    try:
+                        data = futuro.result()
+                    except _SinServicio:
+                        continue
+                    contesto = True
+                    if data is None:
+                        continue
+                    try:
+                        resultados[i] = interpretar(data, candidata)
+                    except (TypeError, ValueError):
+                        continue
+                for resultado in resultados:
+                    if resultado is _PENDIENTE:
+                        break
+                    if resultado is not None:
+                        return resultado
+        finally:
+            # Las que sigan en vuelo terminan solas; no se espera por ellas.
+            grupo.shutdown(wait=False, cancel_futures=True)
+        if not contesto:
+            raise _SinServicio("Ninguna consulta obtuvo respuesta")
+        return None
+
+    # --- Cortacircuitos ----------------------------------------------------------
+
+    def _circuito_abierto(self) -> bool:
+        try:
+            return bool(cache.get(_CLAVE_ABIERTO))
+        except Exception:
+            return False
+
+    def _anotar_fallo(self):
+        try:
+            fallos = int(cache.get(_CLAVE_FALLOS) or 0) + 1
+            if fallos >= self.umbral_fallos:
+                log.warning("El Catastro no responde: se dejan de hacer consultas %s s", self.segundos_corte)
+                cache.set(_CLAVE_ABIERTO, True, self.segundos_corte)
+                # Al reabrir basta un fallo más para volver a cortar.
+                cache.set(_CLAVE_FALLOS, self.umbral_fallos - 1, self.segundos_corte * 10)
+            else:
+                cache.set(_CLAVE_FALLOS, fallos, self.segundos_corte * 10)
+        except Exception:
+            log.debug("No se pudo anotar el fallo del Catastro", exc_info=True)
+
+    def _anotar_exito(self):
+        try:
+            cache.delete(_CLAVE_FALLOS)
+        except Exception:
+            log.debug("No se pudo anotar la respuesta del Catastro", exc_info=True)
@@ -0,0 +1,134 @@
+"""
+Envío de correos reutilizando la conexión SMTP.
+
+`send_mail()` y `EmailMessage.send()` abren una conexión nueva por mensaje, con
+su saludo y su negociación TLS, y la cierran al terminar. En un envío masivo a
+inversores o con muchas compras del sorteo seguidas, casi todo el tiempo se iba
+en eso y no en mandar el correo.
+
+Aquí cada hilo conserva una conexión abierta y la reutiliza:
+
+- dentro de `conexion_compartida()` durante todo el bloque, que al salir la
+  cierra (los envíos masivos van así);
+- fuera de él, mientras no pasen `EMAIL_CONEXION_SEGUNDOS` sin usarla, para que
+  no la corte el servidor por inactividad.
+
+Cada `EMAIL_LOTE` mensajes se abre una nueva, porque muchos servidores limitan
+los mensajes por conexión. Si el servidor la ha cerrado por su cuenta, se
+reconecta y se reintenta una vez.
+
+`enviar()` no lanza excepciones: devuelve si salió y, si no, el motivo, que
+queda también en el log. Así quien llama decide si el fallo importa en vez de
+que `fail_silently=True` lo esconda.
+"""
+
+import logging
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+log = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+@dataclass
+class ResultadoEnvio:
+    mensaje: object
+    enviado: bool
+    error: str = ""
+
+    def __bool__(self):
+        return self.enviado
+
+
+def _ajustes() -> tuple[float, int]:
+    segundos = float(getattr(settings, "EMAIL_CONEXION_SEGUNDOS", 30) or 0)
+    lote = int(getattr(settings, "EMAIL_LOTE", 50) or 0)
+    return segundos, lote
+
+
+def _cerrar():
+    conexion = getattr(_local, "conexion", None)
+    _local.conexion = None
+    if conexion is None:
+        return
+    try:
+        conexion.close()
+    except Exception:
+        log.debug("No se pudo cerrar la conexión de correo", exc_info=True)
+
+
+def _conexion():
+    """La conexión abierta de este hilo, o una nueva si no vale la que había."""
+    segundos, lote = _ajustes()
+    ahora = time.monotonic()
+    conexion = getattr(_local, "conexion", None)
+    if conexion is not None:
+        caducada = not getattr(_local, "en_bloque", 0) and ahora - _local.usada > segundos
+        if caducada or _local.backend != settings.EMAIL_BACKEND or (lote and _local.enviados >= lote):
+            _cerrar()
+            conexion = None
+    if conexion is None:
+        conexion = get_connection(fail_silently=False)
+        conexion.open()
+        _local.conexion = conexion
+        _local.backend = settings.EMAIL_BACKEND
+        _local.enviados = 0
+    _local.usada = ahora
+    return conexion
+
+
+def _reutilizable() -> bool:
+    segundos, _ = _ajustes()
+    return bool(getattr(_local, "en_bloque", 0)) or segundos > 0
+
+
+@contextmanager
+def conexion_compartida():
+    """Dentro del bloque todos los `enviar()` de este hilo van por la misma conexión."""
+    _local.en_bloque = getattr(_local, "en_bloque", 0) + 1
+    try:
+        yield
+    finally:
+        _local.en_bloque -= 1
+        if not _local.en_bloque:
+            _cerrar()
+
+
+def _mandar(mensaje) -> int:
+    if not _reutilizable():
+        return get_connection(fail_silently=False).send_messages([mensaje])
+    try:
+        enviados = _conexion().send_messages([mensaje])
+    except smtplib.SMTPServerDisconnected:
+        # El servidor cerró la conexión mientras esperaba: una nueva y otra vez.
+        _cerrar()
+        enviados = _conexion().send_messages([mensaje])
+    _local.enviados += 1
+    return enviados
+
+
+def enviar(mensaje) -> ResultadoEnvio:
+    """Manda un `EmailMessage` y cuenta cómo ha ido, sin lanzar."""
+    try:
+        enviados = _mandar(mensaje)
+    except Exception as exc:
+        # Una conexión que ha fallado no se reutiliza.
+        _cerrar()
+        log.warning("No se pudo enviar el correo «%s» a %s", mensaje.subject, ", ".join(mensaje.to), exc_info=True)
+        return ResultadoEnvio(mensaje, False, str(exc) or exc.__class__.__name__)
+    if not enviados:
+        return ResultadoEnvio(mensaje, False, "El servidor no aceptó el mensaje.")
+    return ResultadoEnvio(mensaje, True)
+
+
+def enviar_mensajes(mensajes) -> list[ResultadoEnvio]:
+    """Varios mensajes por la misma conexión, con el resultado de cada uno."""
+    with conexion_compartida():
+        return [enviar(mensaje) for mensaje in mensajes]
@@ -12,6 +12,8 @@ import logging
 from django.conf import settings
 from django.core.mail import EmailMessage
 
+from .correo import enviar
+
 log = logging.getLogger(__name__)
 
 
@@ -31,17 +33,17 @@ def enviar_codigo_contrato(participacion, email: str, codigo: str) -> bool:
         codigo,
         settings.PRESTATARIA["razon_social"],
     )
-    try:
+    resultado = enviar(
         EmailMessage(
             subject="Tu código para firmar el contrato",
             body=cuerpo,
             from_email=settings.DEFAULT_FROM_EMAIL,
             to=[email],
-        ).send(fail_silently=False)
-        return True
-    except Exception:
-        log.exception("No se pudo enviar el código de firma a %s", email)
-        return False
+        )
+    )
+    if not resultado:
+        log.error("No se pudo enviar el código de firma a %s: %s", email, resultado.error)
+    return resultado.enviado
 
 
 def enviar_contrato_firmado(participacion, email: str, pdf: bytes) -> bool:
@@ -59,19 +61,17 @@ def enviar_contrato_firmado(participacion, email: str, pdf: bytes) -> bool:
         "Consérvalo.\n\n"
         "{}\n"
     ).format(participacion.proyecto.nombre, settings.PRESTATARIA["razon_social"])
-    try:
-        mensaje = EmailMessage(
-            subject="Tu contrato firmado · {}".format(participacion.proyecto.nombre),
-            body=cuerpo,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[email],
-        )
-        mensaje.attach("contrato-firmado.pdf", pdf, "application/pdf")
-        mensaje.send(fail_silently=False)
-        return True
-    except Exception:
-        log.exception("No se pudo enviar el contrato firmado a %s", email)
-        return False
+    mensaje = EmailMessage(
+        subject="Tu contrato firmado · {}".format(participacion.proyecto.nombre),
+        body=cuerpo,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[email],
+    )
+    mensaje.attach("contrato-firmado.pdf", pdf, "application/pdf")
+    resultado = enviar(mensaje)
+    if not resultado:
+        log.error("No se pudo enviar el contrato firmado a %s: %s", email, resultado.error)
+    return resultado.enviado
 
 
 def enviar_invitacion_firma(participacion, email: str, url: str) -> bool:
@@ -94,14 +94,14 @@ def enviar_invitacion_firma(participacion, email: str, url: str) -> bool:
         url,
         settings.PRESTATARIA["razon_social"],
     )
-    try:
+    resultado = enviar(
         EmailMessage(
             subject="Tu contrato de {}".format(participacion.proyecto.nombre),
             body=cuerpo,
             from_email=settings.DEFAULT_FROM_EMAIL,
             to=[email],
-        ).send(fail_silently=False)
-        return True
-    except Exception:
-        log.exception("No se pudo enviar la invitación de firma a %s", email)
-        return False
+        )
+    )
+    if not resultado:
+        log.error("No se pudo enviar la invitación de firma a %s: %s", email, resultado.error)
+    return resultado.enviado
@@ -0,0 +1,353 @@
+"""
+Imágenes derivadas de los documentos de proyecto (miniaturas y vistas en PNG).
+
+La presentación de un proyecto pinta el plano y el dossier como imagen. Antes,
+en cada generación se rasterizaba la primera página del PDF (lanzando poppler o
+PyMuPDF) y el PNG se metía entero en el HTML como `data:` en base64: varios
+megas que WeasyPrint tenía que volver a decodificar cada vez.
+
+Aquí cada documento PDF se rasteriza una sola vez, la primera que se pide, y se
+guarda en el mismo almacenamiento que el original a los tamaños de
+`DERIVADOS_TAMANOS` (lado mayor en píxeles). Van en una carpeta por archivo
+original y su nombre lleva la huella del tamaño y la fecha de modificación del
+original: S3 sobrescribe un archivo subido con el mismo nombre, y con la clave
+sacada solo del nombre se seguía sirviendo la vista del anterior. Quien lo pinta
+recibe el nombre del derivado y lo sirve por URL.
+
+Si un derivado existe se pregunta al almacenamiento cada vez, sin memoria en
+el proceso: otro worker puede haberlo borrado con su documento.
+
+`png_de_pdf()` hace lo mismo para PDF que solo existen en memoria (la vista
+previa de la presentación), con una memoria por proceso indexada por la huella
+del contenido.
+
+`copia_impresion()` hace lo propio con las fotografías: las cámaras dan
+imágenes de 12 o 20 megapíxeles que WeasyPrint decodificaba y volvía a
+comprimir enteras para un hueco de media página. La copia se reduce a lo que
+cabe en la caja de destino (`DERIVADOS_CAJAS`, en milímetros) a
+`DERIVADOS_DPI_FOTOS` y se guarda en JPEG, que el PDF incrusta tal cual sin
+volver a comprimir.
+"""
+
+import hashlib
+import logging
+import mimetypes
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+log = logging.getLogger(__name__)
+
+DPI = 150
+TAMANOS = {"miniatura": 480, "vista": 1600}
+CARPETA = "derivados"
+
+DPI_FOTOS = 200
+CALIDAD_FOTOS = 82
+# Ancho y alto en milímetros del hueco donde se pinta cada foto
+# (`pdf_presentacion_proyecto.html` y `pdf_anexo_documento.html`).
+CAJAS = {
+    "portada": (140, 140),
+    "cabecera": (190, 65),
+    "detalle": (95, 60),
+    "pagina": (170, 257),
+}
+_FORMATOS_FOTO = {"JPEG": "jpg", "WEBP": "webp"}
+
+_PNG_MEMO_MAX = 16
+_png_memo: "OrderedDict[tuple[str, int], bytes]" = OrderedDict()
+_png_memo_lock = threading.Lock()
+
+
+def tamanos() -> dict[str, int]:
+    return dict(getattr(settings, "DERIVADOS_TAMANOS", None) or TAMANOS)
+
+
+def es_pdf(nombre: str) -> bool:
+    return (nombre or "").lower().endswith(".pdf")
+
+
+def es_imagen(nombre: str) -> bool:
+    mime, _ = mimetypes.guess_type(nombre or "")
+    return bool(mime and mime.startswith("image/"))
+
+
+def _carpeta(nombre: str) -> str:
+    clave = hashlib.sha256(nombre.encode("utf-8")).hexdigest()[:32]
+    return f"{CARPETA}/{clave[:2]}/{clave}"
+
+
+def version_archivo(archivo) -> str:
+    """Huella del contenido actual de `archivo`: tamaño y fecha de modificación."""
+    partes = [archivo.name or ""]
+    for leer in (archivo.storage.size, archivo.storage.get_modified_time):
+        try:
+            partes.append(str(leer(archivo.name)))
+        except Exception:
+            partes.append("")
+    return hashlib.sha256("\0".join(partes).encode("utf-8")).hexdigest()[:16]
+
+
+def ruta_derivado(nombre: str, variante: str, extension: str = "png", version: str = "") -> str:
+    """Nombre en el almacenamiento del derivado `variante` de la `version` del archivo `nombre`."""
+    return f"{_carpeta(nombre)}/{version or 'sin-version'}-{variante}.{extension}"
+
+
+def _ya_existe(storage, ruta: str) -> bool:
+    try:
+        return storage.exists(ruta)
+    except Exception:
+        log.debug("No se pudo comprobar el derivado %s", ruta, exc_info=True)
+        return False
+
+
+def _podar(storage, nombre: str, conservar: str = ""):
+    """Borra los derivados del archivo `nombre` salvo los de la versión `conservar`."""
+    carpeta = _carpeta(nombre)
+    try:
+        _subcarpetas, ficheros = storage.listdir(carpeta)
+    except Exception:
+        return
+    for fichero in ficheros:
+        if conservar and fichero.startswith(f"{conservar}-"):
+            continue
+        try:
+            storage.delete(f"{carpeta}/{fichero}")
+        except Exception:
+            log.debug("No se pudo borrar el derivado %s/%s", carpeta, fichero, exc_info=True)
+
+
+def _guardar(storage, ruta: str, contenido: bytes) -> bool:
+    try:
+        guardado = storage.save(ruta, ContentFile(contenido))
+    except Exception:
+        log.exception("No se pudo guardar el derivado %s", ruta)
+        return False
+    if guardado != ruta:
+        # Otro proceso lo guardó a la vez: vale el suyo, el nuestro sobra.
+        storage.delete(guardado)
+    return True
+
+
+def _poppler_path() -> str:
+    poppler_path = getattr(settings, "POPPLER_PATH", "") or os.environ.get("POPPLER_PATH", "")
+    if not poppler_path:
+        pdftoppm_path = shutil.which("pdftoppm")
+        if pdftoppm_path:
+            poppler_path = os.path.dirname(pdftoppm_path)
+    return poppler_path
+
+
+def rasterizar_pdf(pdf_bytes: bytes, dpi: int = DPI) -> bytes | None:
+    """Primera página de un PDF en PNG, con PyMuPDF o, si falla, con poppler."""
+    if not pdf_bytes:
+        return None
+    try:
+        import fitz  # PyMuPDF
+
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        if doc.page_count < 1:
+            return None
+        return doc.load_page(0).get_pixmap(dpi=dpi).tobytes("png")
+    except Exception:
+        log.debug("No se pudo convertir el PDF a PNG con PyMuPDF", exc_info=True)
+    try:
+        from pdf2image import convert_from_bytes
+
+        convert_kwargs = {"first_page": 1, "last_page": 1, "dpi": dpi}
+        poppler_path = _poppler_path()
+        if poppler_path:
+            convert_kwargs["poppler_path"] = poppler_path
+        images = convert_from_bytes(pdf_bytes, **convert_kwargs)
+        if not images:
+            return None
+        buf = BytesIO()
+        images[0].save(buf, format="PNG")
+        return buf.getvalue()
+    except Exception:
+        log.exception("Fallo al convertir PDF a PNG (PyMuPDF y pdf2image)")
+        return None
+
+
+def png_de_pdf(pdf_bytes: bytes, dpi: int = DPI) -> bytes | None:
+    """Como `rasterizar_pdf()`, pero sin repetir el trabajo para el mismo PDF."""
+    if not pdf_bytes:
+        return None
+    clave = (hashlib.sha256(pdf_bytes).hexdigest(), dpi)
+    with _png_memo_lock:
+        png = _png_memo.get(clave)
+        if png is not None:
+            _png_memo.move_to_end(clave)
+            return png
+    png = rasterizar_pdf(pdf_bytes, dpi)
+    if png:
+        with _png_memo_lock:
+            _png_memo[clave] = png
+            while len(_png_memo) > _PNG_MEMO_MAX:
+                _png_memo.popitem(last=False)
+    return png
+
+
+def _reducir(png: bytes, lado: int) -> bytes:
+    from PIL import Image
+
+    with Image.open(BytesIO(png)) as imagen:
+        if max(imagen.size) <= lado:
+            return png
+        imagen.thumbnail((lado, lado), Image.LANCZOS)
+        buf = BytesIO()
+        imagen.save(buf, format="PNG", optimize=True)
+        return buf.getvalue()
+
+
+def generar_derivados(archivo, variantes=None) -> dict[str, str]:
+    """
+    Rasteriza el PDF una vez y guarda cada variante que falte.
+
+    Devuelve {variante: nombre en el almacenamiento} de las que quedan
+    disponibles; vacío si el archivo no es un PDF o no se pudo rasterizar.
+    """
+    nombre = getattr(archivo, "name", "") or ""
+    if not es_pdf(nombre):
+        return {}
+    storage = archivo.storage
+    version = version_archivo(archivo)
+    medidas = tamanos()
+    variantes = [v for v in (variantes or medidas) if v in medidas]
+    hechos = {}
+    faltan = []
+    for variante in variantes:
+        ruta = ruta_derivado(nombre, variante, version=version)
+        if _ya_existe(storage, ruta):
+            hechos[variante] = ruta
+        else:
+            faltan.append(variante)
+    if not faltan:
+        return hechos
+
+    try:
+        with archivo.open("rb") as fh:
+            pdf_bytes = fh.read()
+    except Exception:
+        log.exception("No se pudo leer %s para sus derivados", nombre)
+        return hechos
+    png = rasterizar_pdf(pdf_bytes, int(getattr(settings, "DERIVADOS_DPI", DPI) or DPI))
+    if not png:
+        return hechos
+    _podar(storage, nombre, version)
+    for variante in faltan:
+        ruta = ruta_derivado(nombre, variante, version=version)
+        if _guardar(storage, ruta, _reducir(png, medidas[variante])):
+            hechos[variante] = ruta
+    return hechos
+
+
+def derivado(archivo, variante: str = "vista") -> str:
+    """Nombre en el almacenamiento de un derivado, generándolo si hace falta."""
+    # Lo caro es rasterizar: ya puestos, salen todas las variantes de una vez.
+    return generar_derivados(archivo).get(variante, "")
+
+
+# --- Fotografías ---------------------------------------------------------------
+
+
+def _ajustes_fotos() -> tuple[dict, int, int, str]:
+    cajas = dict(getattr(settings, "DERIVADOS_CAJAS", None) or CAJAS)
+    dpi = int(getattr(settings, "DERIVADOS_DPI_FOTOS", DPI_FOTOS) or DPI_FOTOS)
+    calidad = int(getattr(settings, "DERIVADOS_CALIDAD_FOTOS", CALIDAD_FOTOS) or CALIDAD_FOTOS)
+    formato = str(getattr(settings, "DERIVADOS_FORMATO_FOTOS", "JPEG") or "JPEG").upper()
+    if formato not in _FORMATOS_FOTO:
+        formato = "JPEG"
+    return cajas, dpi, calidad, formato
+
+
+def medida_caja(caja: str) -> tuple[int, int] | None:
+    """Píxeles que caben en la caja `caja` a la resolución de impresión."""
+    cajas, dpi, _calidad, _formato = _ajustes_fotos()
+    if caja not in cajas:
+        return None
+    ancho_mm, alto_mm = cajas[caja]
+    return round(ancho_mm / 25.4 * dpi), round(alto_mm / 25.4 * dpi)
+
+
+def _variante_foto(caja: str) -> tuple[str, str]:
+    _cajas, _dpi, calidad, formato = _ajustes_fotos()
+    ancho, alto = medida_caja(caja)
+    # La medida y la calidad van en el nombre: si cambian, es otra copia.
+    return f"{caja}-{ancho}x{alto}q{calidad}", _FORMATOS_FOTO[formato]
+
+
+def _copia(datos: bytes, ancho: int, alto: int) -> bytes | None:
+    """La foto reducida para cubrir `ancho` x `alto`, o None si ya es así de pequeña."""
+    from PIL import Image, ImageOps
+
+    _cajas, _dpi, calidad, formato = _ajustes_fotos()
+    with Image.open(BytesIO(datos)) as original:
+        imagen = ImageOps.exif_transpose(original)
+        # Las fotos van como fondo `cover`: el lado que menos sobra manda.
+        escala = max(ancho / imagen.width, alto / imagen.height)
+        if escala >= 1 and original.format == formato:
+            return None
+        if escala < 1:
+            imagen = imagen.resize(
+                (max(1, round(imagen.width * escala)), max(1, round(imagen.height * escala))),
+                Image.LANCZOS,
+            )
+        if imagen.mode in ("RGBA", "LA") or (imagen.mode == "P" and "transparency" in imagen.info):
+            fondo = Image.new("RGB", imagen.size, "white")
+            fondo.paste(imagen.convert("RGBA"), mask=imagen.convert("RGBA").getchannel("A"))
+            imagen = fondo
+        elif imagen.mode != "RGB":
+            imagen = imagen.convert("RGB")
+        buf = BytesIO()
+        opciones = {"quality": calidad}
+        if formato == "JPEG":
+            opciones.update(optimize=True, progressive=True)
+        imagen.save(buf, format=formato, **opciones)
+        return buf.getvalue()
+
+
+def copia_impresion(archivo, caja: str) -> str:
+    """
+    Nombre en el almacenamiento de la foto lista para la caja `caja`.
+
+    Si el original ya es pequeño y está en el formato de salida se devuelve su
+    propio nombre; cadena vacía si no es una imagen o no se pudo leer.
+    """
+    nombre = getattr(archivo, "name", "") or ""
+    if not es_imagen(nombre) or medida_caja(caja) is None:
+        return ""
+    storage = archivo.storage
+    version = version_archivo(archivo)
+    variante, extension = _variante_foto(caja)
+    ruta = ruta_derivado(nombre, variante, extension, version)
+    if _ya_existe(storage, ruta):
+        return ruta
+    # Marca vacía de que el original ya vale para esta caja, para no volver a abrirlo.
+    igual = ruta_derivado(nombre, variante, "original", version)
+    if _ya_existe(storage, igual):
+        return nombre
+    try:
+        with archivo.open("rb") as fh:
+            datos = fh.read()
+        copia = _copia(datos, *medida_caja(caja))
+    except Exception:
+        log.exception("No se pudo preparar la copia de impresión de %s", nombre)
+        return ""
+    _podar(storage, nombre, version)
+    if copia is None:
+        _guardar(storage, igual, b"")
+        return nombre
+    return ruta if _guardar(storage, ruta, copia) else nombre
+
+
+def borrar_derivados(archivo):
+    """Borra todos los derivados de `archivo`, de cualquier versión. No necesita el original."""
+    nombre = getattr(archivo, "name", "") or ""
+    if nombre:
+        _podar(archivo.storage, nombre)
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db.models import Count, Q
 
 
@@ -15,6 +15,9 @@ class _Row:
     ingresos_estimados: int
 
 
+AUDITORIA = "integridad_datos"
+
+
 class Command(BaseCommand):
     help = "Audita integridad de datos (tipado de ingresos/estados) para evitar PDFs/KPIs incoherentes."
     requires_system_checks = []
@@ -38,15 +41,25 @@ class Command(BaseCommand):
             action="store_true",
             help="Aplicar cambios en BD. Si no, solo imprime qué cambiaría (dry-run).",
         )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Reutilizar el resultado anterior de los proyectos cuyos datos no han cambiado.",
+        )
 
     def handle(self, *args, **opts):
         from core.models import IngresoProyecto, Proyecto  # local import
+        from core.services.audit_state import cached_rows, project_fingerprints, store_rows
 
         project_id = opts.get("project_id")
         limit = int(opts.get("limit") or 0)
         only_warnings = bool(opts.get("only_warnings"))
         fix = bool(opts.get("fix"))
         apply = bool(opts.get("apply"))
+        incremental = bool(opts.get("incremental"))
+        if incremental and fix:
+            # Un arreglo tiene que mirar todos los proyectos, no solo los que cambiaron.
+            raise CommandError("--incremental no se puede combinar con --fix.")
 
         qs = Proyecto.objects.all().order_by("id")
         if project_id:
@@ -63,7 +76,25 @@ class Command(BaseCommand):
         fixed = 0
         would_fix = 0
 
-        for p in qs.iterator():
+        proyectos = list(qs)
+        huellas = project_fingerprints([p.id for p in proyectos], scope={"auditoria": AUDITORIA}) if incremental else {}
+        guardadas = cached_rows(AUDITORIA, huellas) if incremental else {}
+
+        for p in proyectos:
+            if p.id in guardadas:
+                row = _Row(**guardadas[p.id][0])
+                is_warning = (
+                    row.estado in estados_cierre
+                    and row.ingresos_confirmados > 0
+                    and row.ingresos_confirmados_no_venta > 0
+                )
+                if only_warnings and not is_warning:
+                    continue
+                if is_warning:
+                    warnings += 1
+                rows.append(row)
+                continue
+
             estado = (getattr(p, "estado", "") or "").strip().lower()
             ingresos_qs = IngresoProyecto.objects.filter(proyecto=p)
             agg = ingresos_qs.aggregate(
@@ -110,20 +141,22 @@ class Command(BaseCommand):
                 except Exception:
                     pass
 
+            row = _Row(
+                proyecto_id=int(p.id),
+                estado=estado,
+                ingresos_confirmados=confirmados,
+                ingresos_confirmados_no_venta=confirmados_no_venta,
+                ingresos_estimados=estimados,
+            )
+            if incremental:
+                store_rows(AUDITORIA, p.id, huellas[p.id], [asdict(row)])
+
             if only_warnings and not is_warning:
                 continue
             if is_warning:
                 warnings += 1
 
-            rows.append(
-                _Row(
-                    proyecto_id=int(p.id),
-                    estado=estado,
-                    ingresos_confirmados=confirmados,
-                    ingresos_confirmados_no_venta=confirmados_no_venta,
-                    ingresos_estimados=estimados,
-                )
-            )
+            rows.append(row)
 
         self.stdout.write(
             "proyecto_id;estado;ingresos_confirmados;ingresos_confirmados_no_venta;ingresos_estimados"
@@ -133,6 +166,8 @@ class Command(BaseCommand):
                 f"{r.proyecto_id};{r.estado};{r.ingresos_confirmados};{r.ingresos_confirmados_no_venta};{r.ingresos_estimados}"
             )
         self.stdout.write(self.style.WARNING(f"Warnings: {warnings}"))
+        if incremental:
+            self.stdout.write(f"Sin cambios desde la auditoría anterior: {len(guardadas)}/{len(proyectos)}")
         if fix:
             mode = "APPLY" if apply else "DRY-RUN"
             self.stdout.write(self.style.WARNING(f"{mode}: would_fix={would_fix} fixed={fixed}"))
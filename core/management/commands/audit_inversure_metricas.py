@@ -36,6 +36,17 @@ class Command(BaseCommand):
             choices=("csv", "markdown"),
             help="Formato de salida a generar. Puede repetirse.",
         )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            default=1,
+            help="Procesos que auditan proyectos a la vez (por defecto 1, en este mismo proceso).",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Reutilizar el resultado anterior de los proyectos cuyos datos no han cambiado.",
+        )
         parser.add_argument(
             "--fail-on-severity",
             choices=SEVERITY_LEVELS,
@@ -49,6 +60,8 @@ class Command(BaseCommand):
         report = service.audit(
             project_id=options.get("project_id"),
             limit=options.get("limit"),
+            jobs=max(1, int(options.get("jobs") or 1)),
+            incremental=bool(options.get("incremental")),
         )
         self.last_report = report  # útil para tests sin depender de stdout
 
@@ -76,6 +89,8 @@ class Command(BaseCommand):
             f"Auditoría Inversure completada: {project_count} proyectos, "
             f"{row_count} filas, severidad máxima {max_severity}."
         )
+        if options.get("incremental"):
+            message += f" Sin cambios desde la auditoría anterior: {report.get('reused_project_count', 0)}/{project_count}."
         if written_files:
             message += " Archivos: " + ", ".join(str(path) for path in written_files)
         self.stdout.write(self.style.SUCCESS(message))
@@ -1,10 +1,10 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from decimal import Decimal
 from typing import Any
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 from django.db.models import Sum
 
@@ -22,6 +22,19 @@ class _AuditRow:
     pct_participacion_max_diff: float | None
 
 
+def _roi_bad(row: _AuditRow, threshold: float) -> bool:
+    if row.roi_snapshot is None:
+        return abs(row.roi_mem) >= threshold  # si no hay snapshot, discrepancia si hay ROI no-trivial
+    return abs(row.roi_mem - row.roi_snapshot) >= threshold
+
+
+def _pct_bad(row: _AuditRow) -> bool:
+    return row.pct_participacion_max_diff is not None and row.pct_participacion_max_diff >= 0.1
+
+
+AUDITORIA = "kpis"
+
+
 def _safe_float(x: Any) -> float | None:
     try:
         if x in (None, "", "—"):
@@ -207,9 +220,15 @@ class Command(BaseCommand):
             action="store_true",
             help="Imprimir solo filas con discrepancias (ROI o % participación).",
         )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Reutilizar el resultado anterior de los proyectos cuyos datos no han cambiado.",
+        )
 
     def handle(self, *args, **opts):
         from core.models import Participacion, Proyecto  # local import
+        from core.services.audit_state import cached_rows, project_fingerprints, store_rows
         from core.views import _get_snapshot_comunicacion, _resultado_desde_memoria, _capital_objetivo_desde_memoria  # type: ignore
 
         project_id = opts["project_id"]
@@ -220,6 +239,10 @@ class Command(BaseCommand):
         fix_snapshot_roi = bool(opts["fix_snapshot_roi"])
         backup_snapshot = not bool(opts["no_backup_snapshot"])
         only_mismatches = bool(opts["only_mismatches"])
+        incremental = bool(opts.get("incremental"))
+        if incremental and (fix_participacion or fix_proyecto_roi or fix_snapshot_roi):
+            # Los --fix-* tienen que recorrer todos los proyectos, no solo los que cambiaron.
+            raise CommandError("--incremental no se puede combinar con --fix-*.")
 
         qs = Proyecto.objects.all().order_by("id")
         if project_id:
@@ -228,10 +251,16 @@ class Command(BaseCommand):
             qs = qs[:limit]
 
         rows: list[_AuditRow] = []
-        bad_roi = 0
-        bad_pct = 0
 
-        for proyecto in qs:
+        proyectos = list(qs)
+        huellas = project_fingerprints([p.id for p in proyectos], scope={"auditoria": AUDITORIA}) if incremental else {}
+        guardadas = cached_rows(AUDITORIA, huellas) if incremental else {}
+
+        for proyecto in proyectos:
+            if proyecto.id in guardadas:
+                rows.append(_AuditRow(**guardadas[proyecto.id][0]))
+                continue
+
             snap = _get_snapshot_comunicacion(proyecto)
             resultado = _resultado_desde_memoria(proyecto, snap if isinstance(snap, dict) else {})
             roi_mem = float(resultado.get("roi") or 0.0)
@@ -293,18 +322,19 @@ class Command(BaseCommand):
                 except Exception:
                     pass
 
-            roi_bad = False
-            if roi_snapshot is None:
-                roi_bad = abs(roi_mem) >= threshold  # si no hay snapshot, discrepancia si hay ROI no-trivial
-            else:
-                roi_bad = abs(roi_mem - roi_snapshot) >= threshold
-            if roi_bad:
-                bad_roi += 1
-            pct_bad = pct_max_diff is not None and pct_max_diff >= 0.1
-            if pct_bad:
-                bad_pct += 1
-
-            if fix_snapshot_roi and (roi_bad or roi_snapshot is None):
+            row = _AuditRow(
+                proyecto_id=proyecto.id,
+                proyecto_nombre=(proyecto.nombre or "").strip() or f"Proyecto {proyecto.id}",
+                estado=(proyecto.estado or "").strip(),
+                roi_mem=roi_mem,
+                roi_snapshot=roi_snapshot,
+                roi_model=roi_model,
+                total_invertido=total_invertido,
+                n_participaciones=len(parts),
+                pct_participacion_max_diff=pct_max_diff,
+            )
+
+            if fix_snapshot_roi and (_roi_bad(row, threshold) or roi_snapshot is None):
                 try:
                     _maybe_fix_snapshot_roi(
                         proyecto=proyecto,
@@ -316,32 +346,19 @@ class Command(BaseCommand):
                 except Exception:
                     pass
 
-            rows.append(
-                _AuditRow(
-                    proyecto_id=proyecto.id,
-                    proyecto_nombre=(proyecto.nombre or "").strip() or f"Proyecto {proyecto.id}",
-                    estado=(proyecto.estado or "").strip(),
-                    roi_mem=roi_mem,
-                    roi_snapshot=roi_snapshot,
-                    roi_model=roi_model,
-                    total_invertido=total_invertido,
-                    n_participaciones=len(parts),
-                    pct_participacion_max_diff=pct_max_diff,
-                )
-            )
+            if incremental:
+                store_rows(AUDITORIA, proyecto.id, huellas[proyecto.id], [asdict(row)])
+            rows.append(row)
+
+        # El umbral se aplica aquí y no al calcular: así una fila guardada vale para cualquier --threshold.
+        bad_roi = sum(1 for r in rows if _roi_bad(r, threshold))
+        bad_pct = sum(1 for r in rows if _pct_bad(r))
 
         self.stdout.write(
             "proyecto_id;proyecto;estado;roi_mem;roi_snapshot;roi_model;total_invertido;n_parts;pct_participacion_max_diff"
         )
         for r in rows:
-            roi_bad_row = (
-                (r.roi_snapshot is None and abs(r.roi_mem) >= threshold)
-                or (r.roi_snapshot is not None and abs(r.roi_mem - r.roi_snapshot) >= threshold)
-            )
-            pct_bad_row = (
-                r.pct_participacion_max_diff is not None and r.pct_participacion_max_diff >= 0.1
-            )
-            if only_mismatches and not (roi_bad_row or pct_bad_row):
+            if only_mismatches and not (_roi_bad(r, threshold) or _pct_bad(r)):
                 continue
             self.stdout.write(
                 f"{r.proyecto_id};{r.proyecto_nombre};{r.estado};"
@@ -354,3 +371,5 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.WARNING(f"Discrepancias ROI >= {threshold:.2f}pp: {bad_roi}"))
         self.stdout.write(self.style.WARNING(f"Discrepancias % participación >= 0.10pp: {bad_pct}"))
+        if incremental:
+            self.stdout.write(f"Sin cambios desde la auditoría anterior: {len(guardadas)}/{len(proyectos)}")
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from typing import Any
 
 from django.core.management.base import BaseCommand
@@ -27,6 +27,9 @@ def _safe_float(x: Any, default: float = 0.0) -> float:
         return default
 
 
+AUDITORIA = "logica_economica"
+
+
 class Command(BaseCommand):
     help = "Audita coherencia de cálculos económicos (sin imprimir PII)."
     requires_system_checks = []
@@ -46,52 +49,68 @@ class Command(BaseCommand):
             action="store_true",
             help="Mostrar solo filas con discrepancias (|diff| > epsilon).",
         )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Reutilizar el resultado anterior de los proyectos cuyos datos no han cambiado.",
+        )
 
     def handle(self, *args, **opts):
         from core.models import Proyecto  # local import
+        from core.services.audit_state import cached_rows, project_fingerprints, store_rows
         from core.views import _get_snapshot_comunicacion, _resultado_desde_memoria  # type: ignore
 
         project_id = opts.get("project_id")
         limit = int(opts.get("limit") or 0)
         epsilon = float(opts.get("epsilon") or 0.0)
         only_mismatches = bool(opts.get("only_mismatches"))
+        incremental = bool(opts.get("incremental"))
 
         qs = Proyecto.objects.all().order_by("id")
         if project_id:
             qs = qs.filter(id=project_id)
         if limit > 0:
             qs = qs[:limit]
+        proyectos = list(qs)
+
+        huellas = project_fingerprints([p.id for p in proyectos], scope={"auditoria": AUDITORIA}) if incremental else {}
+        guardadas = cached_rows(AUDITORIA, huellas) if incremental else {}
 
         rows: list[_Row] = []
         bad = 0
 
-        for proyecto in qs:
-            snap = _get_snapshot_comunicacion(proyecto)
-            res = _resultado_desde_memoria(proyecto, snap if isinstance(snap, dict) else {})
-
-            valor_adq = _safe_float(res.get("valor_adquisicion"), 0.0)
-            valor_trans = _safe_float(res.get("valor_transmision"), 0.0)
-            beneficio = _safe_float(res.get("beneficio_neto"), 0.0)
-            roi = _safe_float(res.get("roi"), 0.0)
-            base_memoria_real = bool(res.get("base_memoria_real"))
-
-            beneficio_calc = (valor_trans - valor_adq) if (valor_adq or valor_trans) else 0.0
-            diff = beneficio - beneficio_calc
-
-            is_bad = abs(diff) > epsilon
+        for proyecto in proyectos:
+            if proyecto.id in guardadas:
+                row = _Row(**guardadas[proyecto.id][0])
+            else:
+                snap = _get_snapshot_comunicacion(proyecto)
+                res = _resultado_desde_memoria(proyecto, snap if isinstance(snap, dict) else {})
+
+                valor_adq = _safe_float(res.get("valor_adquisicion"), 0.0)
+                valor_trans = _safe_float(res.get("valor_transmision"), 0.0)
+                beneficio = _safe_float(res.get("beneficio_neto"), 0.0)
+                roi = _safe_float(res.get("roi"), 0.0)
+                base_memoria_real = bool(res.get("base_memoria_real"))
+
+                beneficio_calc = (valor_trans - valor_adq) if (valor_adq or valor_trans) else 0.0
+                diff = beneficio - beneficio_calc
+
+                row = _Row(
+                    proyecto_id=int(proyecto.id),
+                    beneficio=beneficio,
+                    beneficio_calc=beneficio_calc,
+                    diff=diff,
+                    roi=roi,
+                    valor_adquisicion=valor_adq,
+                    valor_transmision=valor_trans,
+                    base_memoria_real=base_memoria_real,
+                )
+                if incremental:
+                    store_rows(AUDITORIA, proyecto.id, huellas[proyecto.id], [asdict(row)])
+
+            is_bad = abs(row.diff) > epsilon
             if is_bad:
                 bad += 1
-
-            row = _Row(
-                proyecto_id=int(proyecto.id),
-                beneficio=beneficio,
-                beneficio_calc=beneficio_calc,
-                diff=diff,
-                roi=roi,
-                valor_adquisicion=valor_adq,
-                valor_transmision=valor_trans,
-                base_memoria_real=base_memoria_real,
-            )
             if only_mismatches and not is_bad:
                 continue
             rows.append(row)
@@ -112,3 +131,5 @@ class Command(BaseCommand):
             )
 
         self.stdout.write(self.style.WARNING(f"Discrepancias |diff| > {epsilon:.2f}€: {bad}"))
+        if incremental:
+            self.stdout.write(f"Sin cambios desde la auditoría anterior: {len(guardadas)}/{len(proyectos)}")
@@ -0,0 +1,93 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from core.services import communication_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Manda los envíos masivos de comunicaciones a inversores que dejan encargados "
+        "las vistas (cartas en PDF, anexos y correo), con reintentos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Procesa lo que haya pendiente y termina, en vez de quedarse esperando.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=5.0,
+            help="Segundos de espera cuando no hay nada pendiente (por defecto 5).",
+        )
+        parser.add_argument(
+            "--max-intentos",
+            type=int,
+            default=communication_jobs.MAX_ATTEMPTS,
+            help="Intentos por destinatario antes de darlo por fallido.",
+        )
+        parser.add_argument(
+            "--reserva",
+            type=int,
+            default=communication_jobs.LEASE_SECONDS,
+            help="Segundos que un proceso se queda un destinatario antes de que otro pueda retomarlo.",
+        )
+        parser.add_argument(
+            "--espera-reintento",
+            type=int,
+            default=communication_jobs.RETRY_DELAY_SECONDS,
+            help="Segundos hasta el siguiente intento, multiplicados por los intentos ya hechos.",
+        )
+        parser.add_argument(
+            "--hilos",
+            type=int,
+            default=1,
+            help=(
+                "Destinatarios que se preparan a la vez. Tiene sentido con PDF_PROCESOS > 0, "
+                "para que las cartas se maqueten en paralelo en el grupo de procesos."
+            ),
+        )
+
+    def _pasada(self, options, max_intentos, en_hilo=False):
+        try:
+            return communication_jobs.process_pending(
+                lease_seconds=options["reserva"],
+                max_attempts=max_intentos,
+                retry_delay=options["espera_reintento"],
+            )
+        finally:
+            if en_hilo:
+                connection.close()
+
+    def handle(self, *args, **options):
+        max_intentos = max(1, options["max_intentos"])
+        hilos = max(1, options["hilos"])
+        try:
+            while True:
+                close_old_connections()
+                if hilos == 1:
+                    resumen = self._pasada(options, max_intentos)
+                else:
+                    # Cada hilo reserva sus destinatarios con la misma consulta
+                    # condicional que usarían dos procesos, así que no se pisan.
+                    with ThreadPoolExecutor(max_workers=hilos) as hilos_pool:
+                        parciales = list(
+                            hilos_pool.map(lambda _i: self._pasada(options, max_intentos, en_hilo=True), range(hilos))
+                        )
+                    resumen = {clave: sum(p[clave] for p in parciales) for clave in parciales[0]}
+                if resumen["procesados"]:
+                    self.stdout.write(
+                        "Procesados={procesados} enviados={enviado} omitidos={omitido} "
+                        "errores={error} reintentos={pendiente}".format(**resumen)
+                    )
+                if options["once"]:
+                    break
+                if not resumen["procesados"]:
+                    time.sleep(options["sleep"])
+        except KeyboardInterrupt:
+            self.stdout.write("Detenido.")
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Proyecto
+from core.services.project_metrics import refresh_project_metrics
+
+
+class Command(BaseCommand):
+    help = "Recalcula y guarda las métricas materializadas (ProyectoMetricas) de los proyectos."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ids",
+            nargs="*",
+            type=int,
+            default=None,
+            help="IDs de proyecto a recalcular (si se omite, recalcula todos).",
+        )
+
+    def handle(self, *args, **options):
+        ids = options.get("ids") or None
+
+        qs = Proyecto.objects.all().order_by("id")
+        if ids:
+            qs = qs.filter(id__in=ids)
+
+        total = 0
+        errores = 0
+        for proyecto_id in qs.values_list("id", flat=True).iterator():
+            total += 1
+            try:
+                refresh_project_metrics(proyecto_id)
+            except Exception as e:
+                errores += 1
+                self.stderr.write(f"[{proyecto_id}] error: {e}")
+
+        self.stdout.write(f"OK: proyectos={total} errores={errores}")
@@ -1,26 +1,40 @@
 from __future__ import annotations
 
 import base64
+import hashlib
+import json
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
+from functools import lru_cache
+from itertools import repeat
 
 from django.conf import settings
 from django.contrib.staticfiles import finders
 from django.core.files.base import ContentFile
 from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
 from django.http import QueryDict
 from django.templatetags.static import static
 from django.utils import timezone
 from django.utils.text import slugify
 
+# Plantillas que entran en el dossier: si cambia cualquiera, cambia la huella
+# de todos los proyectos y se regeneran.
+_PLANTILLAS = ("core/pdf_presentacion_proyecto.html", "core/pdf_anexo_documento.html")
+
 
 @dataclass
 class _Result:
     proyecto_id: int
     created: bool
     error: str | None = None
+    skipped: bool = False
+    unchanged: bool = False
 
 
+@lru_cache(maxsize=None)
 def _static_data_uri(static_path: str) -> str:
     try:
         abs_path = finders.find(static_path)
@@ -49,6 +63,334 @@ class _FakeRequest:
         return f"{self._base_url}{loc}" if self._base_url else loc
 
 
+@lru_cache(maxsize=None)
+def _version_plantillas() -> str:
+    from django.template.loader import get_template
+
+    from core.pdf import VERSION_RENDER
+
+    h = hashlib.sha256(str(VERSION_RENDER).encode("utf-8"))
+    for nombre in _PLANTILLAS:
+        h.update(get_template(nombre).template.source.encode("utf-8"))
+    return h.hexdigest()
+
+
+def _huella_entradas(proyecto, opciones: dict) -> str:
+    """
+    Huella de todo lo que acaba en el dossier de `proyecto`: datos del
+    proyecto, resultado económico, documentos elegibles, plantillas y estilo.
+    """
+    from core.models import DocumentoProyecto
+    from core.views import _get_snapshot_comunicacion, _resultado_desde_memoria  # type: ignore
+
+    snapshot = _get_snapshot_comunicacion(proyecto)
+    extra = proyecto.extra if isinstance(proyecto.extra, dict) else {}
+    documentos = list(
+        DocumentoProyecto.objects.filter(proyecto=proyecto)
+        .exclude(categoria="presentacion")
+        .order_by("id")
+        .values_list("id", "archivo", "categoria", "titulo", "es_principal", "usar_pdf", "usar_dossier")
+    )
+    entradas = {
+        "plantillas": _version_plantillas(),
+        "estilo": opciones["estilo"],
+        "base_url": opciones["base_url"],
+        "anio": timezone.now().year,
+        "nombre": proyecto.nombre,
+        "difusion": extra.get("difusion"),
+        "snapshot": snapshot,
+        "resultado": _resultado_desde_memoria(proyecto, snapshot if isinstance(snapshot, dict) else {}),
+        "documentos": documentos,
+    }
+    datos = json.dumps(entradas, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(datos.encode("utf-8")).hexdigest()
+
+
+def _generar_pdf(proyecto, estilo_default: str, base_url: str):
+    """PDF del dossier con los datos actuales: (pdf_bytes, estilo, slug, titulo)."""
+    from core.models import DocumentoProyecto  # local import
+    from core.views import (  # type: ignore
+        SafeAccessDict,
+        _build_presentacion_context,
+        _build_presentacion_pdf,
+        _catastro_wms_url_from_refcat,
+        _documento_url,
+        _get_snapshot_comunicacion,
+        _logo_data_uri,
+        _merge_pdf_with_documentos,
+        _resultado_desde_memoria,
+        _safe_float,
+    )
+
+    hero_data_uri = _static_data_uri("landing/assets/hero_investor.jpg")
+
+    # Si existe payload "difusion" guardado, regenerar usando exactamente la misma selección/formato/anexos.
+    extra = proyecto.extra if isinstance(proyecto.extra, dict) else {}
+    payload = extra.get("difusion") if isinstance(extra.get("difusion"), dict) else None
+    pdf_bytes = None
+    anexos_docs = []
+    estilo = estilo_default
+    slug = None
+    titulo = None
+
+    if payload:
+        post = QueryDict(mutable=True)
+        post["difusion.estilo"] = str(payload.get("estilo") or estilo_default)
+        post["difusion.titulo"] = str(payload.get("titulo") or proyecto.nombre or "Proyecto")
+        post["difusion.descripcion"] = str(payload.get("descripcion") or "")
+        post["difusion.ubicacion"] = str(payload.get("ubicacion") or "")
+        if payload.get("rentabilidad") not in (None, ""):
+            post["difusion.rentabilidad"] = str(payload.get("rentabilidad"))
+        if payload.get("plazo_meses") not in (None, ""):
+            post["difusion.plazo_meses"] = str(payload.get("plazo_meses"))
+        if payload.get("acceso_minimo") not in (None, ""):
+            post["difusion.acceso_minimo"] = str(payload.get("acceso_minimo"))
+        if payload.get("anio") not in (None, ""):
+            post["difusion.anio"] = str(payload.get("anio"))
+        if payload.get("foto_id") not in (None, ""):
+            post["difusion.foto_id"] = str(payload.get("foto_id"))
+        if payload.get("mapa_id") not in (None, ""):
+            post["difusion.mapa_id"] = str(payload.get("mapa_id"))
+        if payload.get("dossier_id") not in (None, ""):
+            post["difusion.dossier_id"] = str(payload.get("dossier_id"))
+
+        formatos = payload.get("formatos") if isinstance(payload.get("formatos"), dict) else {}
+        post["difusion.formatos.pdf"] = "on" if formatos.get("pdf", True) else ""
+        post["gen_pdf"] = "on"
+        if formatos.get("feed"):
+            post["difusion.formatos.feed"] = "on"
+        if formatos.get("story"):
+            post["difusion.formatos.story"] = "on"
+
+        anexos = payload.get("anexos") if isinstance(payload.get("anexos"), dict) else {}
+        for doc_id, enabled in anexos.items():
+            if enabled:
+                post[f"difusion.anexos.{doc_id}"] = "on"
+
+        request = _FakeRequest(post, base_url=base_url)
+        ctx_payload = _build_presentacion_context(request, proyecto)
+        pdf_context = dict(ctx_payload["context"])
+        pdf_context["formato"] = "pdf"
+        if hero_data_uri:
+            for k in ("foto_url", "descripcion_foto_url"):
+                v = str(pdf_context.get(k) or "")
+                if v.endswith(static("landing/assets/hero_investor.jpg")):
+                    pdf_context[k] = hero_data_uri
+
+        pdf_bytes = _build_presentacion_pdf(request, pdf_context)
+        anexos_docs = list(ctx_payload.get("anexos_docs") or [])
+        if pdf_bytes:
+            pdf_bytes = _merge_pdf_with_documentos(pdf_bytes, anexos_docs, request=request) or pdf_bytes
+        estilo = str(ctx_payload.get("estilo") or estilo_default)
+        slug = str(ctx_payload.get("slug") or "") or None
+        titulo = str(ctx_payload.get("titulo") or "") or None
+
+    if not pdf_bytes:
+        # Fallback genérico (sin payload guardado).
+        snapshot = _get_snapshot_comunicacion(proyecto)
+        inmueble_raw = snapshot.get("inmueble") if isinstance(snapshot.get("inmueble"), dict) else {}
+        inmueble = SafeAccessDict(inmueble_raw if isinstance(inmueble_raw, dict) else {})
+        inmueble["dormitorios"] = (
+            inmueble.get("dormitorios")
+            or inmueble.get("habitaciones")
+            or inmueble.get("num_dormitorios")
+        )
+        inmueble["banos"] = (
+            inmueble.get("banos")
+            or inmueble.get("baños")
+            or inmueble.get("num_banos")
+            or inmueble.get("num_baños")
+        )
+
+        resultado = _resultado_desde_memoria(proyecto, snapshot if isinstance(snapshot, dict) else {})
+        titulo = (getattr(proyecto, "nombre", "") or "").strip() or f"Proyecto {proyecto.id}"
+        slug = slugify(titulo) or f"proyecto_{proyecto.id}"
+
+        # Foto: preferir principal / primera fotografía.
+        foto_doc = (
+            DocumentoProyecto.objects.filter(
+                proyecto=proyecto,
+                categoria="fotografias",
+                usar_pdf=True,
+            )
+            .order_by("-creado", "-id")
+            .first()
+        )
+        if not foto_doc:
+            foto_doc = (
+                DocumentoProyecto.objects.filter(
+                    proyecto=proyecto,
+                    categoria="fotografias",
+                    es_principal=True,
+                )
+                .order_by("-creado", "-id")
+                .first()
+            )
+        if not foto_doc:
+            foto_doc = (
+                DocumentoProyecto.objects.filter(
+                    proyecto=proyecto,
+                    categoria="fotografias",
+                )
+                .order_by("-es_principal", "-creado", "-id")
+                .first()
+            )
+        foto_url = _documento_url(None, foto_doc) if foto_doc else ""
+        if not foto_url and hero_data_uri:
+            foto_url = hero_data_uri
+
+        anexos_docs = list(
+            DocumentoProyecto.objects.filter(
+                proyecto=proyecto,
+                usar_dossier=True,
+            )
+            .exclude(categoria="presentacion")
+            .order_by("-creado", "-id")
+        )
+
+        ref_catastral = (
+            inmueble.get("ref_catastral")
+            or inmueble.get("referencia_catastral")
+            or getattr(proyecto, "ref_catastral", None)
+            or getattr(proyecto, "referencia_catastral", None)
+            or ""
+        )
+        mapa_url = _catastro_wms_url_from_refcat(str(ref_catastral or "")) if ref_catastral else ""
+
+        roi_val = _safe_float(resultado.get("roi"), 0.0)
+        if roi_val >= 15:
+            semaforo_estado = "verde"
+            semaforo_label = "Operación sólida"
+        elif roi_val >= 10:
+            semaforo_estado = "amarillo"
+            semaforo_label = "Operación viable"
+        else:
+            semaforo_estado = "rojo"
+            semaforo_label = "Revisar operación"
+        roi_bar = max(0.0, min(roi_val, 30.0)) / 30.0 * 100.0
+
+        context = {
+            "proyecto": proyecto,
+            "titulo": titulo,
+            "descripcion": "",
+            "ubicacion": "",
+            "rentabilidad": resultado.get("roi"),
+            "plazo_meses": None,
+            "acceso_minimo": None,
+            "anio": timezone.now().year,
+            "estilo": estilo,
+            "formato": "pdf",
+            "foto_url": foto_url,
+            "descripcion_foto_url": foto_url,
+            "logo_data_uri": _logo_data_uri("core/logo_inversure_blanco.png"),
+            "inmueble": inmueble,
+            "resultado": resultado,
+            "mapa_url": mapa_url,
+            "dossier_url": mapa_url,
+            "fotos_urls": [foto_url] if foto_url else [],
+            "semaforo_estado": semaforo_estado,
+            "semaforo_label": semaforo_label,
+            "roi_bar": roi_bar,
+        }
+
+        pdf_bytes = _build_presentacion_pdf(None, context)
+        if pdf_bytes:
+            pdf_bytes = _merge_pdf_with_documentos(pdf_bytes, anexos_docs, request=None) or pdf_bytes
+
+    return pdf_bytes, estilo, slug, titulo
+
+
+def _regenerar_proyecto(proyecto_id: int, opciones: dict) -> _Result:
+    from core.models import DocumentoProyecto, Proyecto  # local import
+
+    try:
+        proyecto = Proyecto.objects.get(pk=proyecto_id)
+        if opciones["only_if_exists"]:
+            has_dossier = DocumentoProyecto.objects.filter(
+                proyecto=proyecto,
+                categoria="presentacion",
+                archivo__iendswith=".pdf",
+            ).exists()
+            if not has_dossier:
+                return _Result(proyecto_id=proyecto.id, created=False, skipped=True)
+
+        huella = _huella_entradas(proyecto, opciones)
+        if opciones["incremental"]:
+            # Solo cuenta el dossier vigente: si los datos vuelven a como
+            # estaban hace dos versiones, uno viejo tendría la misma huella
+            # aunque el actual se hiciera con otros datos.
+            vigente = (
+                DocumentoProyecto.objects.filter(proyecto=proyecto, categoria="presentacion")
+                .exclude(titulo__startswith="OBSOLETO ·")
+                .order_by("-creado", "-id")
+                .first()
+            )
+            if vigente is not None and vigente.huella_entradas == huella:
+                return _Result(proyecto_id=proyecto.id, created=False, unchanged=True)
+
+        pdf_bytes, estilo, slug, titulo = _generar_pdf(proyecto, opciones["estilo"], opciones["base_url"])
+
+        if not pdf_bytes:
+            return _Result(proyecto_id=proyecto.id, created=False, error="No se pudo generar PDF")
+
+        if not opciones["apply"]:
+            return _Result(proyecto_id=proyecto.id, created=False)
+
+        if opciones["deprecate_old"]:
+            try:
+                prev_qs = DocumentoProyecto.objects.filter(
+                    proyecto=proyecto,
+                    categoria="presentacion",
+                    archivo__iendswith=".pdf",
+                ).order_by("-creado", "-id")
+                prev = list(prev_qs)
+                to_update = []
+                for doc in prev:
+                    t = (doc.titulo or "").strip()
+                    if not t:
+                        continue
+                    if t.startswith("OBSOLETO ·"):
+                        continue
+                    doc.titulo = f"OBSOLETO · {t}"
+                    to_update.append(doc)
+                if to_update:
+                    DocumentoProyecto.objects.bulk_update(to_update, ["titulo"])
+            except Exception:
+                pass
+
+        stamp = timezone.now().strftime("%Y%m%d_%H%M%S")
+        slug_val = slug or f"proyecto_{proyecto.id}"
+        filename = f"presentacion_{slug_val}_{estilo}_regen_{stamp}.pdf"
+        titulo_val = titulo or (proyecto.nombre or f"Proyecto {proyecto.id}")
+        DocumentoProyecto.objects.create(
+            proyecto=proyecto,
+            tipo="presentacion",
+            categoria="presentacion",
+            titulo=f"Dossier · {titulo_val} (regenerado {opciones['today']})",
+            archivo=ContentFile(pdf_bytes, name=filename),
+            huella_entradas=huella,
+        )
+        return _Result(proyecto_id=proyecto.id, created=True)
+    except Exception as e:
+        return _Result(proyecto_id=proyecto_id, created=False, error=str(e))
+
+
+def _iniciar_proceso():
+    import django
+
+    django.setup()
+    # Este proceso ya es uno de los que maquetan: dentro no se abre otro grupo.
+    settings.PDF_PROCESOS = 0
+    from core.pdf import _iniciar_proceso as _preparar_weasyprint
+
+    _preparar_weasyprint()
+
+
+def _regenerar_en_proceso(proyecto_id: int, opciones: dict) -> _Result:
+    close_old_connections()
+    return _regenerar_proyecto(proyecto_id, opciones)
+
+
 class Command(BaseCommand):
     help = "Regenera PDFs guardados tipo 'Dossier' (DocumentoProyecto.categoria='presentacion') con cálculos actuales."
     requires_system_checks = []
@@ -78,282 +420,70 @@ class Command(BaseCommand):
             default="coin",
             help="Estilo de la plantilla de presentación (coin, etc.).",
         )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            default=1,
+            help="Procesos que generan dossiers a la vez (por defecto 1, en este mismo proceso).",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help=(
+                "Saltar los proyectos que ya tienen un Dossier generado con los mismos datos, "
+                "plantillas y estilo."
+            ),
+        )
 
     def handle(self, *args, **opts):
-        from core.models import DocumentoProyecto, Proyecto  # local import
-        from core.views import (  # type: ignore
-            SafeAccessDict,
-            _build_presentacion_context,
-            _build_presentacion_pdf,
-            _catastro_wms_url_from_refcat,
-            _documento_url,
-            _get_snapshot_comunicacion,
-            _logo_data_uri,
-            _merge_pdf_with_documentos,
-            _resultado_desde_memoria,
-            _safe_float,
-        )
+        from core.models import Proyecto  # local import
 
         ids = opts.get("ids") or None
         limit = int(opts.get("limit") or 0)
-        only_if_exists = bool(opts.get("only_if_exists"))
+        jobs = max(1, int(opts.get("jobs") or 1))
         apply = bool(opts.get("apply"))
-        deprecate_old = bool(opts.get("deprecate_old"))
-        estilo_default = (opts.get("estilo") or "coin").strip().lower()
+        opciones = {
+            "only_if_exists": bool(opts.get("only_if_exists")),
+            "apply": apply,
+            "deprecate_old": bool(opts.get("deprecate_old")),
+            "incremental": bool(opts.get("incremental")),
+            "estilo": (opts.get("estilo") or "coin").strip().lower(),
+            "base_url": getattr(settings, "WAGTAILADMIN_BASE_URL", "").strip(),
+            "today": timezone.now().date().isoformat(),
+        }
 
         qs = Proyecto.objects.all().order_by("id")
         if ids:
             qs = qs.filter(id__in=ids)
+        proyecto_ids = list(qs.values_list("id", flat=True))
         if limit > 0:
-            qs = qs[:limit]
-
-        today = timezone.now().date().isoformat()
-        results: list[_Result] = []
-        created = 0
-        skipped = 0
-        errored = 0
-
-        hero_data_uri = _static_data_uri("landing/assets/hero_investor.jpg")
-        base_url = getattr(settings, "WAGTAILADMIN_BASE_URL", "").strip()
-
-        for proyecto in qs.iterator():
-            try:
-                if only_if_exists:
-                    has_dossier = DocumentoProyecto.objects.filter(
-                        proyecto=proyecto,
-                        categoria="presentacion",
-                        archivo__iendswith=".pdf",
-                    ).exists()
-                    if not has_dossier:
-                        skipped += 1
-                        results.append(_Result(proyecto_id=proyecto.id, created=False))
-                        continue
-
-                # Si existe payload "difusion" guardado, regenerar usando exactamente la misma selección/formato/anexos.
-                extra = proyecto.extra if isinstance(proyecto.extra, dict) else {}
-                payload = extra.get("difusion") if isinstance(extra.get("difusion"), dict) else None
-                pdf_bytes = None
-                anexos_docs = []
-                estilo = estilo_default
-                slug = None
-                titulo = None
-
-                if payload:
-                    post = QueryDict(mutable=True)
-                    post["difusion.estilo"] = str(payload.get("estilo") or estilo_default)
-                    post["difusion.titulo"] = str(payload.get("titulo") or proyecto.nombre or "Proyecto")
-                    post["difusion.descripcion"] = str(payload.get("descripcion") or "")
-                    post["difusion.ubicacion"] = str(payload.get("ubicacion") or "")
-                    if payload.get("rentabilidad") not in (None, ""):
-                        post["difusion.rentabilidad"] = str(payload.get("rentabilidad"))
-                    if payload.get("plazo_meses") not in (None, ""):
-                        post["difusion.plazo_meses"] = str(payload.get("plazo_meses"))
-                    if payload.get("acceso_minimo") not in (None, ""):
-                        post["difusion.acceso_minimo"] = str(payload.get("acceso_minimo"))
-                    if payload.get("anio") not in (None, ""):
-                        post["difusion.anio"] = str(payload.get("anio"))
-                    if payload.get("foto_id") not in (None, ""):
-                        post["difusion.foto_id"] = str(payload.get("foto_id"))
-                    if payload.get("mapa_id") not in (None, ""):
-                        post["difusion.mapa_id"] = str(payload.get("mapa_id"))
-                    if payload.get("dossier_id") not in (None, ""):
-                        post["difusion.dossier_id"] = str(payload.get("dossier_id"))
-
-                    formatos = payload.get("formatos") if isinstance(payload.get("formatos"), dict) else {}
-                    post["difusion.formatos.pdf"] = "on" if formatos.get("pdf", True) else ""
-                    post["gen_pdf"] = "on"
-                    if formatos.get("feed"):
-                        post["difusion.formatos.feed"] = "on"
-                    if formatos.get("story"):
-                        post["difusion.formatos.story"] = "on"
-
-                    anexos = payload.get("anexos") if isinstance(payload.get("anexos"), dict) else {}
-                    for doc_id, enabled in anexos.items():
-                        if enabled:
-                            post[f"difusion.anexos.{doc_id}"] = "on"
-
-                    request = _FakeRequest(post, base_url=base_url)
-                    ctx_payload = _build_presentacion_context(request, proyecto)
-                    pdf_context = dict(ctx_payload["context"])
-                    pdf_context["formato"] = "pdf"
-                    if hero_data_uri:
-                        for k in ("foto_url", "descripcion_foto_url"):
-                            v = str(pdf_context.get(k) or "")
-                            if v.endswith(static("landing/assets/hero_investor.jpg")):
-                                pdf_context[k] = hero_data_uri
-
-                    pdf_bytes = _build_presentacion_pdf(request, pdf_context)
-                    anexos_docs = list(ctx_payload.get("anexos_docs") or [])
-                    if pdf_bytes:
-                        pdf_bytes = _merge_pdf_with_documentos(pdf_bytes, anexos_docs, request=request) or pdf_bytes
-                    estilo = str(ctx_payload.get("estilo") or estilo_default)
-                    slug = str(ctx_payload.get("slug") or "") or None
-                    titulo = str(ctx_payload.get("titulo") or "") or None
-
-                if not pdf_bytes:
-                    # Fallback genérico (sin payload guardado).
-                    snapshot = _get_snapshot_comunicacion(proyecto)
-                    inmueble_raw = snapshot.get("inmueble") if isinstance(snapshot.get("inmueble"), dict) else {}
-                    inmueble = SafeAccessDict(inmueble_raw if isinstance(inmueble_raw, dict) else {})
-                    inmueble["dormitorios"] = (
-                        inmueble.get("dormitorios")
-                        or inmueble.get("habitaciones")
-                        or inmueble.get("num_dormitorios")
-                    )
-                    inmueble["banos"] = (
-                        inmueble.get("banos")
-                        or inmueble.get("baños")
-                        or inmueble.get("num_banos")
-                        or inmueble.get("num_baños")
-                    )
-
-                    resultado = _resultado_desde_memoria(proyecto, snapshot if isinstance(snapshot, dict) else {})
-                    titulo = (getattr(proyecto, "nombre", "") or "").strip() or f"Proyecto {proyecto.id}"
-                    slug = slugify(titulo) or f"proyecto_{proyecto.id}"
-
-                    # Foto: preferir principal / primera fotografía.
-                    foto_doc = (
-                        DocumentoProyecto.objects.filter(
-                            proyecto=proyecto,
-                            categoria="fotografias",
-                            usar_pdf=True,
-                        )
-                        .order_by("-creado", "-id")
-                        .first()
-                    )
-                    if not foto_doc:
-                        foto_doc = (
-                            DocumentoProyecto.objects.filter(
-                                proyecto=proyecto,
-                                categoria="fotografias",
-                                es_principal=True,
-                            )
-                            .order_by("-creado", "-id")
-                            .first()
-                        )
-                    if not foto_doc:
-                        foto_doc = (
-                            DocumentoProyecto.objects.filter(
-                                proyecto=proyecto,
-                                categoria="fotografias",
-                            )
-                            .order_by("-es_principal", "-creado", "-id")
-                            .first()
-                        )
-                    foto_url = _documento_url(None, foto_doc) if foto_doc else ""
-                    if not foto_url and hero_data_uri:
-                        foto_url = hero_data_uri
-
-                    anexos_docs = list(
-                        DocumentoProyecto.objects.filter(
-                            proyecto=proyecto,
-                            usar_dossier=True,
-                        )
-                        .exclude(categoria="presentacion")
-                        .order_by("-creado", "-id")
-                    )
-
-                    ref_catastral = (
-                        inmueble.get("ref_catastral")
-                        or inmueble.get("referencia_catastral")
-                        or getattr(proyecto, "ref_catastral", None)
-                        or getattr(proyecto, "referencia_catastral", None)
-                        or ""
-                    )
-                    mapa_url = _catastro_wms_url_from_refcat(str(ref_catastral or "")) if ref_catastral else ""
-
-                    roi_val = _safe_float(resultado.get("roi"), 0.0)
-                    if roi_val >= 15:
-                        semaforo_estado = "verde"
-                        semaforo_label = "Operación sólida"
-                    elif roi_val >= 10:
-                        semaforo_estado = "amarillo"
-                        semaforo_label = "Operación viable"
-                    else:
-                        semaforo_estado = "rojo"
-                        semaforo_label = "Revisar operación"
-                    roi_bar = max(0.0, min(roi_val, 30.0)) / 30.0 * 100.0
-
-                    context = {
-                        "proyecto": proyecto,
-                        "titulo": titulo,
-                        "descripcion": "",
-                        "ubicacion": "",
-                        "rentabilidad": resultado.get("roi"),
-                        "plazo_meses": None,
-                        "acceso_minimo": None,
-                        "anio": timezone.now().year,
-                        "estilo": estilo,
-                        "formato": "pdf",
-                        "foto_url": foto_url,
-                        "descripcion_foto_url": foto_url,
-                        "logo_data_uri": _logo_data_uri("core/logo_inversure_blanco.png"),
-                        "inmueble": inmueble,
-                        "resultado": resultado,
-                        "mapa_url": mapa_url,
-                        "dossier_url": mapa_url,
-                        "fotos_urls": [foto_url] if foto_url else [],
-                        "semaforo_estado": semaforo_estado,
-                        "semaforo_label": semaforo_label,
-                        "roi_bar": roi_bar,
-                    }
-
-                    pdf_bytes = _build_presentacion_pdf(None, context)
-                    if pdf_bytes:
-                        pdf_bytes = _merge_pdf_with_documentos(pdf_bytes, anexos_docs, request=None) or pdf_bytes
-
-                if not pdf_bytes:
-                    errored += 1
-                    results.append(_Result(proyecto_id=proyecto.id, created=False, error="No se pudo generar PDF"))
-                    continue
-
-                if not apply:
-                    results.append(_Result(proyecto_id=proyecto.id, created=False))
-                    continue
-
-                if deprecate_old:
-                    try:
-                        prev_qs = DocumentoProyecto.objects.filter(
-                            proyecto=proyecto,
-                            categoria="presentacion",
-                            archivo__iendswith=".pdf",
-                        ).order_by("-creado", "-id")
-                        prev = list(prev_qs)
-                        to_update = []
-                        for doc in prev:
-                            t = (doc.titulo or "").strip()
-                            if not t:
-                                continue
-                            if t.startswith("OBSOLETO ·"):
-                                continue
-                            doc.titulo = f"OBSOLETO · {t}"
-                            to_update.append(doc)
-                        if to_update:
-                            DocumentoProyecto.objects.bulk_update(to_update, ["titulo"])
-                    except Exception:
-                        pass
-
-                stamp = timezone.now().strftime("%Y%m%d_%H%M%S")
-                slug_val = slug or f"proyecto_{proyecto.id}"
-                filename = f"presentacion_{slug_val}_{estilo}_regen_{stamp}.pdf"
-                titulo_val = titulo or (proyecto.nombre or f"Proyecto {proyecto.id}")
-                DocumentoProyecto.objects.create(
-                    proyecto=proyecto,
-                    tipo="presentacion",
-                    categoria="presentacion",
-                    titulo=f"Dossier · {titulo_val} (regenerado {today})",
-                    archivo=ContentFile(pdf_bytes, name=filename),
-                )
-                created += 1
-                results.append(_Result(proyecto_id=proyecto.id, created=True))
-            except Exception as e:
-                errored += 1
-                results.append(_Result(proyecto_id=proyecto.id, created=False, error=str(e)))
+            proyecto_ids = proyecto_ids[:limit]
+
+        if jobs > 1 and len(proyecto_ids) > 1:
+            # Cada proceso abre su conexión; no se hereda ninguna de aquí.
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=min(jobs, len(proyecto_ids)),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_iniciar_proceso,
+            ) as grupo:
+                results = list(grupo.map(_regenerar_en_proceso, proyecto_ids, repeat(opciones)))
+        else:
+            results = [_regenerar_proyecto(proyecto_id, opciones) for proyecto_id in proyecto_ids]
+
+        created = sum(1 for r in results if r.created)
+        skipped = sum(1 for r in results if r.skipped)
+        unchanged = sum(1 for r in results if r.unchanged)
+        errored = sum(1 for r in results if r.error)
 
         mode = "APPLY" if apply else "DRY-RUN"
-        self.stdout.write(f"{mode}: created={created} skipped={skipped} errored={errored}")
+        self.stdout.write(
+            f"{mode}: created={created} skipped={skipped} unchanged={unchanged} errored={errored}"
+        )
         for r in results:
             if r.error:
                 self.stdout.write(f"{r.proyecto_id};ERROR;{r.error}")
+            elif r.unchanged:
+                self.stdout.write(f"{r.proyecto_id};UNCHANGED;")
             else:
                 self.stdout.write(f"{r.proyecto_id};{'CREATED' if r.created else 'OK'};")
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.17 on 2026-10-17 04:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0050_participacion_fecha_baja_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProyectoMetricas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('firma', models.CharField(help_text='Versión del cálculo y configuración con la que se generó la fila.', max_length=64)),
+                ('datos', models.JSONField(default=dict, help_text='Fila de métricas del proyecto tal y como la usa el panel financiero.')),
+                ('roi_landing', models.FloatField(blank=True, help_text='ROI automático que muestra la landing (vacío si no hay movimientos).', null=True)),
+                ('calculado', models.DateTimeField(auto_now=True)),
+                ('proyecto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='metricas', to='core.proyecto')),
+            ],
+            options={
+                'verbose_name': 'métricas de proyecto',
+                'verbose_name_plural': 'métricas de proyectos',
+            },
+        ),
+    ]
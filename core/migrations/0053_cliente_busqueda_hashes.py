@@ -0,0 +1,31 @@
+# Generated by Django 5.2.17 on 2026-10-17 04:43
+
+from django.db import migrations, models
+
+
+def _rellenar_busqueda(apps, schema_editor):
+    # El modelo histórico no tiene `_sync_hashes`; los campos cifrados sí se
+    # descifran al leer, así que se calcula igual que allí.
+    Cliente = apps.get_model("core", "Cliente")
+    from core.security import search_index
+
+    qs = Cliente.objects.all().only("id", "dni_cif", "email", "telefono")
+    for cliente in qs.iterator():
+        indice = search_index([cliente.dni_cif, cliente.email, cliente.telefono])
+        Cliente.objects.filter(pk=cliente.pk).update(busqueda_hashes=indice)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0052_django_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='busqueda_hashes',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(_rellenar_busqueda, migrations.RunPython.noop),
+    ]
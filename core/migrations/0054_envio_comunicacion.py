@@ -0,0 +1,59 @@
+# Generated by Django 5.2.17 on 2026-10-17 04:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0053_cliente_busqueda_hashes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnvioComunicacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('template_key', models.CharField(blank=True, max_length=100)),
+                ('titulo', models.CharField(blank=True, max_length=255)),
+                ('mensaje', models.TextField(blank=True)),
+                ('anexos', models.JSONField(blank=True, default=list, help_text='IDs de los documentos del inmueble que se adjuntan.')),
+                ('base_url', models.CharField(blank=True, help_text='Dirección de la web al encargar el envío, para los enlaces al portal fuera de la petición.', max_length=255)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_curso', 'En curso'), ('completado', 'Completado'), ('con_errores', 'Completado con errores')], default='pendiente', max_length=12)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('iniciado', models.DateTimeField(blank=True, null=True)),
+                ('terminado', models.DateTimeField(blank=True, null=True)),
+                ('creado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('proyecto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='envios_comunicacion', to='core.proyecto')),
+            ],
+            options={
+                'verbose_name': 'envío de comunicación',
+                'verbose_name_plural': 'envíos de comunicaciones',
+                'ordering': ['-creado'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EnvioComunicacionDestinatario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orden', models.PositiveIntegerField(default=0)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('enviado', 'Enviado'), ('omitido', 'Omitido'), ('error', 'Error')], default='pendiente', max_length=10)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('disponible_desde', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('procesado', models.DateTimeField(blank=True, null=True)),
+                ('envio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='destinatarios', to='core.enviocomunicacion')),
+                ('participacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.participacion')),
+            ],
+            options={
+                'verbose_name': 'destinatario de envío',
+                'verbose_name_plural': 'destinatarios de envío',
+                'ordering': ['envio', 'orden', 'id'],
+                'indexes': [models.Index(fields=['estado', 'disponible_desde'], name='core_envioc_estado_2ce2e4_idx')],
+                'constraints': [models.UniqueConstraint(fields=('envio', 'participacion'), name='envio_comunicacion_participacion_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.17 on 2026-10-17 05:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0054_envio_comunicacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultaCatastro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ref_catastral', models.CharField(max_length=32)),
+                ('tipo', models.CharField(choices=[('coordenadas', 'Coordenadas'), ('datos', 'Datos no protegidos')], max_length=12)),
+                ('encontrado', models.BooleanField(default=True)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('consultado', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'consulta al catastro',
+                'verbose_name_plural': 'consultas al catastro',
+                'constraints': [models.UniqueConstraint(fields=('ref_catastral', 'tipo'), name='consulta_catastro_unica')],
+            },
+        ),
+    ]
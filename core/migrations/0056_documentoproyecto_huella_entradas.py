@@ -0,0 +1,18 @@
+# Generated by Django 5.2.17 on 2026-10-17 05:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0055_consulta_catastro'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentoproyecto',
+            name='huella_entradas',
+            field=models.CharField(blank=True, default='', help_text='Huella de los datos con los que se generó (dossier regenerado); vacía si se subió a mano', max_length=64),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.17 on 2026-10-17 05:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0056_documentoproyecto_huella_entradas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadoAuditoria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('auditoria', models.CharField(max_length=40)),
+                ('huella', models.CharField(help_text='Huella de los datos del proyecto y de la configuración de la auditoría.', max_length=64)),
+                ('filas', models.JSONField(default=list, help_text='Filas del informe para este proyecto.')),
+                ('auditado', models.DateTimeField(auto_now=True)),
+                ('proyecto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estados_auditoria', to='core.proyecto')),
+            ],
+            options={
+                'verbose_name': 'estado de auditoría',
+                'verbose_name_plural': 'estados de auditoría',
+                'constraints': [models.UniqueConstraint(fields=('auditoria', 'proyecto'), name='estado_auditoria_unico')],
+            },
+        ),
+    ]
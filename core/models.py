@@ -11,6 +11,8 @@ from .security import (
     normalize_email,
     normalize_iban,
     normalize_phone,
+    search_index,
+    search_query_hashes,
 )
 
 
@@ -1034,6 +1036,10 @@ class Cliente(models.Model):
         db_index=True,
     )
 
+    # Hashes de prefijos de DNI, email y teléfono para buscar sin descifrar
+    # (ver `core.security.search_index`). Se recalcula en `_sync_hashes`.
+    busqueda_hashes = models.TextField(blank=True, default="", editable=False)
+
     # =========================
     # CONTROL / NOTAS
     # =========================
@@ -1129,12 +1135,23 @@ class Cliente(models.Model):
         iban = self.iban or ""
         self.iban_hash = self.hash_iban(iban) if iban else None
 
+        self.busqueda_hashes = search_index([dni, email, tel])
+
+    @classmethod
+    def search_q(cls, query: str) -> models.Q:
+        """Filtro por nombre (en claro) o por prefijos de DNI, email y teléfono."""
+        query = (query or "").strip()
+        condition = models.Q(nombre__icontains=query)
+        for value in search_query_hashes(query):
+            condition |= models.Q(busqueda_hashes__contains=f" {value} ")
+        return condition
+
     def save(self, *args, **kwargs):
         self._sync_hashes()
         update_fields = kwargs.get("update_fields")
         if update_fields is not None:
             update_set = set(update_fields)
-            update_set.update({"dni_cif_hash", "email_hash", "telefono_hash", "iban_hash"})
+            update_set.update({"dni_cif_hash", "email_hash", "telefono_hash", "iban_hash", "busqueda_hashes"})
             kwargs["update_fields"] = list(update_set)
         super().save(*args, **kwargs)
 
@@ -1449,6 +1466,12 @@ class DocumentoProyecto(models.Model):
     usar_story = models.BooleanField(default=False)
     usar_instagram = models.BooleanField(default=False)
     usar_dossier = models.BooleanField(default=False)
+    huella_entradas = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        help_text="Huella de los datos con los que se generó (dossier regenerado); vacía si se subió a mano",
+    )
     creado = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -2066,3 +2089,200 @@ class FirmaContrato(models.Model):
     @property
     def firmado(self) -> bool:
         return self.estado == self.Estado.FIRMADO
+
+
+class ProyectoMetricas(models.Model):
+    """
+    Métricas económicas de un proyecto, ya calculadas.
+
+    El panel financiero, el listado de proyectos y la landing necesitan para
+    cada proyecto el resultado de memoria, el beneficio estimado frente al real
+    y la liquidación de cada partícipe. Calcularlo obliga a recorrer todos sus
+    gastos, ingresos y participaciones, y hacerlo en cada visita crecía con el
+    histórico aunque los proyectos cerrados no cambien nunca.
+
+    Esta fila es una copia derivada, no una fuente de verdad: se borra y se
+    recalcula cuando cambia algo de lo que depende (ver `core.signals`), y la
+    `firma` recoge la versión del cálculo y la configuración que lo altera. Una
+    fila que falta o cuya firma no coincide simplemente no se usa.
+    """
+
+    proyecto = models.OneToOneField(
+        Proyecto,
+        on_delete=models.CASCADE,
+        related_name="metricas",
+    )
+    firma = models.CharField(
+        max_length=64,
+        help_text="Versión del cálculo y configuración con la que se generó la fila.",
+    )
+    datos = models.JSONField(
+        default=dict,
+        help_text="Fila de métricas del proyecto tal y como la usa el panel financiero.",
+    )
+    roi_landing = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="ROI automático que muestra la landing (vacío si no hay movimientos).",
+    )
+    calculado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "métricas de proyecto"
+        verbose_name_plural = "métricas de proyectos"
+
+    def __str__(self):
+        return "Métricas de {} · {:%d/%m/%Y %H:%M}".format(self.proyecto_id, self.calculado)
+
+
+class EnvioComunicacion(models.Model):
+    """
+    Envío masivo de una comunicación a los inversores de un proyecto.
+
+    Generar la carta en PDF, unir los anexos y mandar el correo lleva unos
+    segundos por inversor; hacerlo dentro de la petición para sesenta inversores
+    superaba el tiempo de gunicorn y el envío se cortaba a medias. La vista solo
+    deja aquí el encargo con un destinatario por participación, y el comando
+    `procesar_comunicaciones` los va mandando de uno en uno.
+    """
+
+    class Estado(models.TextChoices):
+        PENDIENTE = "pendiente", "Pendiente"
+        EN_CURSO = "en_curso", "En curso"
+        COMPLETADO = "completado", "Completado"
+        CON_ERRORES = "con_errores", "Completado con errores"
+
+    proyecto = models.ForeignKey(Proyecto, on_delete=models.CASCADE, related_name="envios_comunicacion")
+    creado_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    template_key = models.CharField(max_length=100, blank=True)
+    titulo = models.CharField(max_length=255, blank=True)
+    mensaje = models.TextField(blank=True)
+    anexos = models.JSONField(default=list, blank=True, help_text="IDs de los documentos del inmueble que se adjuntan.")
+    base_url = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text="Dirección de la web al encargar el envío, para los enlaces al portal fuera de la petición.",
+    )
+    estado = models.CharField(max_length=12, choices=Estado.choices, default=Estado.PENDIENTE)
+    creado = models.DateTimeField(auto_now_add=True)
+    iniciado = models.DateTimeField(null=True, blank=True)
+    terminado = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "envío de comunicación"
+        verbose_name_plural = "envíos de comunicaciones"
+        ordering = ["-creado"]
+
+    def __str__(self):
+        return "{} · {} · {}".format(self.proyecto_id, self.template_key or self.titulo, self.get_estado_display())
+
+
+class EnvioComunicacionDestinatario(models.Model):
+    """
+    Un inversor dentro de un `EnvioComunicacion`.
+
+    `disponible_desde` hace de reserva y de espera entre reintentos: el proceso
+    que coge el destinatario la adelanta unos minutos para que otro no lo coja a
+    la vez, y si el envío falla se deja para más tarde. Si el proceso muere a
+    medias, la reserva caduca y otro lo retoma.
+    """
+
+    class Estado(models.TextChoices):
+        PENDIENTE = "pendiente", "Pendiente"
+        ENVIADO = "enviado", "Enviado"
+        OMITIDO = "omitido", "Omitido"
+        ERROR = "error", "Error"
+
+    envio = models.ForeignKey(EnvioComunicacion, on_delete=models.CASCADE, related_name="destinatarios")
+    participacion = models.ForeignKey(Participacion, on_delete=models.CASCADE, related_name="+")
+    orden = models.PositiveIntegerField(default=0)
+    estado = models.CharField(max_length=10, choices=Estado.choices, default=Estado.PENDIENTE)
+    intentos = models.PositiveIntegerField(default=0)
+    disponible_desde = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    procesado = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "destinatario de envío"
+        verbose_name_plural = "destinatarios de envío"
+        ordering = ["envio", "orden", "id"]
+        constraints = [
+            models.UniqueConstraint(fields=["envio", "participacion"], name="envio_comunicacion_participacion_unica"),
+        ]
+        indexes = [models.Index(fields=["estado", "disponible_desde"])]
+
+    def __str__(self):
+        return "{} · {} · {}".format(self.envio_id, self.participacion_id, self.get_estado_display())
+
+
+class ConsultaCatastro(models.Model):
+    """
+    Respuesta ya obtenida de la Sede del Catastro para una referencia catastral.
+
+    Las coordenadas y los datos no protegidos de una finca prácticamente no
+    cambian, y cada consulta en vivo podía encadenar varias peticiones de dos
+    segundos. Se guardan aquí con su fecha y `core.catastro` no vuelve a
+    preguntar hasta que caducan. Que una referencia no exista también se
+    guarda, por menos tiempo, para no repetir la búsqueda completa.
+    """
+
+    class Tipo(models.TextChoices):
+        COORDENADAS = "coordenadas", "Coordenadas"
+        DATOS = "datos", "Datos no protegidos"
+
+    ref_catastral = models.CharField(max_length=32)
+    tipo = models.CharField(max_length=12, choices=Tipo.choices)
+    encontrado = models.BooleanField(default=True)
+    resultado = models.JSONField(null=True, blank=True)
+    consultado = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "consulta al catastro"
+        verbose_name_plural = "consultas al catastro"
+        constraints = [
+            models.UniqueConstraint(fields=["ref_catastral", "tipo"], name="consulta_catastro_unica"),
+        ]
+
+    def __str__(self):
+        return "{} · {} · {:%d/%m/%Y}".format(self.ref_catastral, self.get_tipo_display(), self.consultado)
+
+
+class EstadoAuditoria(models.Model):
+    """
+    Último resultado de una auditoría nocturna para un proyecto.
+
+    Los comandos `audit_*` recalculan cada proyecto desde sus movimientos, y
+    casi todos están cerrados y no cambian de una noche a otra. Con
+    `--incremental` cada comando guarda aquí las filas de su informe junto con
+    la huella de lo que las produjo (movimientos, participaciones, snapshot,
+    `extra`...) y solo vuelve a auditar los proyectos cuya huella ha cambiado.
+    """
+
+    auditoria = models.CharField(max_length=40)
+    proyecto = models.ForeignKey(
+        Proyecto,
+        on_delete=models.CASCADE,
+        related_name="estados_auditoria",
+    )
+    huella = models.CharField(
+        max_length=64,
+        help_text="Huella de los datos del proyecto y de la configuración de la auditoría.",
+    )
+    filas = models.JSONField(default=list, help_text="Filas del informe para este proyecto.")
+    auditado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "estado de auditoría"
+        verbose_name_plural = "estados de auditoría"
+        constraints = [
+            models.UniqueConstraint(fields=["auditoria", "proyecto"], name="estado_auditoria_unico"),
+        ]
+
+    def __str__(self):
+        return f"{self.auditoria} · {self.proyecto_id}"
@@ -20,10 +20,40 @@ Se guarda una por hilo, no una para todo el proceso, porque Pango y fontconfig
 no prometen ser seguros entre hilos. Y se conserva además una referencia fuerte
 aparte para que no la recoja el recolector cuando muera el hilo que la creó:
 que la configuración sobreviva es justo lo que evita la caída.
+
+Con `PDF_PROCESOS` mayor que cero los PDF no se maquetan en el hilo de la
+petición sino en un grupo fijo de procesos, cada uno con WeasyPrint ya importado
+y su propia configuración de fuentes viva. Un PDF largo deja de bloquear el
+worker de gunicorn más allá de `PDF_TIMEOUT`, y los envíos masivos pueden
+maquetar varias cartas a la vez, una por núcleo, con `procesar_comunicaciones
+--hilos`. Viene apagado (0): se enciende en el entorno que tenga núcleos para
+ello. Si ya hay `PDF_COLA_MAXIMA`
+documentos esperando, el siguiente espera su turno como mucho ese mismo tiempo
+en vez de amontonarse en memoria.
+
+Un PDF es función pura de su HTML y de la URL base, así que puede guardarse en
+disco con la huella SHA-256 de ambos (y de la versión de WeasyPrint) como
+nombre. Solo se guarda si quien lo pide pasa `cachear=True`: los ficheros van
+sin cifrar, y contratos y cartas llevan DNI e IBAN. Lo piden la memoria
+económica y el informe de un estudio, que se abren a menudo sin haber cambiado
+y no llevan datos personales de inversores. La carpeta no pasa de
+`PDF_CACHE_MAX_BYTES`: al llenarse se borran los que más tiempo llevan sin
+pedirse.
 """
 
+import atexit
+import hashlib
 import logging
+import multiprocessing
+import os
+import tempfile
 import threading
+from functools import lru_cache
+from importlib import metadata
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 
 log = logging.getLogger(__name__)
 
@@ -60,8 +90,7 @@ def _configuracion_fuentes():
     return config
 
 
-def render_pdf(html: str, base_url: str | None = None) -> bytes:
-    """El PDF de un HTML ya renderizado."""
+def _render_local(html: str, base_url: str | None = None) -> bytes:
     from weasyprint import HTML  # defer import: necesita pango y cairo
 
     documento = HTML(string=html, base_url=base_url)
@@ -69,3 +98,228 @@ def render_pdf(html: str, base_url: str | None = None) -> bytes:
     if config is None:
         return documento.write_pdf()
     return documento.write_pdf(font_config=config)
+
+
+# --- Grupo de procesos --------------------------------------------------------
+
+
+class PdfNoDisponible(RuntimeError):
+    """El PDF no se pudo maquetar a tiempo o el proceso que lo hacía se cayó."""
+
+
+_grupo = None
+_plazas = None
+_cerrojo_grupo = threading.Lock()
+
+
+def _ajustes() -> tuple[int, float, int]:
+    from django.conf import settings
+
+    procesos = max(0, int(getattr(settings, "PDF_PROCESOS", 0) or 0))
+    timeout = float(getattr(settings, "PDF_TIMEOUT", 120) or 120)
+    cola = int(getattr(settings, "PDF_COLA_MAXIMA", 0) or 0) or procesos * 2
+    return procesos, timeout, max(cola, procesos)
+
+
+def _iniciar_proceso():
+    # Se paga una vez por proceso lo que antes se pagaba en el primer PDF de
+    # cada hilo: importar WeasyPrint (y con él pango y cairo) y montar las
+    # fuentes. Si falla, el render dará el error real al pedir el documento.
+    try:
+        import weasyprint  # noqa: F401
+
+        _configuracion_fuentes()
+    except Exception:
+        log.warning("No se pudo preparar WeasyPrint en el proceso de PDF", exc_info=True)
+
+
+def _obtener_grupo(procesos: int, cola: int):
+    global _grupo, _plazas
+    with _cerrojo_grupo:
+        if _grupo is None:
+            # `spawn` y no `fork`: el proceso de gunicorn tiene hilos y
+            # conexiones abiertas, y pango no se lleva bien con heredarlos.
+            _grupo = ProcessPoolExecutor(
+                max_workers=procesos,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_iniciar_proceso,
+            )
+            _plazas = threading.BoundedSemaphore(cola)
+        return _grupo, _plazas
+
+
+def _cerrar_grupo(grupo=None):
+    global _grupo, _plazas
+    with _cerrojo_grupo:
+        if _grupo is None or (grupo is not None and grupo is not _grupo):
+            return
+        _grupo.shutdown(wait=False, cancel_futures=True)
+        _grupo = None
+        _plazas = None
+
+
+atexit.register(_cerrar_grupo)
+
+
+def _encargar(html: str, base_url: str | None, timeout: float, procesos: int, cola: int):
+    grupo, plazas = _obtener_grupo(procesos, cola)
+    if not plazas.acquire(timeout=timeout):
+        raise PdfNoDisponible("Hay demasiados PDF en cola; inténtalo en unos segundos.")
+    try:
+        futuro = grupo.submit(_render_local, html, base_url)
+    except BrokenProcessPool as exc:
+        plazas.release()
+        _cerrar_grupo(grupo)
+        raise PdfNoDisponible("El proceso que generaba el PDF se detuvo.") from exc
+    except BaseException:
+        plazas.release()
+        raise
+    # La plaza se devuelve cuando el proceso termina de verdad, no cuando el
+    # que lo pidió se cansa de esperar: así la cola refleja lo que hay en marcha.
+    futuro.add_done_callback(lambda _f: plazas.release())
+    return grupo, futuro
+
+
+def _recoger(grupo, futuro, timeout: float) -> bytes:
+    try:
+        return futuro.result(timeout=timeout)
+    except FuturesTimeoutError as exc:
+        futuro.cancel()
+        raise PdfNoDisponible("El PDF ha tardado demasiado en generarse.") from exc
+    except BrokenProcessPool as exc:
+        _cerrar_grupo(grupo)
+        raise PdfNoDisponible("El proceso que generaba el PDF se detuvo.") from exc
+
+
+# --- Caché por contenido -------------------------------------------------------
+
+# Subir si cambia algo de cómo se maqueta que no dependa del HTML (hojas de
+# estilo por defecto, opciones de `write_pdf`...): invalida todo lo guardado.
+VERSION_RENDER = 1
+
+_cerrojo_cache = threading.Lock()
+_ocupado_estimado = None
+
+
+@lru_cache(maxsize=1)
+def _version_weasyprint() -> str:
+    try:
+        return metadata.version("weasyprint")
+    except metadata.PackageNotFoundError:
+        return "?"
+
+
+def _ajustes_cache() -> tuple[Path | None, int]:
+    from django.conf import settings
+
+    limite = int(getattr(settings, "PDF_CACHE_MAX_BYTES", 0) or 0)
+    carpeta = getattr(settings, "PDF_CACHE_DIR", "") or ""
+    if limite <= 0 or not carpeta:
+        return None, 0
+    return Path(carpeta), limite
+
+
+def clave_pdf(html: str, base_url: str | None = None) -> str:
+    """Huella con la que se guarda el PDF de este HTML."""
+    huella = hashlib.sha256()
+    for parte in (str(VERSION_RENDER), _version_weasyprint(), base_url or "", html):
+        huella.update(parte.encode("utf-8"))
+        huella.update(b"\0")
+    return huella.hexdigest()
+
+
+def _ruta_cache(carpeta: Path, clave: str) -> Path:
+    return carpeta / clave[:2] / f"{clave}.pdf"
+
+
+def _leer_cache(carpeta: Path, clave: str) -> bytes | None:
+    ruta = _ruta_cache(carpeta, clave)
+    try:
+        contenido = ruta.read_bytes()
+    except OSError:
+        return None
+    try:
+        os.utime(ruta)  # la fecha marca el último uso para el desalojo
+    except OSError:
+        pass
+    return contenido
+
+
+def _ficheros_cache(carpeta: Path) -> list[tuple[float, int, Path]]:
+    ficheros = []
+    for ruta in carpeta.glob("*/*.pdf"):
+        try:
+            estado = ruta.stat()
+        except OSError:
+            continue
+        ficheros.append((estado.st_mtime, estado.st_size, ruta))
+    return ficheros
+
+
+def _desalojar(carpeta: Path, limite: int) -> int:
+    """Borra los menos usados hasta quedar en el 90 % del límite. Devuelve lo ocupado."""
+    ficheros = _ficheros_cache(carpeta)
+    ocupado = sum(tamano for _, tamano, _ in ficheros)
+    if ocupado <= limite:
+        return ocupado
+    objetivo = int(limite * 0.9)
+    for _, tamano, ruta in sorted(ficheros):
+        if ocupado <= objetivo:
+            break
+        try:
+            ruta.unlink()
+        except OSError:
+            continue
+        ocupado -= tamano
+    return ocupado
+
+
+def _guardar_cache(carpeta: Path, limite: int, clave: str, contenido: bytes) -> None:
+    global _ocupado_estimado
+    if not contenido or len(contenido) > limite:
+        return
+    ruta = _ruta_cache(carpeta, clave)
+    try:
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        # Se escribe aparte y se renombra: otro proceso nunca lee medio PDF.
+        descriptor, temporal = tempfile.mkstemp(dir=ruta.parent, suffix=".tmp")
+        with os.fdopen(descriptor, "wb") as fichero:
+            fichero.write(contenido)
+        os.replace(temporal, ruta)
+    except OSError:
+        log.warning("No se pudo guardar el PDF en la caché %s", carpeta, exc_info=True)
+        return
+    with _cerrojo_cache:
+        # La suma de lo ocupado se calcula recorriendo la carpeta solo al
+        # principio y cuando parece superar el límite; entre medias se estima.
+        if _ocupado_estimado is None:
+            _ocupado_estimado = _desalojar(carpeta, limite)
+        else:
+            _ocupado_estimado += len(contenido)
+            if _ocupado_estimado > limite:
+                _ocupado_estimado = _desalojar(carpeta, limite)
+
+
+def render_pdf(html: str, base_url: str | None = None, *, cachear: bool = False) -> bytes:
+    """
+    El PDF de un HTML ya renderizado.
+
+    Con `cachear` se guarda en disco y se reutiliza mientras el HTML no cambie.
+    Solo para documentos sin datos personales de clientes.
+    """
+    carpeta, limite = _ajustes_cache() if cachear else (None, 0)
+    clave = clave_pdf(html, base_url) if carpeta else ""
+    if carpeta:
+        guardado = _leer_cache(carpeta, clave)
+        if guardado is not None:
+            return guardado
+    procesos, timeout, cola = _ajustes()
+    if not procesos:
+        contenido = _render_local(html, base_url)
+    else:
+        grupo, futuro = _encargar(html, base_url, timeout, procesos, cola)
+        contenido = _recoger(grupo, futuro, timeout)
+    if carpeta:
+        _guardar_cache(carpeta, limite, clave, contenido)
+    return contenido
+
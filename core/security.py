@@ -2,7 +2,9 @@ import base64
 import hashlib
 import hmac
 import logging
-from typing import Optional
+import re
+from functools import lru_cache
+from typing import Iterable, Optional
 
 from django.conf import settings
 
@@ -49,6 +51,17 @@ def encrypt_value(value: Optional[str]) -> Optional[str]:
     return f"{_ENC_PREFIX}{token}"
 
 
+# Cada cifrado lleva su propio IV, así que un mismo texto cifrado siempre da el
+# mismo claro: se puede recordar. Un listado, una exportación o el portal leen
+# los mismos clientes muchas veces por petición, y cada lectura pagaba la
+# verificación HMAC y el AES de Fernet. La clave forma parte de la entrada: si
+# cambia (`_FERNET` se regenera), lo recordado con la anterior deja de usarse.
+# Los fallos no se recuerdan, `lru_cache` no guarda excepciones.
+@lru_cache(maxsize=4096)
+def _decrypt_token(fernet: "Fernet", token: str) -> str:
+    return fernet.decrypt(token.encode("utf-8")).decode("utf-8")
+
+
 def decrypt_value(value: Optional[str]) -> Optional[str]:
     if value is None or value == "":
         return value
@@ -58,7 +71,7 @@ def decrypt_value(value: Optional[str]) -> Optional[str]:
         return value
     token = value[len(_ENC_PREFIX):]
     try:
-        return _get_fernet().decrypt(token.encode("utf-8")).decode("utf-8")
+        return _decrypt_token(_get_fernet(), token)
     except InvalidToken:
         # Se devuelve el cifrado en vez de reventar, para que un dato ilegible
         # no tumbe la ficha entera. Pero queda registrado: si la clave cambia
@@ -102,6 +115,58 @@ def hash_value(value: Optional[str], purpose: str) -> str:
     return hmac.new(_get_hmac_key(), payload, hashlib.sha256).hexdigest()
 
 
+# =========================
+# BÚSQUEDA SOBRE CAMPOS CIFRADOS
+# =========================
+
+# DNI, email y teléfono van cifrados, así que no se pueden buscar con un LIKE.
+# Para cada valor se guardan HMAC truncados de sus prefijos (por palabra y del
+# valor entero) y de cualquier tramo de sus dígitos; la búsqueda calcula el HMAC
+# de lo tecleado y lo busca entre ellos. Truncar a 16 hex deja la columna
+# manejable; una colisión solo añadiría un resultado de más.
+SEARCH_MIN_LENGTH = 2
+_SEARCH_HASH_LENGTH = 16
+_SEARCH_WORD_RE = re.compile(r"[^\W_]+")
+
+
+def _search_hash(fragment: str) -> str:
+    payload = f"busqueda:{fragment}".encode("utf-8")
+    return hmac.new(_get_hmac_key(), payload, hashlib.sha256).hexdigest()[:_SEARCH_HASH_LENGTH]
+
+
+def _normalize_search(value: Optional[str]) -> str:
+    return " ".join((value or "").lower().split())
+
+
+def search_index(values: Iterable[Optional[str]]) -> str:
+    fragments = set()
+    for value in values:
+        norm = _normalize_search(value)
+        if not norm:
+            continue
+        words = {norm.replace(" ", ""), *_SEARCH_WORD_RE.findall(norm)}
+        for word in words:
+            fragments.update(word[:end] for end in range(SEARCH_MIN_LENGTH, len(word) + 1))
+        # Los números se buscan también por el medio o por el final
+        # («los últimos dígitos del teléfono»).
+        digits = "".join(ch for ch in norm if ch.isdigit())
+        for start in range(len(digits)):
+            fragments.update(digits[start:end] for end in range(start + SEARCH_MIN_LENGTH, len(digits) + 1))
+    if not fragments:
+        return ""
+    # Con espacios a los lados, para buscar cada hash entero con `contains`.
+    return " " + " ".join(sorted(_search_hash(f) for f in fragments)) + " "
+
+
+def search_query_hashes(query: Optional[str]) -> list[str]:
+    norm = _normalize_search(query)
+    candidates = {norm.replace(" ", "")}
+    if norm and not any(ch.isalpha() for ch in norm):
+        # «600 12 34» o «600-123» se buscan como los dígitos seguidos.
+        candidates.add("".join(ch for ch in norm if ch.isdigit()))
+    return sorted(_search_hash(c) for c in candidates if len(c) >= SEARCH_MIN_LENGTH)
+
+
 # =========================
 # FICHEROS SUBIDOS
 # =========================
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import json
+from collections import defaultdict
+from functools import lru_cache
+from hashlib import sha256
+from pathlib import Path
+from typing import Any, Iterable, Mapping
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from core.models import (
+    DatosEconomicosProyecto,
+    EstadoAuditoria,
+    Estudio,
+    EstudioSnapshot,
+    GastoProyecto,
+    IngresoProyecto,
+    Participacion,
+    Proyecto,
+)
+from core.services.project_metrics import project_metrics_signature
+
+# Bump when the fingerprint stops covering something an audit reads: every
+# stored state is then considered stale and audited again.
+AUDIT_STATE_VERSION = 1
+
+_CORE_DIR = Path(__file__).resolve().parent.parent
+
+
+@lru_cache(maxsize=1)
+def audit_code_signature() -> str:
+    """Hash of the code the audits run: every module and template of `core`, migrations aside.
+
+    A deploy that changes how a metric is computed or shown must not reuse the
+    rows stored by the previous code, even if no project changed.
+    """
+
+    digest = sha256()
+    paths = [*_CORE_DIR.rglob("*.py"), *(_CORE_DIR / "templates").rglob("*.html")]
+    for path in sorted(p for p in paths if "migrations" not in p.relative_to(_CORE_DIR).parts):
+        digest.update(path.relative_to(_CORE_DIR).as_posix().encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(path.read_bytes())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _rows_by_project(queryset, project_ids: list[int]) -> dict[int, list[dict[str, Any]]]:
+    grouped: dict[int, list[dict[str, Any]]] = defaultdict(list)
+    for row in queryset.filter(proyecto_id__in=project_ids).order_by("proyecto_id", "id").values():
+        grouped[row["proyecto_id"]].append(row)
+    return grouped
+
+
+def project_fingerprints(project_ids: Iterable[int], *, scope: Mapping[str, Any] | None = None) -> dict[int, str]:
+    """Fingerprint per project of everything the audits read, plus the audit's own `scope`.
+
+    Covers the project row itself (snapshot, `extra`, state...), its economic
+    data, costs, income, participations with the investor's tax type, the
+    `datos` of the origin snapshot and study (read when the project has no
+    snapshot of its own), the configuration that changes the memory
+    calculation and the audited code.
+    """
+
+    ids = sorted({int(pk) for pk in project_ids})
+    if not ids:
+        return {}
+    projects = {row["id"]: row for row in Proyecto.objects.filter(id__in=ids).values()}
+    economic = {row["proyecto_id"]: row for row in DatosEconomicosProyecto.objects.filter(proyecto_id__in=ids).values()}
+    costs = _rows_by_project(GastoProyecto.objects.all(), ids)
+    income = _rows_by_project(IngresoProyecto.objects.all(), ids)
+    snapshot_data = dict(
+        EstudioSnapshot.objects.filter(
+            id__in={row["origen_snapshot_id"] for row in projects.values() if row["origen_snapshot_id"]}
+        ).values_list("id", "datos")
+    )
+    study_data = dict(
+        Estudio.objects.filter(
+            id__in={row["origen_estudio_id"] for row in projects.values() if row["origen_estudio_id"]}
+        ).values_list("id", "datos")
+    )
+    participations: dict[int, list[dict[str, Any]]] = defaultdict(list)
+    for row in (
+        Participacion.objects.filter(proyecto_id__in=ids)
+        .order_by("proyecto_id", "id")
+        .values("cliente__tipo_persona", *[field.attname for field in Participacion._meta.concrete_fields])
+    ):
+        participations[row["proyecto_id"]].append(row)
+
+    common = {
+        "version": AUDIT_STATE_VERSION,
+        "metrics": project_metrics_signature(),
+        "code": audit_code_signature(),
+        "scope": dict(scope or {}),
+    }
+    fingerprints: dict[int, str] = {}
+    for project_id in ids:
+        if project_id not in projects:
+            continue
+        parts = {
+            **common,
+            "project": projects[project_id],
+            "economic": economic.get(project_id),
+            "costs": costs.get(project_id, []),
+            "income": income.get(project_id, []),
+            "participations": participations.get(project_id, []),
+            "origin_snapshot": snapshot_data.get(projects[project_id]["origen_snapshot_id"]),
+            "origin_study": study_data.get(projects[project_id]["origen_estudio_id"]),
+        }
+        payload = json.dumps(parts, sort_keys=True, cls=DjangoJSONEncoder, default=str)
+        fingerprints[project_id] = sha256(payload.encode("utf-8")).hexdigest()
+    return fingerprints
+
+
+def cached_rows(audit: str, fingerprints: Mapping[int, str]) -> dict[int, list[Any]]:
+    """Stored report rows of the projects whose fingerprint has not changed."""
+
+    if not fingerprints:
+        return {}
+    cached: dict[int, list[Any]] = {}
+    for state in EstadoAuditoria.objects.filter(auditoria=audit, proyecto_id__in=list(fingerprints)):
+        if fingerprints.get(state.proyecto_id) == state.huella:
+            cached[state.proyecto_id] = list(state.filas or [])
+    return cached
+
+
+def store_rows(audit: str, project_id: int, fingerprint: str, rows: list[Any]) -> None:
+    """Remember the report rows of one project together with the fingerprint that produced them."""
+
+    filas = json.loads(json.dumps(rows, cls=DjangoJSONEncoder))
+    EstadoAuditoria.objects.update_or_create(
+        auditoria=audit,
+        proyecto_id=project_id,
+        defaults={"huella": fingerprint, "filas": filas},
+    )
@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+import logging
+from datetime import timedelta
+from typing import Any, Iterable
+from urllib.parse import urljoin
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from core.correo import conexion_compartida
+from core.models import (
+    DocumentoProyecto,
+    EnvioComunicacion,
+    EnvioComunicacionDestinatario,
+    Participacion,
+    Proyecto,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds a worker holds a recipient before another one may take it over.
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 3
+RETRY_DELAY_SECONDS = 60
+_CANDIDATES_PER_CLAIM = 20
+
+_Estado = EnvioComunicacionDestinatario.Estado
+
+
+def _core_views():
+    from core import views as core_views
+
+    return core_views
+
+
+class DeferredRequest:
+    """
+    Stand-in for the HTTP request the communication helpers receive.
+
+    Outside a view they only need it to build absolute links (investor portal,
+    logo, PDF base URL), so it resolves paths against the site address captured
+    when the job was queued.
+    """
+
+    def __init__(self, base_url: str = "", user=None):
+        self.base_url = base_url or ""
+        self.user = user
+
+    def build_absolute_uri(self, location: str | None = None) -> str:
+        return urljoin(self.base_url, location or "/")
+
+
+def enqueue_communication(
+    proyecto: Proyecto,
+    participaciones: Iterable[Participacion],
+    *,
+    user=None,
+    template_key: str = "",
+    titulo: str = "",
+    mensaje: str = "",
+    anexos: Iterable[DocumentoProyecto] = (),
+    base_url: str = "",
+) -> EnvioComunicacion:
+    """Store a bulk communication and one pending recipient per participation."""
+
+    with transaction.atomic():
+        envio = EnvioComunicacion.objects.create(
+            proyecto=proyecto,
+            creado_por=user if getattr(user, "is_authenticated", False) else None,
+            template_key=template_key or "",
+            titulo=(titulo or "")[:255],
+            mensaje=mensaje or "",
+            anexos=[doc.id for doc in anexos],
+            base_url=(base_url or "")[:255],
+        )
+        EnvioComunicacionDestinatario.objects.bulk_create(
+            [
+                EnvioComunicacionDestinatario(envio=envio, participacion=part, orden=orden)
+                for orden, part in enumerate(participaciones)
+            ]
+        )
+    return envio
+
+
+def _available(now) -> Q:
+    return Q(disponible_desde__isnull=True) | Q(disponible_desde__lte=now)
+
+
+def _expire_abandoned(now, max_attempts: int) -> None:
+    """Fail recipients whose last attempt was claimed by a worker that never reported back."""
+
+    abandonados = EnvioComunicacionDestinatario.objects.filter(
+        estado=_Estado.PENDIENTE,
+        intentos__gte=max_attempts,
+        disponible_desde__lte=now,
+    )
+    envio_ids = set(abandonados.values_list("envio_id", flat=True))
+    if not envio_ids:
+        return
+    abandonados.update(
+        estado=_Estado.ERROR,
+        error="El envío se interrumpió en el último intento.",
+        procesado=now,
+    )
+    for envio in EnvioComunicacion.objects.filter(id__in=envio_ids):
+        refresh_status(envio)
+
+
+def claim_next(
+    *,
+    envio_id: int | None = None,
+    lease_seconds: int = LEASE_SECONDS,
+    max_attempts: int = MAX_ATTEMPTS,
+) -> EnvioComunicacionDestinatario | None:
+    """
+    Reserve the next pending recipient, or return None when nothing is due.
+
+    The reservation is a conditional UPDATE on the row, so several workers can
+    poll the same table without handing out a recipient twice.
+    """
+
+    now = timezone.now()
+    _expire_abandoned(now, max_attempts)
+    pendientes = EnvioComunicacionDestinatario.objects.filter(
+        _available(now),
+        estado=_Estado.PENDIENTE,
+        intentos__lt=max_attempts,
+    )
+    if envio_id is not None:
+        pendientes = pendientes.filter(envio_id=envio_id)
+    candidatos = list(pendientes.order_by("envio_id", "orden", "id").values_list("id", flat=True)[:_CANDIDATES_PER_CLAIM])
+    for destinatario_id in candidatos:
+        reservado = EnvioComunicacionDestinatario.objects.filter(
+            _available(now),
+            id=destinatario_id,
+            estado=_Estado.PENDIENTE,
+        ).update(intentos=F("intentos") + 1, disponible_desde=now + timedelta(seconds=lease_seconds))
+        if not reservado:
+            continue
+        destinatario = EnvioComunicacionDestinatario.objects.select_related(
+            "envio",
+            "envio__proyecto",
+            "participacion",
+            "participacion__cliente",
+        ).get(id=destinatario_id)
+        EnvioComunicacion.objects.filter(id=destinatario.envio_id, iniciado__isnull=True).update(
+            estado=EnvioComunicacion.Estado.EN_CURSO,
+            iniciado=now,
+        )
+        return destinatario
+    return None
+
+
+def _send_context(envio: EnvioComunicacion) -> dict[str, Any]:
+    """Project-wide inputs shared by every recipient of a job."""
+
+    core_views = _core_views()
+    proyecto = envio.proyecto
+    anexos = DocumentoProyecto.objects.filter(proyecto=proyecto, categoria="inmueble", id__in=envio.anexos or [])
+    context: dict[str, Any] = {
+        # Cover and annexes are downloaded and laid out once for the whole job.
+        "anexos": core_views._AnexosPdf(anexos, DeferredRequest(envio.base_url)),
+    }
+    if envio.template_key:
+        snapshot = core_views._get_snapshot_comunicacion(proyecto)
+        memoria = core_views._MemoriaProyecto(proyecto, snapshot)
+        context["snapshot"] = snapshot
+        context["resultado_mem"] = memoria.resultado_inversores if isinstance(snapshot, dict) else {}
+        context["total_proj"] = core_views._total_confirmado_proyecto(proyecto)
+    return context
+
+
+def process_delivery(
+    destinatario: EnvioComunicacionDestinatario,
+    *,
+    max_attempts: int = MAX_ATTEMPTS,
+    retry_delay: int = RETRY_DELAY_SECONDS,
+    contexts: dict[int, dict[str, Any]] | None = None,
+) -> str:
+    """Send one claimed recipient and record the outcome. Returns the new state."""
+
+    envio = destinatario.envio
+    if contexts is None:
+        contexts = {}
+    now = timezone.now()
+    try:
+        if envio.id not in contexts:
+            contexts[envio.id] = _send_context(envio)
+        enviado = _core_views()._enviar_comunicacion_participacion(
+            DeferredRequest(envio.base_url, user=envio.creado_por),
+            envio.proyecto,
+            destinatario.participacion,
+            template_key=envio.template_key,
+            titulo=envio.titulo,
+            mensaje=envio.mensaje,
+            **contexts[envio.id],
+        )
+    except Exception as exc:
+        logger.exception("Fallo enviando la comunicación %s a la participación %s", envio.id, destinatario.participacion_id)
+        cambios: dict[str, Any] = {"error": str(exc)[:1000] or exc.__class__.__name__}
+        if destinatario.intentos >= max_attempts:
+            cambios.update(estado=_Estado.ERROR, procesado=now)
+        else:
+            cambios.update(
+                estado=_Estado.PENDIENTE,
+                disponible_desde=now + timedelta(seconds=retry_delay * destinatario.intentos),
+            )
+    else:
+        cambios = {"estado": _Estado.ENVIADO if enviado else _Estado.OMITIDO, "error": "", "procesado": now}
+    EnvioComunicacionDestinatario.objects.filter(id=destinatario.id).update(**cambios)
+    refresh_status(envio)
+    return cambios["estado"]
+
+
+def process_pending(
+    *,
+    envio_id: int | None = None,
+    limit: int | None = None,
+    lease_seconds: int = LEASE_SECONDS,
+    max_attempts: int = MAX_ATTEMPTS,
+    retry_delay: int = RETRY_DELAY_SECONDS,
+) -> dict[str, int]:
+    """Work through due recipients until none is left (or `limit` is reached)."""
+
+    resumen = {"procesados": 0, _Estado.ENVIADO: 0, _Estado.OMITIDO: 0, _Estado.ERROR: 0, _Estado.PENDIENTE: 0}
+    contexts: dict[int, dict[str, Any]] = {}
+    # One SMTP connection for the whole pass instead of a handshake per email.
+    with conexion_compartida():
+        while limit is None or resumen["procesados"] < limit:
+            destinatario = claim_next(envio_id=envio_id, lease_seconds=lease_seconds, max_attempts=max_attempts)
+            if destinatario is None:
+                break
+            estado = process_delivery(
+                destinatario,
+                max_attempts=max_attempts,
+                retry_delay=retry_delay,
+                contexts=contexts,
+            )
+            resumen["procesados"] += 1
+            resumen[estado] += 1
+    return resumen
+
+
+def _counts(envio: EnvioComunicacion) -> dict[str, int]:
+    return dict(
+        envio.destinatarios.order_by().values("estado").annotate(total=Count("id")).values_list("estado", "total")
+    )
+
+
+def refresh_status(envio: EnvioComunicacion) -> None:
+    """Close the job once no recipient is pending."""
+
+    counts = _counts(envio)
+    if counts.get(_Estado.PENDIENTE):
+        return
+    estado = EnvioComunicacion.Estado.CON_ERRORES if counts.get(_Estado.ERROR) else EnvioComunicacion.Estado.COMPLETADO
+    EnvioComunicacion.objects.filter(id=envio.id, terminado__isnull=True).update(estado=estado, terminado=timezone.now())
+
+
+def status_payload(envio: EnvioComunicacion) -> dict[str, Any]:
+    """Progress of a job as returned by the status endpoint."""
+
+    envio.refresh_from_db(fields=["estado", "iniciado", "terminado"])
+    counts = _counts(envio)
+    total = sum(counts.values())
+    pendientes = counts.get(_Estado.PENDIENTE, 0)
+    fallos = (
+        envio.destinatarios.exclude(error="")
+        .select_related("participacion__cliente")
+        .order_by("orden", "id")[:50]
+    )
+    return {
+        "id": envio.id,
+        "estado": envio.estado,
+        "estado_label": envio.get_estado_display(),
+        "finalizado": envio.terminado is not None,
+        "total": total,
+        "enviados": counts.get(_Estado.ENVIADO, 0),
+        "omitidos": counts.get(_Estado.OMITIDO, 0),
+        "errores": counts.get(_Estado.ERROR, 0),
+        "pendientes": pendientes,
+        "progreso": round((total - pendientes) * 100 / total) if total else 100,
+        "fallos": [
+            {
+                "cliente_nombre": d.participacion.cliente.nombre,
+                "estado": d.estado,
+                "intentos": d.intentos,
+                "error": d.error,
+            }
+            for d in fallos
+        ],
+        "creado": envio.creado.isoformat() if envio.creado else None,
+        "iniciado": envio.iniciado.isoformat() if envio.iniciado else None,
+        "terminado": envio.terminado.isoformat() if envio.terminado else None,
+    }
@@ -1,13 +1,17 @@
 from __future__ import annotations
 
 import json
+import logging
 from dataclasses import dataclass
 from datetime import date, datetime
 from decimal import Decimal
 from hashlib import sha256
 from typing import Any, Mapping, cast
+from uuid import uuid4
 
-from django.db.models import Prefetch, Q, Sum
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Prefetch, Q, Sum, prefetch_related_objects
 from django.db.models.functions import TruncMonth
 from django.utils import timezone
 
@@ -25,20 +29,22 @@ from core.finance import calc_inversor_settlement, calc_operacion_economica
 from core.models import (
     ChecklistItem,
     Cliente,
-    FacturaGasto,
     GastoProyecto,
     IngresoProyecto,
     InversorPerfil,
     Participacion,
     Proyecto,
     SolicitudParticipacion,
-    JustificanteIngreso,
 )
+from core.services.project_metrics import current_project_metrics, load_metric_row, project_metric_prefetches
 
 TERMINAL_PROJECT_STATES = {"cerrado", "descartado"}
 LEGACY_CLOSED_PROJECT_STATES = {"cerrado"}
 ACTIVE_PROJECT_STATES = {"captacion", "comprado", "comercializacion", "reservado", "vendido"}
 DATE_INPUT_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d")
+DASHBOARD_CACHE_GENERATION_KEY = "financial-dashboard:generation"
+
+logger = logging.getLogger(__name__)
 
 
 def _core_views():
@@ -253,25 +259,13 @@ class FinancialDashboardService:
         return "anonymous"
 
     def _load_projects(self):
+        # Los gastos, ingresos y participaciones no se precargan aquí: solo hacen
+        # falta para los proyectos sin fila vigente en `ProyectoMetricas`, y esos
+        # se completan en `_build_project_metrics`.
         project_qs = (
             Proyecto.objects.all()
             .select_related("responsable_user", "origen_estudio", "origen_snapshot", "datos_economicos")
             .prefetch_related(
-                Prefetch(
-                    "gastos_proyecto",
-                    queryset=GastoProyecto.objects.select_related("proyecto").order_by("fecha", "id"),
-                ),
-                Prefetch(
-                    "ingresos",
-                    queryset=IngresoProyecto.objects.select_related("proyecto").order_by("fecha", "id"),
-                ),
-                Prefetch(
-                    "participaciones",
-                    queryset=Participacion.objects.filter(estado="confirmada")
-                    .select_related("cliente")
-                    .order_by("creado", "id"),
-                    to_attr="participaciones_confirmadas",
-                ),
                 Prefetch(
                     "checklist_items",
                     queryset=ChecklistItem.objects.select_related("proyecto", "responsable_user").order_by(
@@ -290,41 +284,53 @@ class FinancialDashboardService:
         return project_qs
 
     def _build_project_metrics(self, projects: list[Proyecto]) -> list[dict[str, Any]]:
-        core_views = _core_views()
+        stored = current_project_metrics(project.id for project in projects)
+        missing = [project for project in projects if project.id not in stored]
+        if missing:
+            prefetch_related_objects(missing, *project_metric_prefetches())
         metrics: list[dict[str, Any]] = []
         for project in projects:
-            snapshot = core_views._get_snapshot_comunicacion(project)
-            resultado = core_views._resultado_desde_memoria(project, snapshot)
-            beneficio_memoria = core_views._beneficio_estimado_real_memoria(project)
-            capital_objetivo = to_decimal(core_views._capital_objetivo_desde_memoria(project, snapshot), default=ZERO)
-            participaciones_confirmadas = list(getattr(project, "participaciones_confirmadas", []))
-            capital_captado = sum((to_decimal(part.importe_invertido, default=ZERO) for part in participaciones_confirmadas), ZERO)
-            capital_pendiente = max(capital_objetivo - capital_captado, ZERO)
-
-            operacion = self._build_operacion_summary(project, snapshot, resultado)
-            settlement = self._build_investment_return_summary(
-                project=project,
-                snapshot=snapshot,
-                operation=operacion,
-                confirmed_participations=participaciones_confirmadas,
-                capital_captado=capital_captado,
-            )
-
-            metrics.append(
-                _build_project_metric_row(
-                    project=project,
-                    resultado=resultado,
-                    beneficio_memoria=beneficio_memoria,
-                    operacion=operacion,
-                    settlement=settlement,
-                    capital_objetivo=capital_objetivo,
-                    capital_captado=capital_captado,
-                    capital_pendiente=capital_pendiente,
-                    participaciones_confirmadas=participaciones_confirmadas,
-                )
-            )
+            metricas = stored.get(project.id)
+            if metricas is not None:
+                metrics.append(load_metric_row(metricas.datos))
+            else:
+                metrics.append(self.build_project_metric(project))
         return metrics
 
+    def build_project_metric(self, project: Proyecto) -> dict[str, Any]:
+        """Compute the metric row of one project from its movements and participations."""
+
+        core_views = _core_views()
+        snapshot = core_views._get_snapshot_comunicacion(project)
+        memoria = core_views._MemoriaProyecto(project, snapshot)
+        resultado = memoria.resultado
+        beneficio_memoria = memoria.beneficio_estimado_real
+        capital_objetivo = to_decimal(memoria.capital_objetivo, default=ZERO)
+        participaciones_confirmadas = list(getattr(project, "participaciones_confirmadas", []))
+        capital_captado = sum((to_decimal(part.importe_invertido, default=ZERO) for part in participaciones_confirmadas), ZERO)
+        capital_pendiente = max(capital_objetivo - capital_captado, ZERO)
+
+        operacion = self._build_operacion_summary(project, snapshot, resultado)
+        settlement = self._build_investment_return_summary(
+            project=project,
+            snapshot=snapshot,
+            operation=operacion,
+            confirmed_participations=participaciones_confirmadas,
+            capital_captado=capital_captado,
+        )
+
+        return _build_project_metric_row(
+            project=project,
+            resultado=resultado,
+            beneficio_memoria=beneficio_memoria,
+            operacion=operacion,
+            settlement=settlement,
+            capital_objetivo=capital_objetivo,
+            capital_captado=capital_captado,
+            capital_pendiente=capital_pendiente,
+            participaciones_confirmadas=participaciones_confirmadas,
+        )
+
     def _build_operacion_summary(
         self,
         project: Proyecto,
@@ -837,35 +843,35 @@ class FinancialDashboardService:
             if metric["gastos_real_total"] > metric["gastos_est_total"] > 0
         ][:5]
 
-        factura_ids = set(
-            FacturaGasto.objects.filter(gasto__proyecto_id__in=project_ids).values_list("gasto_id", flat=True)
+        missing_gastos_count = dict(
+            GastoProyecto.objects.filter(proyecto_id__in=project_ids, estado="confirmado", factura__isnull=True)
+            .values("proyecto_id")
+            .annotate(total=Count("id"))
+            .values_list("proyecto_id", "total")
         )
-        justificante_ids = set(
-            JustificanteIngreso.objects.filter(ingreso__proyecto_id__in=project_ids).values_list(
-                "ingreso_id", flat=True
-            )
+        missing_ingresos_count = dict(
+            IngresoProyecto.objects.filter(proyecto_id__in=project_ids, estado="confirmado", justificante__isnull=True)
+            .values("proyecto_id")
+            .annotate(total=Count("id"))
+            .values_list("proyecto_id", "total")
         )
         missing_facturas: list[dict[str, Any]] = []
         missing_justificantes: list[dict[str, Any]] = []
         for project in projects:
-            gastos_confirmados = [gasto for gasto in project.gastos_proyecto.all() if gasto.estado == "confirmado"]
-            ingresos_confirmados = [ingreso for ingreso in project.ingresos.all() if ingreso.estado == "confirmado"]
-            missing_gastos = [gasto for gasto in gastos_confirmados if gasto.id not in factura_ids]
-            missing_ingresos = [ingreso for ingreso in ingresos_confirmados if ingreso.id not in justificante_ids]
-            if missing_gastos:
+            if missing_gastos_count.get(project.id):
                 missing_facturas.append(
                     {
                         "project_id": project.id,
                         "nombre": project.nombre or f"Proyecto {project.id}",
-                        "count": len(missing_gastos),
+                        "count": missing_gastos_count[project.id],
                     }
                 )
-            if missing_ingresos:
+            if missing_ingresos_count.get(project.id):
                 missing_justificantes.append(
                     {
                         "project_id": project.id,
                         "nombre": project.nombre or f"Proyecto {project.id}",
-                        "count": len(missing_ingresos),
+                        "count": missing_ingresos_count[project.id],
                     }
                 )
 
@@ -953,10 +959,63 @@ class FinancialDashboardService:
         }.get(state, "#f2b53b")
 
 
+def _dashboard_cache_generation() -> str:
+    generation = cache.get(DASHBOARD_CACHE_GENERATION_KEY)
+    if generation is None:
+        cache.add(DASHBOARD_CACHE_GENERATION_KEY, uuid4().hex, timeout=None)
+        generation = cache.get(DASHBOARD_CACHE_GENERATION_KEY) or ""
+    return str(generation)
+
+
+def invalidate_financial_dashboard_cache() -> None:
+    """Retire every cached dashboard payload (called from signals on the financial models)."""
+
+    try:
+        cache.set(DASHBOARD_CACHE_GENERATION_KEY, uuid4().hex, timeout=None)
+    except Exception:
+        logger.exception("No se pudo invalidar la caché del panel financiero")
+
+
+def _dashboard_cache_key(service: FinancialDashboardService) -> str:
+    scope = service._role_scope()
+    signature = {
+        "scope": scope,
+        "permissions": service.permissions,
+        # Un comercial solo ve sus tareas del checklist: su payload es suyo.
+        "user": getattr(service.user, "pk", None) if scope in {"comercial", "custom"} else None,
+        "filters": service.filters.to_dict(),
+        # Las alertas de vencimiento dependen del día.
+        "today": timezone.localdate().isoformat(),
+    }
+    digest = sha256(json.dumps(signature, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return f"financial-dashboard:payload:{_dashboard_cache_generation()}:{digest}"
+
+
 def build_financial_dashboard_data(user, filters: FinancialDashboardFilters | None = None) -> dict[str, Any]:
-    """Convenience wrapper for API views, widgets and the dashboard page."""
+    """Convenience wrapper for API views, widgets and the dashboard page.
+
+    Payloads are shared through the default cache, keyed by role scope and
+    filters, and retired as a whole whenever a financial model changes.
+    """
 
-    return FinancialDashboardService(user=user, filters=filters).build()
+    service = FinancialDashboardService(user=user, filters=filters)
+    timeout = int(getattr(settings, "FINANCIAL_DASHBOARD_CACHE_SECONDS", 300) or 0)
+    if timeout <= 0:
+        return service.build()
+    try:
+        cache_key = _dashboard_cache_key(service)
+        payload = cache.get(cache_key)
+    except Exception:
+        logger.exception("No se pudo leer la caché del panel financiero")
+        return service.build()
+    if isinstance(payload, dict):
+        return payload
+    payload = service.build()
+    try:
+        cache.set(cache_key, payload, timeout=timeout)
+    except Exception:
+        logger.exception("No se pudo guardar el panel financiero en caché")
+    return payload
 
 
 def _build_project_metric_row(
@@ -2,9 +2,12 @@ from __future__ import annotations
 
 import csv
 import json
+import multiprocessing
 import os
 import re
-from dataclasses import asdict, dataclass
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from datetime import date, datetime
 from decimal import Decimal
 from io import StringIO
 from pathlib import Path
@@ -19,11 +22,14 @@ from django.utils import timezone
 
 from core.finance import retencion_pct_for_tipo_persona
 from core.models import DatosEconomicosProyecto, GastoProyecto, IngresoProyecto, Participacion, Proyecto
+from core.services.audit_state import cached_rows, project_fingerprints, store_rows
 
 SEVERITY_LEVELS = ("info", "warning", "error", "critical")
 MONEY_TOLERANCE = Decimal("0.01")
 PERCENT_TOLERANCE = Decimal("0.01")
 ROUNDED_PERCENT_TOLERANCE = Decimal("0.05")
+AUDIT_NAME = "inversure_metricas"
+_DECIMAL_ROW_FIELDS = ("shown_value", "recalculated_value", "diff_abs", "diff_pct")
 
 
 def _decimal(value: Any, default: Decimal | None = None) -> Decimal | None:
@@ -178,16 +184,58 @@ class InversureMetricAuditService:
     def __init__(self, viewer_user: Any | None = None) -> None:
         self.viewer_user = viewer_user
         self._request_factory = RequestFactory()
+        # Panel financiero de toda la cartera, capturado una vez por auditoría.
+        # Si falta, cada proyecto lo pide filtrado por su id.
+        self._shared_dashboard: dict[str, Any] | None = None
 
-    def audit(self, *, project_id: int | None = None, limit: int | None = None) -> dict[str, Any]:
+    def audit(
+        self,
+        *,
+        project_id: int | None = None,
+        limit: int | None = None,
+        jobs: int = 1,
+        incremental: bool = False,
+    ) -> dict[str, Any]:
         projects = list(self._load_projects(project_id=project_id, limit=limit))
-        project_results = [self.audit_project(project) for project in projects]
+        fingerprints: dict[int, str] = {}
+        reused: dict[int, AuditProjectResult] = {}
+        if incremental:
+            # Lo que ve el panel depende del usuario con el que se mira.
+            scope = {"auditoria": AUDIT_NAME, "viewer_user_id": getattr(self.viewer_user, "id", None)}
+            fingerprints = project_fingerprints([project.id for project in projects], scope=scope)
+            reused = {
+                pk: _result_from_state(pk, stored[0])
+                for pk, stored in cached_rows(AUDIT_NAME, fingerprints).items()
+                if stored
+            }
+        pending = [project for project in projects if project.id not in reused]
+
+        dashboard_filters = {"proyecto_id": project_id} if project_id is not None else None
+        self._shared_dashboard = self.collect_dashboard(dashboard_filters) if pending else None
+        try:
+            if jobs > 1 and len(pending) > 1:
+                audited = self._audit_in_pool(pending, jobs)
+            else:
+                audited = [self.audit_project(project) for project in pending]
+        finally:
+            self._shared_dashboard = None
+        if incremental:
+            for project_result in audited:
+                store_rows(
+                    AUDIT_NAME,
+                    project_result.project_id,
+                    fingerprints[project_result.project_id],
+                    [_state_from_result(project_result)],
+                )
+        by_id = {**reused, **{project_result.project_id: project_result for project_result in audited}}
+        project_results = [by_id[int(project.id)] for project in projects]
         rows = [row for project_result in project_results for row in project_result.rows]
         summary = self._build_summary(project_results, rows)
         return {
             "generated_at": timezone.now().isoformat(),
             "viewer_user_id": getattr(self.viewer_user, "id", None),
             "project_count": len(projects),
+            "reused_project_count": len(reused),
             "project_results": [project_result.to_dict() for project_result in project_results],
             "rows": [row.to_dict() for row in rows],
             "summary": summary,
@@ -544,15 +592,28 @@ class InversureMetricAuditService:
 
         return metrics
 
+    def collect_dashboard(self, query: Mapping[str, Any] | None = None) -> dict[str, dict[str, Any]]:
+        """Captura el panel financiero (HTML y JSON) con los filtros dados; sin filtros, toda la cartera."""
+        return {
+            "dashboard_html": self._capture_rendered_context("core.views", self._view_request("core:dashboard", query=query)),
+            "dashboard_json": self._json_view("core.views", self._view_request("core:dashboard_data", query=query)),
+        }
+
     def collect_surfaces(self, project: Proyecto) -> dict[str, dict[str, Any]]:
-        dashboard_filters = {"proyecto_id": project.id}
+        if self._shared_dashboard is None:
+            dashboard = self.collect_dashboard({"proyecto_id": project.id})
+        else:
+            dashboard = {
+                name: self._dashboard_slice(payload, int(project.id or 0))
+                for name, payload in self._shared_dashboard.items()
+            }
         detail_request = self._view_request("core:proyecto", project.id)
         with patch("core.views._ensure_checklist_defaults", autospec=True, side_effect=lambda *_args, **_kwargs: None):
             detail_context = self._capture_rendered_context("core.views", detail_request, project.id)
         surfaces = {
             "detail": detail_context,
-            "dashboard_html": self._capture_rendered_context("core.views", self._view_request("core:dashboard", query=dashboard_filters)),
-            "dashboard_json": self._json_view("core.views", self._view_request("core:dashboard_data", query=dashboard_filters)),
+            "dashboard_html": dashboard["dashboard_html"],
+            "dashboard_json": dashboard["dashboard_json"],
             "pdf_memoria": self._capture_rendered_context("core.views", self._view_request("core:pdf_memoria_economica", project.id), project.id),
             "liquidacion_json": self._json_view("core.views", self._view_request("core:proyecto_liquidaciones", project.id), project.id),
         }
@@ -1915,6 +1976,35 @@ class InversureMetricAuditService:
                 return dict(item)
         return {}
 
+    def _dashboard_slice(self, payload: Mapping[str, Any], project_id: int) -> dict[str, Any]:
+        """La parte del panel de un proyecto, con la misma forma que el panel filtrado por él."""
+        item = self._find_dashboard_project(payload or {}, project_id)
+        if not item:
+            return {}
+        if "projects" not in payload and isinstance(payload.get("dashboard_payload"), Mapping):
+            return {"dashboard_payload": {"projects": [item]}}
+        return {"projects": [item]}
+
+    def _audit_in_pool(self, projects: list[Proyecto], jobs: int) -> list[AuditProjectResult]:
+        from django.db import connections
+
+        tasks = [
+            (
+                int(project.id),
+                {name: self._dashboard_slice(payload, int(project.id)) for name, payload in self._shared_dashboard.items()},
+            )
+            for project in projects
+        ]
+        # Cada proceso abre su propia conexión; no se hereda ninguna de aquí.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=min(jobs, len(projects)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_audit_worker,
+            initargs=(getattr(self.viewer_user, "pk", None),),
+        ) as pool:
+            return list(pool.map(_audit_project_in_worker, *zip(*tasks, strict=True)))
+
     def _get_nested(self, payload: Mapping[str, Any], *keys: str) -> Any:
         cur: Any = payload
         for key in keys:
@@ -1924,6 +2014,75 @@ class InversureMetricAuditService:
         return cur
 
 
+_worker_service: InversureMetricAuditService | None = None
+
+
+def _init_audit_worker(viewer_user_id: int | None) -> None:
+    global _worker_service
+
+    import django
+
+    django.setup()
+    from django.contrib.auth import get_user_model
+
+    viewer_user = get_user_model().objects.filter(pk=viewer_user_id).first() if viewer_user_id else None
+    _worker_service = InversureMetricAuditService(viewer_user=viewer_user)
+
+
+def _audit_project_in_worker(project_id: int, dashboard: dict[str, Any]) -> AuditProjectResult:
+    from django.db import close_old_connections
+
+    close_old_connections()
+    service = _worker_service
+    service._shared_dashboard = dashboard
+    try:
+        project = service._load_projects(project_id=project_id, limit=None).get()
+        result = service.audit_project(project)
+    finally:
+        service._shared_dashboard = None
+    # Los contextos capturados llevan modelos, formularios y querysets que no
+    # cruzan entre procesos: vuelven como datos planos.
+    return replace(result, metrics=_plain(result.metrics), surfaces=_plain(result.surfaces))
+
+
+def _state_from_result(result: AuditProjectResult) -> dict[str, Any]:
+    # Solo lo que sale en los reportes; métricas y superficies no se guardan.
+    return {
+        "project_name": result.project_name,
+        "state": result.state,
+        "liquidation_rows": _plain(result.liquidation_rows),
+        "rows": [row.to_dict() for row in result.rows],
+    }
+
+
+def _result_from_state(project_id: int, stored: Mapping[str, Any]) -> AuditProjectResult:
+    rows = []
+    for row in stored.get("rows") or []:
+        values = dict(row)
+        for field in _DECIMAL_ROW_FIELDS:
+            values[field] = _decimal(values.get(field), None)
+        rows.append(AuditComparisonRow(**values))
+    return AuditProjectResult(
+        project_id=project_id,
+        project_name=str(stored.get("project_name") or ""),
+        state=str(stored.get("state") or ""),
+        metrics={},
+        surfaces={},
+        liquidation_rows=list(stored.get("liquidation_rows") or []),
+        rows=rows,
+    )
+
+
+def _plain(value: Any) -> Any:
+    if value is None or isinstance(value, (str, bool, int, float, Decimal, date, datetime)):
+        return value
+    if isinstance(value, Mapping):
+        return {str(key): _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return str(value)
+
+
 def _extract_number(value: Any) -> Decimal | None:
     if isinstance(value, Decimal):
         return value
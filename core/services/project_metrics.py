@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from decimal import Decimal
+from hashlib import sha256
+from typing import Any, Iterable
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+
+from core.finance import limit_loss_to_capital_enabled
+from core.models import GastoProyecto, IngresoProyecto, Participacion, Proyecto, ProyectoMetricas
+
+logger = logging.getLogger(__name__)
+
+# Subir este número cuando cambie cómo se calcula una fila del panel: las filas
+# guardadas con la versión anterior dejan de usarse y se recalculan al vuelo.
+PROJECT_METRICS_VERSION = 1
+
+_DECIMAL_FIELDS = ("capital_objetivo", "capital_captado", "capital_pendiente")
+_INVESTMENT_DECIMAL_FIELDS = ("capital_invertido", "beneficio_neto", "retorno_total")
+_RETENTION_ENV_NAMES = ("INVERSOR_RETENCION_PCT", "INVERSOR_RETENCION_PCT_F", "INVERSOR_RETENCION_PCT_J")
+
+
+def project_metric_prefetches() -> tuple[Prefetch, ...]:
+    """Prefetches needed to compute one project metric row without extra queries."""
+
+    return (
+        Prefetch(
+            "gastos_proyecto",
+            queryset=GastoProyecto.objects.select_related("proyecto").order_by("fecha", "id"),
+        ),
+        Prefetch(
+            "ingresos",
+            queryset=IngresoProyecto.objects.select_related("proyecto").order_by("fecha", "id"),
+        ),
+        Prefetch(
+            "participaciones",
+            queryset=Participacion.objects.filter(estado="confirmada").select_related("cliente").order_by("creado", "id"),
+            to_attr="participaciones_confirmadas",
+        ),
+    )
+
+
+def project_metrics_signature() -> str:
+    """Fingerprint of the calculation version and of the configuration that changes its result."""
+
+    parts = {
+        "version": PROJECT_METRICS_VERSION,
+        "memoria_desde_transmision": bool(getattr(settings, "MEMORIA_BENEFICIO_NETO_DESDE_TRANSMISION", False)),
+        "limit_loss_to_capital": limit_loss_to_capital_enabled(),
+        "retencion": [os.environ.get(name) or "" for name in _RETENTION_ENV_NAMES],
+    }
+    return sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def dump_metric_row(row: dict[str, Any]) -> dict[str, Any]:
+    """Serialize a dashboard metric row for `ProyectoMetricas.datos`, keeping Decimals exact."""
+
+    data = dict(row)
+    for field in _DECIMAL_FIELDS:
+        if data.get(field) is not None:
+            data[field] = str(data[field])
+    investment = dict(data.get("investment_return") or {})
+    for field in _INVESTMENT_DECIMAL_FIELDS:
+        if investment.get(field) is not None:
+            investment[field] = str(investment[field])
+    data["investment_return"] = investment
+    data["deviation"] = dict(data.get("deviation") or {})
+    return data
+
+
+def load_metric_row(data: dict[str, Any]) -> dict[str, Any]:
+    """Inverse of `dump_metric_row`."""
+
+    row = dict(data)
+    for field in _DECIMAL_FIELDS:
+        if row.get(field) is not None:
+            row[field] = Decimal(str(row[field]))
+    investment = dict(row.get("investment_return") or {})
+    for field in _INVESTMENT_DECIMAL_FIELDS:
+        if investment.get(field) is not None:
+            investment[field] = Decimal(str(investment[field]))
+    row["investment_return"] = investment
+    row["deviation"] = dict(row.get("deviation") or {})
+    return row
+
+
+def current_project_metrics(project_ids: Iterable[int | None]) -> dict[int, ProyectoMetricas]:
+    """Stored metric rows for `project_ids` whose signature matches the running configuration."""
+
+    ids = [project_id for project_id in project_ids if project_id is not None]
+    if not ids:
+        return {}
+    signature = project_metrics_signature()
+    return {
+        metricas.proyecto_id: metricas
+        for metricas in ProyectoMetricas.objects.filter(proyecto_id__in=ids, firma=signature)
+    }
+
+
+def landing_roi(gastos: list[Any], ingresos: list[Any]) -> float | None:
+    """ROI automático de la landing: beneficio sobre gastos, real si lo hay y si no estimado."""
+
+    if not gastos and not ingresos:
+        return None
+
+    def _sum_importes(items):
+        total = Decimal("0")
+        for item in items:
+            if item is None:
+                continue
+            total += item
+        return total
+
+    def _importe_estimado(item):
+        estimado = getattr(item, "importe_estimado", None)
+        if estimado is not None:
+            return estimado
+        if getattr(item, "estado", "") == "estimado":
+            return item.importe
+        return Decimal("0")
+
+    def _importe_real(item):
+        if getattr(item, "estado", "") != "confirmado":
+            return Decimal("0")
+        real = getattr(item, "importe_real", None)
+        return real if real is not None else item.importe
+
+    ingresos_estimados = _sum_importes([_importe_estimado(i) for i in ingresos])
+    ingresos_reales = _sum_importes([_importe_real(i) for i in ingresos])
+    if ingresos_reales <= 0 and ingresos_estimados > 0:
+        ingresos_reales = ingresos_estimados
+    gastos_estimados = _sum_importes([_importe_estimado(g) for g in gastos])
+    gastos_reales = _sum_importes([_importe_real(g) for g in gastos])
+
+    beneficio_estimado = ingresos_estimados - gastos_estimados
+    beneficio_real = ingresos_reales - gastos_reales
+
+    # ROI consistente con KPIs: beneficio / gastos.
+    if ingresos_reales or gastos_reales:
+        if gastos_reales > 0:
+            return float((beneficio_real / gastos_reales) * Decimal("100"))
+    if gastos_estimados > 0:
+        return float((beneficio_estimado / gastos_estimados) * Decimal("100"))
+    return None
+
+
+def refresh_project_metrics(project_id: int) -> ProyectoMetricas | None:
+    """Recompute and store the metric row of one project."""
+
+    from core.services.financial_dashboard import FinancialDashboardService
+
+    project = (
+        Proyecto.objects.select_related("responsable_user", "origen_estudio", "origen_snapshot", "datos_economicos")
+        .filter(id=project_id)
+        .first()
+    )
+    if project is None:
+        return None
+    prefetch_related_objects([project], *project_metric_prefetches())
+    row = FinancialDashboardService(user=None).build_project_metric(project)
+    metricas, _ = ProyectoMetricas.objects.update_or_create(
+        proyecto=project,
+        defaults={
+            "firma": project_metrics_signature(),
+            "datos": dump_metric_row(row),
+            "roi_landing": landing_roi(list(project.gastos_proyecto.all()), list(project.ingresos.all())),
+        },
+    )
+    return metricas
+
+
+def _refresh_project_metrics_quietly(project_id: int) -> None:
+    try:
+        refresh_project_metrics(project_id)
+    except Exception:
+        # Sin la fila el panel recalcula el proyecto al vuelo: un fallo aquí
+        # cuesta rendimiento, no datos, y no debe tumbar el guardado que lo disparó.
+        logger.exception("No se pudieron recalcular las métricas del proyecto %s", project_id)
+
+
+def invalidate_project_metrics(project_id: int | None) -> None:
+    """Drop the stored row now and recompute it once the surrounding transaction commits."""
+
+    if not project_id:
+        return
+    ProyectoMetricas.objects.filter(proyecto_id=project_id).delete()
+    transaction.on_commit(lambda: _refresh_project_metrics_quietly(project_id))
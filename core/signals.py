@@ -0,0 +1,93 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import (
+    ChecklistItem,
+    Cliente,
+    DatosEconomicosProyecto,
+    DocumentoProyecto,
+    Estudio,
+    EstudioSnapshot,
+    FacturaGasto,
+    GastoProyecto,
+    IngresoProyecto,
+    InversorPerfil,
+    JustificanteIngreso,
+    Participacion,
+    Proyecto,
+    SolicitudParticipacion,
+)
+from . import derivados
+from .services.financial_dashboard import invalidate_financial_dashboard_cache
+from .services.project_metrics import invalidate_project_metrics
+
+
+# `ProyectoMetricas` guarda el resultado de cada proyecto ya calculado. Cualquier
+# cambio en lo que entra en ese cálculo la deja obsoleta: se borra en el acto y
+# se recalcula al confirmarse la transacción.
+
+
+@receiver(post_save, sender=Proyecto)
+@receiver(post_delete, sender=Proyecto)
+def _metricas_proyecto(sender, instance, **kwargs):
+    invalidate_project_metrics(instance.pk)
+
+
+@receiver(post_save, sender=GastoProyecto)
+@receiver(post_delete, sender=GastoProyecto)
+@receiver(post_save, sender=IngresoProyecto)
+@receiver(post_delete, sender=IngresoProyecto)
+@receiver(post_save, sender=Participacion)
+@receiver(post_delete, sender=Participacion)
+@receiver(post_save, sender=DatosEconomicosProyecto)
+@receiver(post_delete, sender=DatosEconomicosProyecto)
+def _metricas_movimiento(sender, instance, **kwargs):
+    invalidate_project_metrics(instance.proyecto_id)
+
+
+@receiver(post_save, sender=Estudio)
+@receiver(post_save, sender=EstudioSnapshot)
+def _metricas_origen(sender, instance, **kwargs):
+    # Los proyectos sin snapshot propio leen los datos de su estudio de origen.
+    field = "origen_estudio" if sender is Estudio else "origen_snapshot"
+    for proyecto_id in Proyecto.objects.filter(**{field: instance}).values_list("id", flat=True):
+        invalidate_project_metrics(proyecto_id)
+
+
+# Todo lo que pinta el panel financiero. El payload cacheado se retira en el
+# acto —para que la propia petición que escribe ya no lo lea— y otra vez al
+# confirmar, por si otro worker lo regeneró con los datos de antes entretanto.
+_MODELOS_PANEL_FINANCIERO = (
+    Proyecto,
+    GastoProyecto,
+    IngresoProyecto,
+    Participacion,
+    DatosEconomicosProyecto,
+    ChecklistItem,
+    SolicitudParticipacion,
+    FacturaGasto,
+    JustificanteIngreso,
+    InversorPerfil,
+    Cliente,
+    Estudio,
+    EstudioSnapshot,
+)
+
+
+def _panel_financiero(sender, **kwargs):
+    invalidate_financial_dashboard_cache()
+    transaction.on_commit(invalidate_financial_dashboard_cache)
+
+
+for _modelo in _MODELOS_PANEL_FINANCIERO:
+    post_save.connect(_panel_financiero, sender=_modelo, dispatch_uid=f"panel_financiero_save_{_modelo.__name__}")
+    post_delete.connect(_panel_financiero, sender=_modelo, dispatch_uid=f"panel_financiero_delete_{_modelo.__name__}")
+
+
+# Las miniaturas y vistas de un documento no sirven sin él. Se borran al
+# confirmar, para no perderlas si la transacción se deshace.
+@receiver(post_delete, sender=DocumentoProyecto)
+def _derivados_documento(sender, instance, **kwargs):
+    archivo = instance.archivo
+    transaction.on_commit(lambda: derivados.borrar_derivados(archivo))
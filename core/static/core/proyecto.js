@@ -3585,9 +3585,37 @@ function bindComunicaciones() {
     }
     if (elTitulo) elTitulo.value = "";
     if (elMensaje) elMensaje.value = "";
+    let data = null;
+    try { data = await resp.json(); } catch (e) {}
+    if (data && data.estado_url && resp.status === 202) {
+      await waitForEnvio(data.estado_url);
+    }
     await loadRows();
   });
 
+  // El envío lo hace un proceso aparte: se consulta su avance hasta que acaba.
+  async function waitForEnvio(estadoUrl) {
+    const label = btnSend.textContent;
+    btnSend.disabled = true;
+    try {
+      for (;;) {
+        const resp = await fetch(estadoUrl, { headers: { "X-Requested-With": "XMLHttpRequest" } });
+        const estado = await resp.json();
+        if (!estado || !estado.ok) return;
+        btnSend.textContent = `Enviando… ${estado.total - estado.pendientes}/${estado.total}`;
+        if (estado.finalizado) {
+          if (estado.errores) alert(`No se pudo enviar a ${estado.errores} inversores.`);
+          return;
+        }
+        await new Promise(resolve => setTimeout(resolve, 3000));
+      }
+    } catch (e) {
+    } finally {
+      btnSend.disabled = false;
+      btnSend.textContent = label;
+    }
+  }
+
   loadRows();
 }
 
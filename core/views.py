@@ -13,11 +13,11 @@ from django.urls import reverse
 from django.utils.http import urlencode
 from django.db import transaction
 from django.db import IntegrityError
-from django.db.models import Sum, Count, Max, Prefetch, Min, OuterRef, Subquery, Q
+from django.db.models import Sum, Count, Max, Prefetch, Min, OuterRef, Subquery, Q, prefetch_related_objects
 from django.core.paginator import Paginator
 from django.utils import timezone
 from django.conf import settings
-from django.core.mail import send_mail, EmailMultiAlternatives
+from django.core.mail import EmailMessage, EmailMultiAlternatives
 from django.core.files.base import ContentFile
 from django.template.loader import render_to_string
 from django.templatetags.static import static
@@ -26,34 +26,38 @@ from django.contrib.staticfiles import finders
 from django.utils.text import slugify
 from django.contrib.auth.models import User
 
+from collections import OrderedDict
 from copy import deepcopy
 from types import SimpleNamespace
 from typing import Any, Iterable
 
 import json
 import os
-import shutil
+import threading
+import time
 import unicodedata
 import boto3
 import base64
 import mimetypes
-from functools import lru_cache
+from functools import cached_property, lru_cache
 from decimal import Decimal
 from datetime import date, datetime, timedelta
 from urllib.request import Request, urlopen
 
-import requests
-
 from django.db import connection
 
 from .models import Estudio, Proyecto
 from .models import EstudioSnapshot, ProyectoSnapshot
 from .models import GastoProyecto, IngresoProyecto, ChecklistItem
 from .models import FirmaContrato, IntentoPinPortal
+from .models import EnvioComunicacion, EnvioComunicacionDestinatario
 from .models import Cliente, Participacion, InversorPerfil, InversorPushSubscription, SolicitudParticipacion, ComunicacionInversor, DocumentoProyecto, DocumentoInversor, FacturaGasto, JustificanteIngreso
 from .contratos import condiciones as condiciones_prestamo
 from .contratos import condiciones_baja, condiciones_cuenta_participe
 from .pdf import render_pdf
+from .catastro import CatastroClient
+from . import derivados
+from .correo import conexion_compartida, enviar as enviar_correo
 from .correo_contratos import enviar_codigo_contrato, enviar_contrato_firmado, enviar_invitacion_firma
 from .firmas import ErrorFirma
 from .firmas import comprobar_codigo as comprobar_codigo_firma
@@ -68,7 +72,9 @@ from .security import (
     FicheroNoPermitido,
     comprobar_fichero,
 )
-from .services.financial_dashboard import FinancialDashboardFilters, FinancialDashboardService
+from .services.financial_dashboard import FinancialDashboardFilters, build_financial_dashboard_data
+from .services import communication_jobs
+from .services.project_metrics import current_project_metrics
 from accounts.utils import (
     is_admin_user,
     is_comercial_user,
@@ -217,6 +223,27 @@ def _sanitize_pdf_message_html(raw_html: str) -> str:
         return escape(raw_html or "", quote=False).replace("\n", "<br>")
 
 
+# Las URLs firmadas se reutilizan durante una fracción de su validez: así una
+# misma página (o varias seguidas) no vuelve a firmar el mismo documento, y la
+# URL que se entrega conserva siempre al menos 3/4 del plazo pedido.
+_S3_URL_MEMO_MAX = 4096
+_s3_url_memo: OrderedDict[tuple, str] = OrderedDict()
+_s3_url_memo_lock = threading.Lock()
+
+
+@lru_cache(maxsize=4)
+def _s3_client(region: str | None, access_key: str, secret_key: str):
+    # Crear el cliente carga los modelos de servicio de botocore y cuesta decenas
+    # de milisegundos; firmar es un HMAC local. El cliente es thread-safe, así
+    # que basta uno por proceso y juego de credenciales.
+    return boto3.client(
+        "s3",
+        region_name=region,
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+    )
+
+
 def _s3_presigned_url(key: str, expires_seconds: int | None = None) -> str:
     if not key:
         return ""
@@ -228,20 +255,26 @@ def _s3_presigned_url(key: str, expires_seconds: int | None = None) -> str:
     region = getattr(settings, "AWS_S3_REGION_NAME", None)
     if not bucket or not access_key or not secret_key:
         return ""
+    ventana = max(1, expires_seconds // 4)
+    memo_key = (bucket, key, expires_seconds, int(time.time()) // ventana)
+    with _s3_url_memo_lock:
+        url = _s3_url_memo.get(memo_key)
+        if url is not None:
+            _s3_url_memo.move_to_end(memo_key)
+            return url
     try:
-        client = boto3.client(
-            "s3",
-            region_name=region,
-            aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-        )
-        return client.generate_presigned_url(
+        url = _s3_client(region, access_key, secret_key).generate_presigned_url(
             "get_object",
             Params={"Bucket": bucket, "Key": key},
             ExpiresIn=expires_seconds,
         )
     except Exception:
         return ""
+    with _s3_url_memo_lock:
+        _s3_url_memo[memo_key] = url
+        while len(_s3_url_memo) > _S3_URL_MEMO_MAX:
+            _s3_url_memo.popitem(last=False)
+    return url
 
 
 @require_GET
@@ -646,33 +679,19 @@ def _send_inversor_email(request, perfil: InversorPerfil, titulo: str, mensaje:
       </p>
     </div>
     """
-    try:
-        if attachments:
-            email = EmailMultiAlternatives(
-                titulo,
-                cuerpo,
-                from_email,
-                [to_email],
-            )
-            email.attach_alternative(html_message, "text/html")
-            for filename, content, mime in attachments:
-                try:
-                    email.attach(filename, content, mime)
-                except Exception:
-                    pass
-            email.send(fail_silently=True)
-        else:
-            send_mail(
-                titulo,
-                cuerpo,
-                from_email,
-                [to_email],
-                html_message=html_message,
-                fail_silently=True,
-            )
-        return True
-    except Exception:
-        return False
+    email = EmailMultiAlternatives(
+        titulo,
+        cuerpo,
+        from_email,
+        [to_email],
+    )
+    email.attach_alternative(html_message, "text/html")
+    for filename, content, mime in attachments or []:
+        try:
+            email.attach(filename, content, mime)
+        except Exception:
+            pass
+    return enviar_correo(email).enviado
 
 
 def _crear_comunicacion(request, perfil: InversorPerfil, proyecto: Proyecto | None, titulo: str, mensaje: str, attachments=None):
@@ -718,9 +737,17 @@ def _guardar_pdf_comunicacion_inversor(
 
 
 def _admin_notify_users():
+    # Una sola consulta: antes se recorrían todos los usuarios activos y cada
+    # `is_admin_user` pedía su `UserAccess` por separado. Los roles se filtran en
+    # SQL por lo que pueden ser; la comprobación final (acentos, mayúsculas)
+    # sigue siendo la de `is_admin_user`/`is_direccion_user`.
     users = []
     try:
-        for u in User.objects.filter(is_active=True):
+        candidatos = User.objects.filter(
+            Q(is_superuser=True) | Q(user_access__role__gt=""),
+            is_active=True,
+        ).select_related("user_access")
+        for u in candidatos:
             if is_admin_user(u) or is_direccion_user(u):
                 users.append(u)
     except Exception:
@@ -766,10 +793,9 @@ def _admin_notify(request, proyecto: Proyecto | None, titulo: str, mensaje: str)
             emails.append(email)
     if emails:
         from_email = getattr(settings, "DEFAULT_FROM_EMAIL", "") or getattr(settings, "EMAIL_HOST_USER", "") or ""
-        try:
-            send_mail(f"[Inversure] {titulo}", body, from_email, emails, fail_silently=True)
-        except Exception:
-            pass
+        # Un aviso interno que no sale no debe tumbar la acción que lo dispara;
+        # `enviar_correo` deja el fallo en el log en lugar de tragárselo.
+        enviar_correo(EmailMessage(f"[Inversure] {titulo}", body, from_email, emails))
 
     # In-app: registrar comunicación para admins con perfil inversor asociado (si existe)
     for u in users:
@@ -834,7 +860,10 @@ def _pdf_document_kind_from_template(template_key: str | None, titulo: str | Non
     return "comunicacion"
 
 
-def _proyecto_listo_para_liquidacion(proyecto: Proyecto) -> tuple[bool, str | None]:
+def _proyecto_listo_para_liquidacion(
+    proyecto: Proyecto,
+    memoria: _MemoriaProyecto | None = None,
+) -> tuple[bool, str | None]:
     estado = (getattr(proyecto, "estado", "") or "").strip().lower()
     if estado not in {"vendido", "cerrado"}:
         return False, "La carta de liquidación solo puede enviarse en proyectos vendidos o cerrados."
@@ -856,12 +885,10 @@ def _proyecto_listo_para_liquidacion(proyecto: Proyecto) -> tuple[bool, str | No
     if not ingresos_confirmados:
         return False, "No hay ingresos confirmados imputables al inversor para emitir la liquidación."
 
-    snapshot = _get_snapshot_comunicacion(proyecto)
-    resultado = _resultado_desde_memoria(
-        proyecto,
-        snapshot if isinstance(snapshot, dict) else {},
-        only_imputable_inversores=True,
-    )
+    # `memoria` debe venir del snapshot de comunicación, el mismo que se usaría aquí.
+    if memoria is None:
+        memoria = _MemoriaProyecto(proyecto, _get_snapshot_comunicacion(proyecto))
+    resultado = memoria.resultado_inversores
     if float(resultado.get("valor_transmision") or 0.0) <= 0:
         return False, "El valor de transmision imputable al inversor no esta cerrado."
 
@@ -1843,35 +1870,67 @@ def _build_anexos_cover_pdf(request) -> bytes | None:
         return None
 
 
-def _merge_pdf_with_anexos(carta_pdf: bytes, anexos: list[DocumentoProyecto], request=None) -> bytes | None:
-    if not carta_pdf:
-        return None
-    try:
+class _AnexosPdf:
+    """
+    Portada "Anexos del inmueble" y anexos ya unidos en un solo PDF.
+
+    Una comunicación a todo el proyecto lleva los mismos anexos en cada carta.
+    Antes cada carta volvía a descargarlos del almacenamiento (S3), a leerlos
+    con `PdfReader` y a maquetar la portada con WeasyPrint; así se hace una
+    vez por envío y a cada carta solo se le añaden estas páginas.
+    """
+
+    def __init__(self, anexos: Iterable[DocumentoProyecto], request=None):
+        self.anexos = list(anexos or [])
+        self.request = request
+
+    @cached_property
+    def contenido(self) -> bytes | None:
         from io import BytesIO
         from pypdf import PdfReader, PdfWriter
 
-        writer = PdfWriter()
-        carta_reader = PdfReader(BytesIO(carta_pdf))
-        for page in carta_reader.pages:
-            writer.add_page(page)
-        anexos_readers = []
-        for doc in anexos:
+        readers = []
+        for doc in self.anexos:
             try:
                 if not doc.archivo.name.lower().endswith(".pdf"):
                     continue
                 with doc.archivo.open("rb") as f:
-                    anexos_readers.append(PdfReader(f))
+                    readers.append(PdfReader(BytesIO(f.read())))
             except Exception:
                 continue
-        if anexos_readers:
-            cover_pdf = _build_anexos_cover_pdf(request)
-            if cover_pdf:
-                cover_reader = PdfReader(BytesIO(cover_pdf))
-                for page in cover_reader.pages:
-                    writer.add_page(page)
-            for reader in anexos_readers:
-                for page in reader.pages:
-                    writer.add_page(page)
+        if not readers:
+            return None
+        writer = PdfWriter()
+        cover_pdf = _build_anexos_cover_pdf(self.request)
+        if cover_pdf:
+            readers.insert(0, PdfReader(BytesIO(cover_pdf)))
+        for reader in readers:
+            for page in reader.pages:
+                writer.add_page(page)
+        buffer = BytesIO()
+        writer.write(buffer)
+        return buffer.getvalue()
+
+
+def _merge_pdf_with_anexos(
+    carta_pdf: bytes,
+    anexos: list[DocumentoProyecto] | _AnexosPdf,
+    request=None,
+) -> bytes | None:
+    if not carta_pdf:
+        return None
+    paquete = anexos if isinstance(anexos, _AnexosPdf) else _AnexosPdf(anexos, request)
+    try:
+        from io import BytesIO
+        from pypdf import PdfReader, PdfWriter
+
+        writer = PdfWriter()
+        for page in PdfReader(BytesIO(carta_pdf)).pages:
+            writer.add_page(page)
+        anexos_pdf = paquete.contenido
+        if anexos_pdf:
+            for page in PdfReader(BytesIO(anexos_pdf)).pages:
+                writer.add_page(page)
         buffer = BytesIO()
         writer.write(buffer)
         return buffer.getvalue()
@@ -1906,55 +1965,34 @@ def _documento_url(request, documento: DocumentoProyecto) -> str:
     )
 
 
+def _derivado_url(request, documento: DocumentoProyecto, ruta: str) -> str:
+    signed = _s3_presigned_url(ruta)
+    if signed:
+        return signed
+    try:
+        url = documento.archivo.storage.url(ruta)
+    except Exception:
+        return ""
+    return request.build_absolute_uri(url) if request else url
+
+
 def _documento_image_url(request, documento: DocumentoProyecto) -> str:
-    nombre = (documento.archivo.name or "").lower()
-    if nombre.endswith(".pdf"):
-        try:
-            from io import BytesIO
-            from pdf2image import convert_from_bytes
-            poppler_path = getattr(settings, "POPPLER_PATH", "") or os.environ.get("POPPLER_PATH", "")
-            if not poppler_path:
-                pdftoppm_path = shutil.which("pdftoppm")
-                if pdftoppm_path:
-                    poppler_path = os.path.dirname(pdftoppm_path)
-            with documento.archivo.open("rb") as f:
-                pdf_bytes = f.read()
-            convert_kwargs = {"first_page": 1, "last_page": 1, "dpi": 150}
-            if poppler_path:
-                convert_kwargs["poppler_path"] = poppler_path
-            images = convert_from_bytes(pdf_bytes, **convert_kwargs)
-            if not images:
-                return ""
-            buf = BytesIO()
-            images[0].save(buf, format="PNG")
-            data = base64.b64encode(buf.getvalue()).decode("ascii")
-            return f"data:image/png;base64,{data}"
-        except Exception:
-            logging.getLogger(__name__).exception(
-                "Fallo al convertir PDF a imagen (pdf2image) para documento %s",
-                documento.id,
-            )
-        try:
-            import fitz  # PyMuPDF
-            from io import BytesIO
+    if not derivados.es_pdf(documento.archivo.name):
+        return _documento_foto_url(request, documento, "portada")
+    # La primera página se rasteriza una vez y se guarda junto al original; aquí
+    # solo se da su URL, en vez de meter el PNG entero en el HTML.
+    ruta = derivados.derivado(documento.archivo, "vista")
+    if not ruta:
+        return ""
+    return _derivado_url(request, documento, ruta)
 
-            with documento.archivo.open("rb") as f:
-                pdf_bytes = f.read()
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-            if doc.page_count < 1:
-                return ""
-            page = doc.load_page(0)
-            pix = page.get_pixmap(dpi=150)
-            buf = BytesIO(pix.tobytes("png"))
-            data = base64.b64encode(buf.getvalue()).decode("ascii")
-            return f"data:image/png;base64,{data}"
-        except Exception:
-            logging.getLogger(__name__).exception(
-                "Fallo al convertir PDF a imagen (pymupdf) para documento %s",
-                documento.id,
-            )
-            return ""
-    return _documento_url(request, documento)
+
+def _documento_foto_url(request, documento: DocumentoProyecto, caja: str) -> str:
+    """URL de la foto reducida a lo que ocupa en el PDF; la original si ya cabe."""
+    ruta = derivados.copia_impresion(documento.archivo, caja)
+    if not ruta or ruta == documento.archivo.name:
+        return _documento_url(request, documento)
+    return _derivado_url(request, documento, ruta)
 
 
 def _find_key_recursive(obj, key):
@@ -1982,53 +2020,7 @@ def _find_first_key_recursive(obj, keys):
 
 
 def _catastro_coords_from_refcat(refcat: str):
-    refcat = (refcat or "").replace(" ", "").strip().upper()
-    if not refcat:
-        return None
-    base_urls = [
-        "https://ovc.catastro.meh.es/OVCServWeb/OVCWcfCallejero/COVCCoordenadas.svc/json/Consulta_CPMRC",
-    ]
-    candidates = [refcat]
-    if len(refcat) >= 14:
-        candidates.append(refcat[:14])
-    if len(refcat) >= 18:
-        candidates.append(refcat[:18])
-    seen = set()
-    for candidate in candidates:
-        if not candidate or candidate in seen:
-            continue
-        seen.add(candidate)
-        rc14 = candidate[:14] if len(candidate) >= 14 else ""
-        rc1 = rc14[:7] if len(rc14) == 14 else ""
-        rc2 = rc14[7:14] if len(rc14) == 14 else ""
-        query_variants = [
-            {"RefCat": candidate, "SRS": "EPSG:4326"},
-        ]
-        if rc1 and rc2:
-            query_variants.append({"RC1": rc1, "RC2": rc2, "SRS": "EPSG:4326"})
-            query_variants.append({"RC": rc14, "SRS": "EPSG:4326"})
-        for base_url in base_urls:
-            for params in query_variants:
-                try:
-                    resp = requests.get(
-                        base_url,
-                        params=params,
-                        headers={"User-Agent": "Inversure/1.0"},
-                        timeout=(2, 2),
-                    )
-                    if resp.status_code != 200:
-                        continue
-                    data = resp.json()
-                    xcen = _find_key_recursive(data, "xcen")
-                    ycen = _find_key_recursive(data, "ycen")
-                    if xcen is None or ycen is None:
-                        continue
-                    xcen = str(xcen).replace(",", ".")
-                    ycen = str(ycen).replace(",", ".")
-                    return float(xcen), float(ycen)
-                except Exception:
-                    continue
-    return None
+    return CatastroClient().coordenadas(refcat)
 
 
 def _catastro_wms_url_from_refcat(refcat: str, width=1200, height=900):
@@ -2056,58 +2048,7 @@ def _catastro_wms_url_from_refcat(refcat: str, width=1200, height=900):
 
 
 def _catastro_datos_no_protegidos(refcat: str):
-    refcat = (refcat or "").replace(" ", "").strip().upper()
-    if not refcat:
-        return None
-    candidates = [refcat]
-    if len(refcat) >= 14:
-        candidates.append(refcat[:14])
-    if len(refcat) >= 18:
-        candidates.append(refcat[:18])
-    base_urls = [
-        "https://ovc.catastro.meh.es/OVCServWeb/OVCWcfCallejero/COVCCallejero.svc/json/Consulta_DNPRC",
-        "https://ovc.catastro.meh.es/OVCServWeb/OVCWcfCallejero/COVCCallejeroCodigos.svc/json/Consulta_DNPRC_Codigos",
-    ]
-    for candidate in candidates:
-        if not candidate:
-            continue
-        for base_url in base_urls:
-            try:
-                resp = requests.get(
-                    base_url,
-                    params={"RefCat": candidate},
-                    headers={"User-Agent": "Inversure/1.0"},
-                    timeout=(2, 2),
-                )
-                if resp.status_code != 200:
-                    continue
-                data = resp.json()
-            except Exception:
-                continue
-            luso = _find_key_recursive(data, "luso")
-            ant = _find_key_recursive(data, "ant")
-            sfc = _find_key_recursive(data, "sfc")
-            ss = _find_first_key_recursive(data, ["ssf", "ss"])
-            cpt = _find_first_key_recursive(data, ["cpt", "cup"])
-            ldt = _find_first_key_recursive(data, ["ldt", "dir", "ldir"])
-            np = _find_key_recursive(data, "np")
-            nm = _find_key_recursive(data, "nm")
-            nombre_provincia = _find_first_key_recursive(data, ["npn", "npv", "provincia"])
-            if any(v is not None for v in (luso, ant, sfc, ss, ldt, nm, np)):
-                return {
-                    "ref_catastral": candidate,
-                    "uso": luso,
-                    "antiguedad": ant,
-                    "superficie_construida": sfc,
-                    "superficie_solar": ss,
-                    "coef_participacion": cpt,
-                    "direccion": ldt,
-                    "municipio": nm,
-                    "provincia": nombre_provincia,
-                    "numero": np,
-                    "raw": data,
-                }
-    return None
+    return CatastroClient().datos_no_protegidos(refcat)
 
 
 def _catastro_datos_pdf_bytes(request, datos: dict):
@@ -2148,7 +2089,7 @@ def _documento_pdf_bytes(request, documento: DocumentoProyecto) -> bytes | None:
     mime, _ = mimetypes.guess_type(nombre)
     if not mime or not mime.startswith("image/"):
         return None
-    img_url = _documento_url(request, documento)
+    img_url = _documento_foto_url(request, documento, "pagina")
     html = render_to_string(
         "core/pdf_anexo_documento.html",
         {
@@ -2196,7 +2137,7 @@ def _can_preview_facturas(user) -> bool:
     return False
 
 
-def _respuesta_pdf(request, respuesta, nombre_fichero: str):
+def _respuesta_pdf(request, respuesta, nombre_fichero: str, *, cachear: bool = False):
     """
     Convierte en PDF una respuesta ya renderizada por `render()`.
 
@@ -2212,12 +2153,14 @@ def _respuesta_pdf(request, respuesta, nombre_fichero: str):
     Si WeasyPrint no arranca —necesita pango y cairo— también, y se deja
     constancia en el log: en una pantalla de uso diario vale más el informe en
     HTML que un error 500.
+
+    `cachear` se pasa a `render_pdf`: solo para informes sin datos personales.
     """
     if request.GET.get("html"):
         return respuesta
 
     try:
-        pdf = render_pdf(respuesta.content.decode("utf-8"), request.build_absolute_uri("/"))
+        pdf = render_pdf(respuesta.content.decode("utf-8"), request.build_absolute_uri("/"), cachear=cachear)
     except Exception:
         logging.getLogger(__name__).exception("Fallo al generar el PDF de %s; se devuelve el HTML", nombre_fichero)
         return respuesta
@@ -2264,40 +2207,7 @@ def _build_presentacion_png(request, context: dict) -> bytes | None:
 
 
 def _pdf_bytes_to_png(pdf_bytes: bytes, dpi: int = 150) -> bytes | None:
-    if not pdf_bytes:
-        return None
-    try:
-        import fitz  # PyMuPDF
-
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        if doc.page_count < 1:
-            return None
-        page = doc.load_page(0)
-        pix = page.get_pixmap(dpi=dpi)
-        return pix.tobytes("png")
-    except Exception:
-        logging.getLogger(__name__).exception("Fallo al convertir PDF a PNG con PyMuPDF")
-    try:
-        from io import BytesIO
-        from pdf2image import convert_from_bytes
-
-        poppler_path = getattr(settings, "POPPLER_PATH", "") or os.environ.get("POPPLER_PATH", "")
-        if not poppler_path:
-            pdftoppm_path = shutil.which("pdftoppm")
-            if pdftoppm_path:
-                poppler_path = os.path.dirname(pdftoppm_path)
-        convert_kwargs = {"first_page": 1, "last_page": 1, "dpi": dpi}
-        if poppler_path:
-            convert_kwargs["poppler_path"] = poppler_path
-        images = convert_from_bytes(pdf_bytes, **convert_kwargs)
-        if not images:
-            return None
-        buf = BytesIO()
-        images[0].save(buf, format="PNG")
-        return buf.getvalue()
-    except Exception:
-        logging.getLogger(__name__).exception("Fallo al convertir PDF a PNG con pdf2image")
-        return None
+    return derivados.png_de_pdf(pdf_bytes, dpi)
 
 
 def _build_presentacion_context(request, proyecto: Proyecto) -> dict:
@@ -2370,7 +2280,7 @@ def _build_presentacion_context(request, proyecto: Proyecto) -> dict:
     def _foto_url_for(doc):
         if not doc:
             return ""
-        return _documento_url(request, doc)
+        return _documento_foto_url(request, doc, "portada")
 
     foto_url = _foto_url_for(foto_doc_pdf)
     foto_url_feed = _foto_url_for(foto_doc_feed)
@@ -2447,24 +2357,20 @@ def _build_presentacion_context(request, proyecto: Proyecto) -> dict:
         semaforo_label = "Revisar operación"
     roi_bar = max(0.0, min(roi_val, 30.0)) / 30.0 * 100.0
 
-    fotos_urls = []
-    for doc in anexos_docs:
-        if doc.categoria != "fotografias":
-            continue
-        fotos_urls.append(_documento_url(request, doc))
-    if not fotos_urls:
-        fotos_docs = DocumentoProyecto.objects.filter(
-            proyecto=proyecto, categoria="fotografias", usar_dossier=True
-        ).order_by("-creado", "-id")
-        if fotos_docs.exists():
-            for doc in fotos_docs:
-                fotos_urls.append(_documento_url(request, doc))
-        else:
-            fotos_docs = DocumentoProyecto.objects.filter(
-                proyecto=proyecto, categoria="fotografias"
-            ).order_by("-es_principal", "-creado", "-id")[:2]
-            for doc in fotos_docs:
-                fotos_urls.append(_documento_url(request, doc))
+    fotos_docs = [doc for doc in anexos_docs if doc.categoria == "fotografias"]
+    if not fotos_docs:
+        fotos_docs = list(
+            DocumentoProyecto.objects.filter(
+                proyecto=proyecto, categoria="fotografias", usar_dossier=True
+            ).order_by("-creado", "-id")
+        )
+        if not fotos_docs:
+            fotos_docs = list(
+                DocumentoProyecto.objects.filter(
+                    proyecto=proyecto, categoria="fotografias"
+                ).order_by("-es_principal", "-creado", "-id")[:2]
+            )
+    fotos_urls = [_documento_foto_url(request, doc, "detalle") for doc in fotos_docs]
 
     context = {
         "proyecto": proyecto,
@@ -2478,7 +2384,9 @@ def _build_presentacion_context(request, proyecto: Proyecto) -> dict:
         "estilo": estilo,
         "formato": "pdf",
         "foto_url": foto_url,
-        "descripcion_foto_url": fotos_urls[0] if fotos_urls else foto_url,
+        "descripcion_foto_url": (
+            _documento_foto_url(request, fotos_docs[0], "cabecera") if fotos_docs else foto_url
+        ),
         "logo_data_uri": _logo_data_uri("core/logo_inversure_blanco.png"),
         "inmueble": inmueble,
         "resultado": resultado,
@@ -2761,11 +2669,7 @@ def _ensure_checklist_defaults(proyecto: Proyecto) -> None:
     )
 
 
-def _resultado_desde_memoria(
-    proyecto: Proyecto,
-    snapshot: dict,
-    only_imputable_inversores: bool = False,
-) -> dict:
+def _movimientos_memoria(proyecto: Proyecto) -> tuple[list, list]:
     # Preferir related managers (aprovecha prefetch si existe) con fallback a queries directas.
     try:
         gastos = list(proyecto.gastos_proyecto.all())
@@ -2775,6 +2679,19 @@ def _resultado_desde_memoria(
         ingresos = list(proyecto.ingresos.all())
     except Exception:
         ingresos = list(IngresoProyecto.objects.filter(proyecto=proyecto))
+    return gastos, ingresos
+
+
+def _resultado_desde_memoria(
+    proyecto: Proyecto,
+    snapshot: dict,
+    only_imputable_inversores: bool = False,
+    *,
+    gastos: list | None = None,
+    ingresos: list | None = None,
+) -> dict:
+    if gastos is None or ingresos is None:
+        gastos, ingresos = _movimientos_memoria(proyecto)
 
     if only_imputable_inversores:
         gastos = [g for g in gastos if bool(getattr(g, "imputable_inversores", True))]
@@ -3773,7 +3690,10 @@ def _build_checklist_users_context(usuarios_responsables: Iterable[Any]) -> list
 
 def _capital_objetivo_desde_memoria(proyecto: Proyecto, snapshot: dict | None = None) -> float:
     snap = snapshot if isinstance(snapshot, dict) else {}
-    resultado = _resultado_desde_memoria(proyecto, snap)
+    return _capital_objetivo_desde_resultado(_resultado_desde_memoria(proyecto, snap), proyecto)
+
+
+def _capital_objetivo_desde_resultado(resultado: dict, proyecto: Proyecto) -> float:
     gastos_real = _safe_float(resultado.get("gastos_real_total"), 0.0)
     if gastos_real > 0:
         return gastos_real
@@ -3791,20 +3711,19 @@ def _capital_objetivo_desde_memoria(proyecto: Proyecto, snapshot: dict | None =
     return capital_objetivo
 
 
-def _beneficio_estimado_real_memoria(proyecto: Proyecto) -> dict:
+def _beneficio_estimado_real_memoria(
+    proyecto: Proyecto,
+    *,
+    gastos: list | None = None,
+    ingresos: list | None = None,
+) -> dict:
     # Por el gestor de la relación, no por `objects.filter(proyecto=...)`: así
     # aprovecha el prefetch cuando lo hay, igual que hace
     # `_resultado_desde_memoria`. Consultando directo se lo saltaba, y el panel
     # financiero acababa pidiendo los gastos y los ingresos de cada proyecto uno
     # por uno pese a traerlos ya cargados.
-    try:
-        gastos = list(proyecto.gastos_proyecto.all())
-    except Exception:
-        gastos = list(GastoProyecto.objects.filter(proyecto=proyecto))
-    try:
-        ingresos = list(proyecto.ingresos.all())
-    except Exception:
-        ingresos = list(IngresoProyecto.objects.filter(proyecto=proyecto))
+    if gastos is None or ingresos is None:
+        gastos, ingresos = _movimientos_memoria(proyecto)
 
     def _sum_importes(items):
         total = Decimal("0")
@@ -3847,6 +3766,51 @@ def _beneficio_estimado_real_memoria(proyecto: Proyecto) -> dict:
     }
 
 
+class _MemoriaProyecto:
+    """Cálculos de memoria de un proyecto, hechos una sola vez.
+
+    Resultado, capital objetivo y beneficio estimado/real salen de los mismos
+    gastos e ingresos. Llamando a cada helper por separado se listaban y se
+    recorrían tres veces, y el capital objetivo volvía a calcular el resultado
+    entero. Aquí los movimientos se leen una vez y cada cálculo se guarda la
+    primera vez que se pide.
+    """
+
+    def __init__(self, proyecto: Proyecto, snapshot: dict | None = None):
+        self.proyecto = proyecto
+        self.snapshot = snapshot if isinstance(snapshot, dict) else {}
+
+    @cached_property
+    def movimientos(self) -> tuple[list, list]:
+        return _movimientos_memoria(self.proyecto)
+
+    @cached_property
+    def resultado(self) -> dict:
+        gastos, ingresos = self.movimientos
+        return _resultado_desde_memoria(self.proyecto, self.snapshot, gastos=gastos, ingresos=ingresos)
+
+    @cached_property
+    def resultado_inversores(self) -> dict:
+        """Resultado contando solo los movimientos imputables a los inversores."""
+        gastos, ingresos = self.movimientos
+        return _resultado_desde_memoria(
+            self.proyecto,
+            self.snapshot,
+            only_imputable_inversores=True,
+            gastos=gastos,
+            ingresos=ingresos,
+        )
+
+    @cached_property
+    def capital_objetivo(self) -> float:
+        return _capital_objetivo_desde_resultado(self.resultado, self.proyecto)
+
+    @cached_property
+    def beneficio_estimado_real(self) -> dict:
+        gastos, ingresos = self.movimientos
+        return _beneficio_estimado_real_memoria(self.proyecto, gastos=gastos, ingresos=ingresos)
+
+
 def _roi_memoria_proyecto(proyecto: Proyecto):
     gastos = list(GastoProyecto.objects.filter(proyecto=proyecto))
     ingresos = list(IngresoProyecto.objects.filter(proyecto=proyecto))
@@ -4624,7 +4588,7 @@ def _dashboard_context_from_payload(user, dashboard: dict[str, Any]) -> dict[str
 
 
 def _build_dashboard_context(user, filters: FinancialDashboardFilters | None = None):
-    dashboard = FinancialDashboardService(user, filters=filters).build()
+    dashboard = build_financial_dashboard_data(user, filters=filters)
     return _dashboard_context_from_payload(user, dashboard)
 
 
@@ -4697,15 +4661,15 @@ def otros_proyectos(request):
 
     conciertos = _ensure_conciertos_project()
     try:
-        snap = _get_snapshot(conciertos)
-        conciertos.capital_objetivo = _capital_objetivo_desde_memoria(conciertos, snap)
+        memoria = _MemoriaProyecto(conciertos, _get_snapshot(conciertos))
+        conciertos.capital_objetivo = memoria.capital_objetivo
         conciertos.capital_captado = (
             Participacion.objects.filter(proyecto=conciertos, estado="confirmada")
             .aggregate(total=Sum("importe_invertido"))
             .get("total")
             or 0
         )
-        conciertos.roi = (_resultado_desde_memoria(conciertos, snap) or {}).get("roi", 0)
+        conciertos.roi = (memoria.resultado or {}).get("roi", 0)
     except Exception:
         conciertos.capital_objetivo = 0
         conciertos.capital_captado = 0
@@ -4718,15 +4682,15 @@ def otros_proyectos(request):
     )
     for proyecto in otros:
         try:
-            snap = _get_snapshot(proyecto)
-            proyecto.capital_objetivo = _capital_objetivo_desde_memoria(proyecto, snap)
+            memoria = _MemoriaProyecto(proyecto, _get_snapshot(proyecto))
+            proyecto.capital_objetivo = memoria.capital_objetivo
             proyecto.capital_captado = (
                 Participacion.objects.filter(proyecto=proyecto, estado="confirmada")
                 .aggregate(total=Sum("importe_invertido"))
                 .get("total")
                 or 0
             )
-            proyecto.roi = (_resultado_desde_memoria(proyecto, snap) or {}).get("roi", 0)
+            proyecto.roi = (memoria.resultado or {}).get("roi", 0)
         except Exception:
             proyecto.capital_objetivo = 0
             proyecto.capital_captado = 0
@@ -4773,7 +4737,7 @@ def dashboard_data(request):
         return JsonResponse({"ok": False, "error": "No tienes acceso al panel."}, status=403)
 
     filters = FinancialDashboardFilters.from_mapping(request.GET)
-    payload = FinancialDashboardService(request.user, filters=filters).build()
+    payload = build_financial_dashboard_data(request.user, filters=filters)
     return JsonResponse(payload)
 
 
@@ -5005,10 +4969,6 @@ def lista_proyectos(request):
     # proyecto en cada visita al listado.
     all_active = (
         Proyecto.objects.select_related("origen_snapshot", "origen_estudio")
-        # `_resultado_desde_memoria` recorre los gastos y los ingresos de cada
-        # proyecto. Su propio comentario dice «aprovecha prefetch si existe»,
-        # pero nadie se lo daba: eran dos consultas por proyecto en cada visita.
-        .prefetch_related("gastos_proyecto", "ingresos")
         .exclude(estado__in=estados_cerrados)
         .order_by("-id")
     )
@@ -5067,43 +5027,38 @@ def lista_proyectos(request):
         ):
             captado_map[row["proyecto_id"]] = _as_float(row.get("total"), 0.0)
 
-    def _capital_objetivo_desde_resultado(resultado: dict, proyecto: Proyecto) -> float:
-        capital_objetivo = _as_float(resultado.get("gastos_real_total"), 0.0)
-        if capital_objetivo > 0:
-            return capital_objetivo
-        capital_objetivo = _as_float(resultado.get("gastos_est_total"), 0.0)
-        if capital_objetivo > 0:
-            return capital_objetivo
-        capital_objetivo = _as_float(resultado.get("valor_adquisicion"), 0.0)
-        if capital_objetivo <= 0:
-            capital_objetivo = _as_float(
-                getattr(proyecto, "precio_compra_inmueble", None)
-                or getattr(proyecto, "precio_propiedad", None)
-                or 0.0,
-                0.0,
-            )
-        return capital_objetivo
+    # Las métricas ya calculadas salen de `ProyectoMetricas`; solo los proyectos
+    # sin fila vigente recorren sus gastos e ingresos, y solo para esos se
+    # precargan (`_resultado_desde_memoria` aprovecha el prefetch si existe).
+    metricas_guardadas = current_project_metrics(proyectos_ids)
+    prefetch_related_objects(
+        [p for p in proyectos if p.id not in metricas_guardadas],
+        "gastos_proyecto",
+        "ingresos",
+    )
 
     # Enriquecer cada proyecto con métricas heredadas (sin exigir cambios en el template)
     for p in proyectos:
         try:
             snap = _get_snapshot(p)
-            resultado = None
+            metricas = metricas_guardadas.get(p.id)
 
-            try:
-                resultado = _resultado_desde_memoria(p, snap)
-            except Exception:
-                pass
-
-            try:
-                capital_objetivo = _capital_objetivo_desde_resultado(resultado, p) if resultado is not None else 0.0
-            except Exception:
-                capital_objetivo = 0.0
+            if metricas is not None:
+                capital_objetivo = _as_float(metricas.datos.get("capital_objetivo"), 0.0)
+                roi = _as_float(metricas.datos.get("roi"), 0.0)
+            else:
+                # Mismo snapshot que el panel financiero, para que el listado
+                # muestre lo mismo tenga o no la fila guardada.
+                memoria = _MemoriaProyecto(p, _get_snapshot_comunicacion(p))
+                try:
+                    capital_objetivo = _as_float(memoria.capital_objetivo, 0.0)
+                except Exception:
+                    capital_objetivo = 0.0
 
-            try:
-                roi = _as_float(resultado.get("roi"), 0.0) if resultado is not None else 0.0
-            except Exception:
-                roi = 0.0
+                try:
+                    roi = _as_float(memoria.resultado.get("roi"), 0.0)
+                except Exception:
+                    roi = 0.0
 
             # Capital captado: suma de participaciones confirmadas del proyecto
             capital_captado = _as_float(captado_map.get(p.id), 0.0)
@@ -5232,17 +5187,17 @@ def lista_proyectos_cerrados(request):
     for p in proyectos:
         try:
             snap = _get_snapshot(p)
+            memoria = _MemoriaProyecto(p, snap)
 
             try:
-                capital_objetivo = _as_float(_capital_objetivo_desde_memoria(p, snap), 0.0)
+                capital_objetivo = _as_float(memoria.capital_objetivo, 0.0)
             except Exception:
                 capital_objetivo = 0.0
 
             capital_captado = _as_float(captado_map.get(p.id), 0.0)
 
             try:
-                resultado = _resultado_desde_memoria(p, snap)
-                roi = _as_float(resultado.get("roi"), 0.0)
+                roi = _as_float(memoria.resultado.get("roi"), 0.0)
             except Exception:
                 roi = 0.0
 
@@ -5451,15 +5406,28 @@ def inversores_list(request):
         messages.error(request, "No tienes acceso a los inversores.")
         return redirect("core:home")
 
+    # La búsqueda y la paginación van en SQL: el DNI, el email y el teléfono
+    # están cifrados, y filtrar en Python obligaba a descifrar todos los clientes
+    # en cada búsqueda. `Cliente.search_q` busca por nombre y por los hashes de
+    # prefijos que mantiene `_sync_hashes`. Solo se cargan y se descifran los
+    # clientes de la página visible.
+    q = (request.GET.get("q") or "").strip().lower()
+    clientes_qs = Cliente.objects.order_by("nombre", "id")
+    total_inversores = clientes_qs.count()
+    if q:
+        clientes_qs = clientes_qs.filter(Cliente.search_q(q))
+
+    paginator = Paginator(clientes_qs, 8)
+    page_obj = paginator.get_page(request.GET.get("page"))
+
     participaciones_qs = Participacion.objects.select_related("proyecto").filter(
         estado="confirmada"
     ).order_by("-creado")
-    clientes_base = Cliente.objects.all().order_by("nombre").prefetch_related(
-        Prefetch("participaciones", queryset=participaciones_qs, to_attr="participaciones_confirmadas")
+    clientes = list(page_obj.object_list)
+    prefetch_related_objects(
+        clientes,
+        Prefetch("participaciones", queryset=participaciones_qs, to_attr="participaciones_confirmadas"),
     )
-    # `clientes_base` se materializa aquí y se reutiliza: recorrerlo y luego
-    # pedirle los ids con `values_list` ejecutaba la consulta dos veces.
-    clientes = list(clientes_base)
 
     # Antes esto era un `get_or_create` por cliente: una consulta por cada uno
     # —con 38 inversores, 38 consultas— y además una escritura en una petición
@@ -5488,6 +5456,15 @@ def inversores_list(request):
     perfiles_ids = [p.id for p in perfiles_map.values()]
     cliente_ids = [c.id for c in clientes]
 
+    # Los totales de la cabecera son de todos los inversores, no de la página.
+    resumen = Participacion.objects.filter(estado="confirmada").aggregate(
+        total=Sum("importe_invertido"),
+        num=Count("id"),
+    )
+    total_invertido = float(resumen.get("total") or 0)
+    total_participaciones = int(resumen.get("num") or 0)
+    total_pendientes = SolicitudParticipacion.objects.filter(estado="pendiente").count()
+
     totales = {
         row["cliente_id"]: row
         for row in (
@@ -5539,6 +5516,8 @@ def inversores_list(request):
         )
     }
 
+    # Los documentos se cargan y se firman solo para los inversores de la página
+    # visible: firmarlos todos costaba en proporción al total de documentos.
     docs_por_inversor = {}
     if perfiles_ids:
         for d in DocumentoInversor.objects.filter(inversor_id__in=perfiles_ids).order_by("-creado"):
@@ -5546,10 +5525,6 @@ def inversores_list(request):
             docs_por_inversor.setdefault(d.inversor_id, []).append(d)
 
     inversores = []
-    total_invertido = 0
-    total_participaciones = 0
-    total_pendientes = 0
-
     for cliente in clientes:
         perfil = perfiles_map.get(cliente.id)
         if not perfil:
@@ -5557,11 +5532,8 @@ def inversores_list(request):
         total_row = totales.get(cliente.id, {})
         total_cli = float(total_row.get("total") or 0)
         num_part = int(total_row.get("num") or 0)
-        total_invertido += total_cli
-        total_participaciones += num_part
 
         pend = int(solicitudes_pend.get(perfil.id, 0))
-        total_pendientes += pend
 
         comm = comunicaciones.get(perfil.id, {})
         ultima_com = comm.get("ultima")
@@ -5589,31 +5561,12 @@ def inversores_list(request):
             }
         )
 
-    q = (request.GET.get("q") or "").strip().lower()
-    inversores_filtrados = inversores
-    if q:
-        def _hay_match(inv):
-            cliente = inv.get("cliente")
-            if not cliente:
-                return False
-            campos = [
-                getattr(cliente, "nombre", ""),
-                getattr(cliente, "dni_cif", ""),
-                getattr(cliente, "email", ""),
-                getattr(cliente, "telefono", ""),
-            ]
-            return any(q in (str(c) or "").lower() for c in campos)
-        inversores_filtrados = [inv for inv in inversores if _hay_match(inv)]
-
-    paginator = Paginator(inversores_filtrados, 8)
-    page_obj = paginator.get_page(request.GET.get("page"))
-
     ctx = {
-        "inversores": page_obj.object_list,
+        "inversores": inversores,
         "page_obj": page_obj,
         "q": q,
-        "total_inversores": len(inversores),
-        "total_inversores_filtrados": len(inversores_filtrados),
+        "total_inversores": total_inversores,
+        "total_inversores_filtrados": paginator.count,
         "total_invertido": total_invertido,
         "total_participaciones": total_participaciones,
         "total_pendientes": total_pendientes,
@@ -5832,16 +5785,21 @@ def _build_inversor_portal_context(perfil: InversorPerfil, internal_view: bool)
         ):
             totales_proyecto_all[row["proyecto_id"]] = float(row.get("total") or 0)
 
-    capital_objetivo_cache: dict[int, float] = {}
+    # Un inversor suele tener varias participaciones en el mismo proyecto: la
+    # memoria de cada proyecto se calcula una vez y se comparte entre todas.
+    memorias: dict[int, _MemoriaProyecto] = {}
+
+    def _memoria(p: Proyecto) -> _MemoriaProyecto:
+        if p.id not in memorias:
+            memorias[p.id] = _MemoriaProyecto(p, _get_snapshot(p))
+        return memorias[p.id]
+
     for part in participaciones:
         proyecto = part.proyecto
         if not proyecto:
             continue
         try:
-            if proyecto.id not in capital_objetivo_cache:
-                snap = _get_snapshot(proyecto)
-                capital_objetivo_cache[proyecto.id] = float(_capital_objetivo_desde_memoria(proyecto, snap) or 0.0)
-            cap_obj = float(capital_objetivo_cache.get(proyecto.id) or 0.0)
+            cap_obj = float(_memoria(proyecto).capital_objetivo or 0.0)
         except Exception:
             cap_obj = 0.0
         base_pct = 0.0
@@ -5882,16 +5840,12 @@ def _build_inversor_portal_context(perfil: InversorPerfil, internal_view: bool)
         if total_proj <= 0:
             continue
         try:
-            snap = _get_snapshot(proyecto)
-            resultado = _resultado_desde_memoria(
-                proyecto,
-                snap,
-                only_imputable_inversores=True,
-            )
+            memoria = _memoria(proyecto)
+            resultado = memoria.resultado_inversores
             reparto = _calc_beneficio_inversor(
                 part=p,
                 proyecto=proyecto,
-                snapshot=snap if isinstance(snap, dict) else {},
+                snapshot=memoria.snapshot,
                 resultado_mem=resultado if isinstance(resultado, dict) else {},
                 total_proj=float(total_proj or 0.0),
             )
@@ -6005,10 +5959,8 @@ def _build_inversor_portal_context(perfil: InversorPerfil, internal_view: bool)
     proyectos_abiertos = []
     for p in proyectos_candidatos:
         try:
-            snap = _get_snapshot(p)
-
             # Capital objetivo: total de gastos (real/estimado) desde memoria
-            capital_objetivo = _capital_objetivo_desde_memoria(p, snap)
+            capital_objetivo = _memoria(p).capital_objetivo
 
             capital_captado = captado_map.get(p.id, 0.0)
 
@@ -7873,6 +7825,7 @@ def pdf_estudio_preview(request, estudio_id: int):
         request,
         render(request, "core/pdf_estudio_rentabilidad.html", ctx),
         "informe-rentabilidad-{}".format(slugify(getattr(estudio, "nombre", "")) or estudio.id),
+        cachear=True,
     )
 
 
@@ -8032,6 +7985,7 @@ def pdf_memoria_economica(request, proyecto_id: int):
         request,
         render(request, "core/pdf_memoria_economica.html", ctx),
         "memoria-economica-{}".format(slugify(proyecto.nombre or "") or proyecto.id),
+        cachear=True,
     )
 
 
@@ -8982,11 +8936,7 @@ def proyecto_liquidaciones(request, proyecto_id: int):
     try:
         snapshot = _get_snapshot_comunicacion(proyecto)
         resultado_mem = (
-            _resultado_desde_memoria(
-                proyecto,
-                snapshot,
-                only_imputable_inversores=True,
-            )
+            _MemoriaProyecto(proyecto, snapshot).resultado_inversores
             if isinstance(snapshot, dict)
             else {}
         )
@@ -9609,25 +9559,26 @@ def proyecto_difusion(request, proyecto_id: int):
         attachment = None
 
     enviados = 0
-    for perfil in perfiles:
-        part = SimpleNamespace(
-            cliente=perfil.cliente,
-            importe_invertido=0,
-            beneficio_neto_override=None,
-            beneficio_override_data={},
-        )
-        ctx = _build_comunicacion_context(proyecto, part, snapshot, resultado_mem, 0.0)
-        try:
-            ctx["portal_link"] = request.build_absolute_uri(
-                reverse("core:inversor_portal", args=[perfil.token])
+    with conexion_compartida():
+        for perfil in perfiles:
+            part = SimpleNamespace(
+                cliente=perfil.cliente,
+                importe_invertido=0,
+                beneficio_neto_override=None,
+                beneficio_override_data={},
             )
-        except Exception:
-            ctx["portal_link"] = ""
-        titulo, mensaje = _render_comunicacion_template("presentacion", ctx)
-        if not titulo or not mensaje:
-            continue
-        _crear_comunicacion(request, perfil, proyecto, titulo, mensaje, attachments=attachment)
-        enviados += 1
+            ctx = _build_comunicacion_context(proyecto, part, snapshot, resultado_mem, 0.0)
+            try:
+                ctx["portal_link"] = request.build_absolute_uri(
+                    reverse("core:inversor_portal", args=[perfil.token])
+                )
+            except Exception:
+                ctx["portal_link"] = ""
+            titulo, mensaje = _render_comunicacion_template("presentacion", ctx)
+            if not titulo or not mensaje:
+                continue
+            _crear_comunicacion(request, perfil, proyecto, titulo, mensaje, attachments=attachment)
+            enviados += 1
 
     if enviados:
         messages.success(request, f"Difusión enviada a {enviados} destinatarios.")
@@ -9636,6 +9587,73 @@ def proyecto_difusion(request, proyecto_id: int):
     return redirect(f"{reverse('core:proyecto', args=[proyecto_id])}#vista-inversores")
 
 
+def _total_confirmado_proyecto(proyecto: Proyecto) -> float:
+    total = (
+        Participacion.objects.filter(proyecto=proyecto, estado="confirmada")
+        .aggregate(total=Sum("importe_invertido"))
+        .get("total")
+        or 0
+    )
+    return float(total or 0)
+
+
+def _adjunto_comunicacion(template_key: str) -> tuple[str, str]:
+    document_kind = _pdf_document_kind_from_template(template_key) if template_key else ""
+    filename_prefix = "certificado_retenciones" if document_kind == "retenciones" else "liquidacion" if document_kind == "liquidacion" else "carta_inversure"
+    return document_kind, filename_prefix
+
+
+def _enviar_comunicacion_participacion(
+    request,
+    proyecto: Proyecto,
+    part: Participacion,
+    *,
+    template_key: str = "",
+    titulo: str = "",
+    mensaje: str = "",
+    anexos: list[DocumentoProyecto] | _AnexosPdf | None = None,
+    snapshot: dict | None = None,
+    resultado_mem: dict | None = None,
+    total_proj: float = 0.0,
+) -> bool:
+    """Carta, anexos y correo de una comunicación a un partícipe. False si la plantilla sale vacía."""
+    perfil, _ = InversorPerfil.objects.get_or_create(cliente=part.cliente)
+    anexos = anexos or []
+    attachment_name = "carta_inversure.pdf"
+    if template_key:
+        ctx = _build_comunicacion_context(proyecto, part, snapshot, resultado_mem or {}, total_proj)
+        try:
+            ctx["portal_link"] = request.build_absolute_uri(reverse("core:inversor_portal", args=[perfil.token]))
+        except Exception:
+            ctx["portal_link"] = ""
+        titulo, mensaje = _render_comunicacion_template(template_key, ctx)
+        if not titulo or not mensaje:
+            return False
+        document_kind, filename_prefix = _adjunto_comunicacion(template_key)
+        attachment_name = f"{filename_prefix}.pdf"
+    attachments = None
+    carta_pdf = _build_carta_pdf(request, titulo, mensaje, perfil, proyecto, template_key=template_key or None)
+    merged_pdf = _merge_pdf_with_anexos(carta_pdf, anexos, request=request) if carta_pdf else None
+    if merged_pdf:
+        attachments = [(attachment_name, merged_pdf, "application/pdf")]
+    # El correo va primero: si no sale, la excepción deja el destinatario para
+    # reintentarlo sin haber guardado antes ni la comunicación ni el PDF, que
+    # se duplicarían en el siguiente intento.
+    if not _send_inversor_email(request, perfil, titulo, mensaje, attachments=attachments) and perfil.cliente.email:
+        raise RuntimeError("No se pudo enviar el correo al inversor.")
+    if merged_pdf and template_key and _template_requires_settlement(template_key):
+        _guardar_pdf_comunicacion_inversor(
+            perfil=perfil,
+            proyecto=proyecto,
+            titulo=titulo,
+            pdf_bytes=merged_pdf,
+            categoria="retenciones" if document_kind == "retenciones" else "comunicaciones",
+            filename_prefix=filename_prefix,
+        )
+    ComunicacionInversor.objects.create(inversor=perfil, proyecto=proyecto, titulo=titulo, mensaje=mensaje)
+    return True
+
+
 def proyecto_comunicaciones(request, proyecto_id: int):
     try:
         proyecto = Proyecto.objects.get(id=proyecto_id)
@@ -9705,52 +9723,33 @@ def proyecto_comunicaciones(request, proyecto_id: int):
         )
         total_destinatarios = participaciones.count()
 
-        total_proj = (
-            Participacion.objects.filter(proyecto=proyecto, estado="confirmada")
-            .aggregate(total=Sum("importe_invertido"))
-            .get("total")
-            or 0
-        )
-        total_proj = float(total_proj or 0)
-
-        snapshot = _get_snapshot_comunicacion(proyecto)
-        resultado_mem = (
-            _resultado_desde_memoria(
-                proyecto,
-                snapshot,
-                only_imputable_inversores=True,
-            )
-            if isinstance(snapshot, dict)
-            else {}
-        )
-
-        def _build_context(part: Participacion, perfil: InversorPerfil | None = None) -> dict:
-            ctx = _build_comunicacion_context(proyecto, part, snapshot, resultado_mem, total_proj)
-            if perfil and request is not None:
-                try:
-                    portal_url = request.build_absolute_uri(reverse("core:inversor_portal", args=[perfil.token]))
-                    ctx["portal_link"] = portal_url
-                except Exception:
-                    ctx["portal_link"] = ""
-            else:
-                ctx["portal_link"] = ""
-            return ctx
-
+        titulo = (data.get("titulo") or "").strip()
+        mensaje = (data.get("mensaje") or "").strip()
         if template_key:
             if not total_destinatarios:
                 return JsonResponse({"ok": False, "error": "No hay inversores confirmados en el proyecto."}, status=400)
+            snapshot = _get_snapshot_comunicacion(proyecto)
+            memoria = _MemoriaProyecto(proyecto, snapshot)
             if _template_requires_settlement(template_key):
-                ok_liquidacion, liquidacion_error = _proyecto_listo_para_liquidacion(proyecto)
+                ok_liquidacion, liquidacion_error = _proyecto_listo_para_liquidacion(proyecto, memoria)
                 if not ok_liquidacion:
                     return JsonResponse({"ok": False, "error": liquidacion_error}, status=400)
-            document_kind = _pdf_document_kind_from_template(template_key)
-            filename_prefix = "certificado_retenciones" if document_kind == "retenciones" else "liquidacion" if document_kind == "liquidacion" else "carta_inversure"
-            attachment_name = f"{filename_prefix}.pdf"
 
             if preview_only:
                 part = participaciones.first()
                 perfil = InversorPerfil.objects.filter(cliente=part.cliente).first()
-                ctx = _build_context(part, perfil=perfil)
+                resultado_mem = memoria.resultado_inversores if isinstance(snapshot, dict) else {}
+                ctx = _build_comunicacion_context(
+                    proyecto, part, snapshot, resultado_mem, _total_confirmado_proyecto(proyecto)
+                )
+                ctx["portal_link"] = ""
+                if perfil:
+                    try:
+                        ctx["portal_link"] = request.build_absolute_uri(
+                            reverse("core:inversor_portal", args=[perfil.token])
+                        )
+                    except Exception:
+                        pass
                 titulo, mensaje = _render_comunicacion_template(template_key, ctx)
                 return JsonResponse(
                     {
@@ -9760,52 +9759,53 @@ def proyecto_comunicaciones(request, proyecto_id: int):
                         "destinatarios": total_destinatarios,
                     }
                 )
-
-            count = 0
-            for part in participaciones:
-                perfil, _ = InversorPerfil.objects.get_or_create(cliente=part.cliente)
-                ctx = _build_context(part, perfil=perfil)
-                titulo, mensaje = _render_comunicacion_template(template_key, ctx)
-                if not titulo or not mensaje:
-                    continue
-                attachments = None
-                carta_pdf = _build_carta_pdf(request, titulo, mensaje, perfil, proyecto, template_key=template_key)
-                merged_pdf = _merge_pdf_with_anexos(carta_pdf, anexos, request=request) if carta_pdf else None
-                if merged_pdf:
-                    attachments = [(attachment_name, merged_pdf, "application/pdf")]
-                    if _template_requires_settlement(template_key):
-                        _guardar_pdf_comunicacion_inversor(
-                            perfil=perfil,
-                            proyecto=proyecto,
-                            titulo=titulo,
-                            pdf_bytes=merged_pdf,
-                            categoria="retenciones" if document_kind == "retenciones" else "comunicaciones",
-                            filename_prefix=filename_prefix,
-                        )
-                _crear_comunicacion(request, perfil, proyecto, titulo, mensaje, attachments=attachments)
-                count += 1
-            return JsonResponse({"ok": True, "enviadas": count})
-
-        titulo = (data.get("titulo") or "").strip()
-        mensaje = (data.get("mensaje") or "").strip()
-        if not titulo or not mensaje:
+            # Con plantilla, cada carta se redacta para su destinatario al enviarla.
+            titulo = mensaje = ""
+        elif not titulo or not mensaje:
             return JsonResponse({"ok": False, "error": "Título y mensaje son obligatorios"}, status=400)
 
-        count = 0
-        for part in participaciones:
-            perfil, _ = InversorPerfil.objects.get_or_create(cliente=part.cliente)
-            attachments = None
-            carta_pdf = _build_carta_pdf(request, titulo, mensaje, perfil, proyecto)
-            merged_pdf = _merge_pdf_with_anexos(carta_pdf, anexos, request=request) if carta_pdf else None
-            if merged_pdf:
-                attachments = [("carta_inversure.pdf", merged_pdf, "application/pdf")]
-            _crear_comunicacion(request, perfil, proyecto, titulo, mensaje, attachments=attachments)
-            count += 1
-        return JsonResponse({"ok": True, "enviadas": count})
+        # Con decenas de inversores generar las cartas y los correos aquí
+        # superaba el tiempo de gunicorn. Se deja el encargo y, si hay worker
+        # (COMUNICACIONES_EN_SEGUNDO_PLANO), lo manda `procesar_comunicaciones`
+        # mientras la página consulta el avance en `estado_url`.
+        envio = communication_jobs.enqueue_communication(
+            proyecto,
+            participaciones,
+            user=request.user,
+            template_key=template_key,
+            titulo=titulo,
+            mensaje=mensaje,
+            anexos=anexos,
+            base_url=request.build_absolute_uri("/"),
+        )
+        payload = {
+            "ok": True,
+            "envio_id": envio.id,
+            "destinatarios": total_destinatarios,
+            "estado_url": reverse("core:proyecto_comunicacion_envio", args=[proyecto.id, envio.id]),
+        }
+        if getattr(settings, "COMUNICACIONES_EN_SEGUNDO_PLANO", False):
+            return JsonResponse(payload, status=202)
+        resumen = communication_jobs.process_pending(envio_id=envio.id, retry_delay=0)
+        payload["enviadas"] = resumen[EnvioComunicacionDestinatario.Estado.ENVIADO]
+        return JsonResponse(payload)
     except Exception as e:
         return JsonResponse({"ok": False, "error": str(e)}, status=400)
 
 
+@require_GET
+def proyecto_comunicacion_envio(request, proyecto_id: int, envio_id: int):
+    proyecto = Proyecto.objects.filter(id=proyecto_id).first()
+    if proyecto is None:
+        return JsonResponse({"ok": False, "error": "Proyecto no encontrado"}, status=404)
+    if not _user_can_view_project(request.user, proyecto):
+        return JsonResponse({"ok": False, "error": "No tienes permisos para ver este proyecto."}, status=403)
+    envio = EnvioComunicacion.objects.filter(id=envio_id, proyecto=proyecto).first()
+    if envio is None:
+        return JsonResponse({"ok": False, "error": "Envío no encontrado"}, status=404)
+    return JsonResponse({"ok": True, **communication_jobs.status_payload(envio)})
+
+
 def inversor_comunicacion_preview(request, perfil_id: int):
     if not _user_can_view_inversores(request.user):
         return JsonResponse({"ok": False, "error": "No tienes acceso a los inversores."}, status=403)
@@ -9841,15 +9841,8 @@ def inversor_comunicacion_preview(request, perfil_id: int):
             )
 
         snapshot = _get_snapshot_comunicacion(proyecto)
-        resultado_mem = (
-            _resultado_desde_memoria(
-                proyecto,
-                snapshot,
-                only_imputable_inversores=True,
-            )
-            if isinstance(snapshot, dict)
-            else {}
-        )
+        memoria = _MemoriaProyecto(proyecto, snapshot)
+        resultado_mem = memoria.resultado_inversores if isinstance(snapshot, dict) else {}
         total_proj = (
             Participacion.objects.filter(proyecto=proyecto, estado="confirmada")
             .aggregate(total=Sum("importe_invertido"))
@@ -9869,7 +9862,7 @@ def inversor_comunicacion_preview(request, perfil_id: int):
 
         if template_key:
             if _template_requires_settlement(template_key):
-                ok_liquidacion, liquidacion_error = _proyecto_listo_para_liquidacion(proyecto)
+                ok_liquidacion, liquidacion_error = _proyecto_listo_para_liquidacion(proyecto, memoria)
                 if not ok_liquidacion:
                     return JsonResponse({"ok": False, "error": liquidacion_error}, status=400)
             titulo, mensaje = _render_comunicacion_template(template_key, ctx)
@@ -9940,15 +9933,8 @@ def inversor_comunicacion_send(request, perfil_id: int):
             )
 
         snapshot = _get_snapshot_comunicacion(proyecto)
-        resultado_mem = (
-            _resultado_desde_memoria(
-                proyecto,
-                snapshot,
-                only_imputable_inversores=True,
-            )
-            if isinstance(snapshot, dict)
-            else {}
-        )
+        memoria = _MemoriaProyecto(proyecto, snapshot)
+        resultado_mem = memoria.resultado_inversores if isinstance(snapshot, dict) else {}
         total_proj = (
             Participacion.objects.filter(proyecto=proyecto, estado="confirmada")
             .aggregate(total=Sum("importe_invertido"))
@@ -9968,7 +9954,7 @@ def inversor_comunicacion_send(request, perfil_id: int):
 
         if template_key:
             if _template_requires_settlement(template_key):
-                ok_liquidacion, liquidacion_error = _proyecto_listo_para_liquidacion(proyecto)
+                ok_liquidacion, liquidacion_error = _proyecto_listo_para_liquidacion(proyecto, memoria)
                 if not ok_liquidacion:
                     return JsonResponse({"ok": False, "error": liquidacion_error}, status=400)
             titulo, mensaje = _render_comunicacion_template(template_key, ctx)
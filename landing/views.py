@@ -1,6 +1,5 @@
 import logging
 import os
-from decimal import Decimal
 from xml.sax.saxutils import escape
 
 from django.conf import settings
@@ -15,6 +14,7 @@ from django.templatetags.static import static
 from django.utils import timezone
 
 from core.models import DocumentoProyecto, GastoProyecto, IngresoProyecto, Proyecto
+from core.services.project_metrics import current_project_metrics, landing_roi
 from core.views import _build_dashboard_context, _s3_presigned_url
 from .models import LandingLead, Noticia
 
@@ -127,50 +127,10 @@ def landing_home(request):
             return default
 
     def _roi_memoria(proyecto):
-        gastos = list(GastoProyecto.objects.filter(proyecto=proyecto))
-        ingresos = list(IngresoProyecto.objects.filter(proyecto=proyecto))
-        if not gastos and not ingresos:
-            return None
-
-        def _sum_importes(items):
-            total = Decimal("0")
-            for item in items:
-                if item is None:
-                    continue
-                total += item
-            return total
-
-        def _importe_estimado(item):
-            estimado = getattr(item, "importe_estimado", None)
-            if estimado is not None:
-                return estimado
-            if getattr(item, "estado", "") == "estimado":
-                return item.importe
-            return Decimal("0")
-
-        def _importe_real(item):
-            if getattr(item, "estado", "") != "confirmado":
-                return Decimal("0")
-            real = getattr(item, "importe_real", None)
-            return real if real is not None else item.importe
-
-        ingresos_estimados = _sum_importes([_importe_estimado(i) for i in ingresos])
-        ingresos_reales = _sum_importes([_importe_real(i) for i in ingresos])
-        if ingresos_reales <= 0 and ingresos_estimados > 0:
-            ingresos_reales = ingresos_estimados
-        gastos_estimados = _sum_importes([_importe_estimado(g) for g in gastos])
-        gastos_reales = _sum_importes([_importe_real(g) for g in gastos])
-
-        beneficio_estimado = ingresos_estimados - gastos_estimados
-        beneficio_real = ingresos_reales - gastos_reales
-
-        # ROI consistente con KPIs: beneficio / gastos.
-        if ingresos_reales or gastos_reales:
-            if gastos_reales > 0:
-                return float((beneficio_real / gastos_reales) * Decimal("100"))
-        if gastos_estimados > 0:
-            return float((beneficio_estimado / gastos_estimados) * Decimal("100"))
-        return None
+        return landing_roi(
+            list(GastoProyecto.objects.filter(proyecto=proyecto)),
+            list(IngresoProyecto.objects.filter(proyecto=proyecto)),
+        )
 
     hero = {
         "tag": "Inversión inmobiliaria con trazabilidad real",
@@ -225,13 +185,16 @@ def landing_home(request):
             return doc.archivo.url
 
     proyectos = []
-    for proyecto in Proyecto.objects.filter(mostrar_en_landing=True).order_by("-id"):
+    proyectos_landing = list(Proyecto.objects.filter(mostrar_en_landing=True).order_by("-id"))
+    metricas_guardadas = current_project_metrics(proyecto.id for proyecto in proyectos_landing)
+    for proyecto in proyectos_landing:
         extra = getattr(proyecto, "extra", None)
         landing_cfg = extra.get("landing", {}) if isinstance(extra, dict) else {}
         beneficio_raw = landing_cfg.get("beneficio_neto_pct")
         beneficio_val = _as_float(beneficio_raw)
         if beneficio_val is None:
-            beneficio_val = _roi_memoria(proyecto)
+            metricas = metricas_guardadas.get(proyecto.id)
+            beneficio_val = metricas.roi_landing if metricas is not None else _roi_memoria(proyecto)
         plazo_raw = landing_cfg.get("plazo_meses")
         plazo_val = _as_float(plazo_raw, _as_float(getattr(proyecto, "meses", None)))
         focus_x = _as_float(landing_cfg.get("imagen_focus_x"), 50.0)
@@ -2,6 +2,7 @@ import csv
 
 from django import forms
 from django.contrib import admin, messages
+from django.db import transaction
 from django.http import HttpResponse
 from django.shortcuts import redirect, render
 from django.urls import path, reverse
@@ -261,15 +262,56 @@ class PedidoAdmin(admin.ModelAdmin):
         return respuesta
 
 
+class PapeletaForm(forms.ModelForm):
+    class Meta:
+        model = Papeleta
+        fields = ("estado", "reserva_expira", "pedido")
+
+    def clean(self):
+        datos = super().clean()
+        # Una reserva sin pedido no la confirma nadie, y sin caducidad no la
+        # libera nadie: la papeleta quedaría fuera de la venta para siempre.
+        if datos.get("estado") == Papeleta.Estado.RESERVADA and not (
+            datos.get("pedido") and datos.get("reserva_expira")
+        ):
+            raise forms.ValidationError("Una papeleta reservada necesita pedido y fecha de caducidad de la reserva.")
+        return datos
+
+
 @admin.register(Papeleta)
 class PapeletaAdmin(admin.ModelAdmin):
+    form = PapeletaForm
     list_display = ("numero", "sorteo", "estado", "pedido")
     list_filter = ("estado", "sorteo")
     search_fields = ("numero",)
+    # Cambiar una papeleta de sorteo o de número, o borrarla, descuadraría los
+    # contadores y la versión de ocupación. Aquí solo se cambia el estado.
+    readonly_fields = ("sorteo", "numero")
 
     def has_add_permission(self, request):
         return False
 
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def save_model(self, request, obj, form, change):
+        # El estado de antes se lee con la papeleta bloqueada: si una reserva o
+        # un pago la cambian mientras el formulario está abierto, el movimiento
+        # de los contadores sale del estado real y no del que se vio.
+        with transaction.atomic():
+            antes = Papeleta.objects.select_for_update().filter(pk=obj.pk).values_list("estado", flat=True).first()
+            super().save_model(request, obj, form, change)
+            if antes == obj.estado:
+                return
+            destino = {
+                Papeleta.Estado.LIBRE: "libres",
+                Papeleta.Estado.RESERVADA: "reservadas",
+                Papeleta.Estado.PAGADA: "pagadas",
+            }[obj.estado]
+            Sorteo.registrar_cambio_ocupacion(
+                obj.sorteo_id, **{destino: [obj.numero]}, movimientos={antes: -1, obj.estado: 1}
+            )
+
 
 @admin.register(EstudioRifa)
 class EstudioRifaAdmin(admin.ModelAdmin):
@@ -15,6 +15,8 @@ from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.urls import reverse
 
+from core.correo import enviar
+
 log = logging.getLogger(__name__)
 
 
@@ -32,11 +34,12 @@ def _enviar(asunto, plantilla, contexto, destinatario):
             from_email=settings.DEFAULT_FROM_EMAIL,
             to=[destinatario],
         )
-        mensaje.send(fail_silently=False)
-        return True
     except Exception:
-        log.exception("No se pudo enviar %s a %s", plantilla, destinatario)
+        log.exception("No se pudo preparar %s para %s", plantilla, destinatario)
         return False
+    # Reutiliza la conexión SMTP del proceso: con muchas compras seguidas el
+    # saludo y el TLS de cada correo eran casi todo el tiempo del envío.
+    return enviar(mensaje).enviado
 
 
 def confirmar_alta(interesado):
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from sorteo.services import cuadrar_contadores
+
+
+class Command(BaseCommand):
+    help = (
+        "Comprueba los contadores de papeletas de cada sorteo (libres, reservadas, "
+        "pagadas) contra la tabla de papeletas. Con --apply corrige los que no cuadren."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sorteo-id", type=int, action="append", help="Solo este sorteo. Puede repetirse.")
+        parser.add_argument("--apply", action="store_true", help="Corregir los contadores que no cuadren.")
+
+    def handle(self, *args, **options):
+        aplicar = bool(options.get("apply"))
+        descuadres = cuadrar_contadores(options.get("sorteo_id"), aplicar=aplicar)
+        for sorteo, guardados, reales in descuadres:
+            diferencias = ", ".join(
+                "{} {} → {}".format(campo, guardados[campo], reales[campo])
+                for campo in guardados
+                if guardados[campo] != reales[campo]
+            )
+            self.stdout.write("{} · {}: {}".format(sorteo.pk, sorteo, diferencias))
+        if not descuadres:
+            self.stdout.write(self.style.SUCCESS("Todos los contadores cuadran."))
+        elif aplicar:
+            self.stdout.write(self.style.SUCCESS("Corregidos: {}".format(len(descuadres))))
+        else:
+            self.stdout.write(
+                self.style.WARNING("Descuadrados: {} (usa --apply para corregir)".format(len(descuadres)))
+            )
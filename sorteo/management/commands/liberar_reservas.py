@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 
-from sorteo.services import liberar_caducadas
+from sorteo.services import borrar_cambios_antiguos, liberar_caducadas
 
 
 class Command(BaseCommand):
@@ -12,4 +12,6 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         liberadas = liberar_caducadas()
+        borrados = borrar_cambios_antiguos()
         self.stdout.write(self.style.SUCCESS("Participaciones liberadas: {}".format(liberadas)))
+        self.stdout.write("Cambios de ocupación antiguos borrados: {}".format(borrados))
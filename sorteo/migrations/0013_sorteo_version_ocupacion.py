@@ -0,0 +1,18 @@
+# Generated by Django 5.2.17 on 2026-10-17 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sorteo', '0012_solicitudreenvio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sorteo',
+            name='version_ocupacion',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.17 on 2026-10-17 05:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sorteo', '0013_sorteo_version_ocupacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioOcupacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField()),
+                ('cambios', models.JSONField(default=dict)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('sorteo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cambios_ocupacion', to='sorteo.sorteo')),
+            ],
+            options={
+                'verbose_name': 'cambio de ocupación',
+                'verbose_name_plural': 'cambios de ocupación',
+                'ordering': ['sorteo', 'version'],
+                'indexes': [models.Index(fields=['creado_en'], name='sorteo_camb_creado__f9f459_idx')],
+                'constraints': [models.UniqueConstraint(fields=('sorteo', 'version'), name='cambio_ocupacion_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.17 on 2026-10-17 05:50
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def _contar_papeletas(apps, schema_editor):
+    Sorteo = apps.get_model("sorteo", "Sorteo")
+    Papeleta = apps.get_model("sorteo", "Papeleta")
+    campos = {"libre": "papeletas_libres", "reservada": "papeletas_reservadas", "pagada": "papeletas_pagadas"}
+    cuentas = {}
+    for fila in Papeleta.objects.values("sorteo_id", "estado").annotate(n=Count("id")).order_by():
+        if fila["estado"] in campos:
+            cuentas.setdefault(fila["sorteo_id"], {})[campos[fila["estado"]]] = fila["n"]
+    for sorteo_id, valores in cuentas.items():
+        Sorteo.objects.filter(pk=sorteo_id).update(**valores)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sorteo', '0014_cambioocupacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sorteo',
+            name='papeletas_libres',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='sorteo',
+            name='papeletas_pagadas',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='sorteo',
+            name='papeletas_reservadas',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(_contar_papeletas, migrations.RunPython.noop),
+    ]
@@ -203,6 +203,17 @@ class Sorteo(models.Model):
     hash_listado = models.CharField(max_length=64, blank=True)
     participaciones_vendidas_cierre = models.PositiveIntegerField(null=True, blank=True)
 
+    # Sube cada vez que alguna papeleta cambia de estado, en la misma
+    # transacción que el cambio. El sondeo de la portada la usa de ETag: si no
+    # se ha movido nada, contesta 304 sin mirar las papeletas.
+    version_ocupacion = models.PositiveBigIntegerField(default=0, editable=False)
+    # Papeletas en cada estado. Se mueven con la versión, en la misma
+    # transacción que el cambio, para que leer las cifras no cueste un COUNT
+    # cada vez. `cuadrar_contadores` las comprueba contra las papeletas.
+    papeletas_libres = models.PositiveIntegerField(default=0, editable=False)
+    papeletas_reservadas = models.PositiveIntegerField(default=0, editable=False)
+    papeletas_pagadas = models.PositiveIntegerField(default=0, editable=False)
+
     creado_en = models.DateTimeField(auto_now_add=True)
     actualizado_en = models.DateTimeField(auto_now=True)
 
@@ -214,19 +225,37 @@ class Sorteo(models.Model):
     def __str__(self):
         return self.titulo
 
+    def save(self, *args, **kwargs):
+        """
+        Al modificar un sorteo no se escriben la versión ni los contadores.
+
+        Los mueven las ventas con un `update` y los de esta instancia pueden
+        estar viejos: el formulario del admin se carga, alguien compra mientras
+        tanto y al guardar se deshacía la venta en las cifras y la versión iba
+        hacia atrás, con lo que el siguiente `registrar_cambio_ocupacion`
+        chocaba con `cambio_ocupacion_unico`.
+        """
+        if not self._state.adding and not kwargs.get("force_insert"):
+            protegidos = {"version_ocupacion", *CONTADORES.values()}
+            campos = kwargs.get("update_fields")
+            if campos is None:
+                campos = [f.name for f in self._meta.concrete_fields if not f.primary_key]
+            kwargs["update_fields"] = [c for c in campos if c not in protegidos]
+        super().save(*args, **kwargs)
+
     # -- Cifras -------------------------------------------------------------
 
     @property
     def vendidas(self):
-        return self.papeletas.filter(estado=Papeleta.Estado.PAGADA).count()
+        return self.papeletas_pagadas
 
     @property
     def reservadas(self):
-        return self.papeletas.filter(estado=Papeleta.Estado.RESERVADA).count()
+        return self.papeletas_reservadas
 
     @property
     def disponibles(self):
-        return self.papeletas.filter(estado=Papeleta.Estado.LIBRE).count()
+        return self.papeletas_libres
 
     @property
     def recaudado(self):
@@ -258,8 +287,43 @@ class Sorteo(models.Model):
         ]
         if nuevas:
             Papeleta.objects.bulk_create(nuevas, batch_size=1000)
+            Sorteo.subir_version_ocupacion([self.pk], {Papeleta.Estado.LIBRE: len(nuevas)})
+            self.refresh_from_db(fields=["version_ocupacion", *CONTADORES.values()])
         return len(nuevas)
 
+    @staticmethod
+    def subir_version_ocupacion(sorteo_ids, movimientos=None):
+        """
+        Marca que ha cambiado la ocupación. Llamar dentro de la transacción del cambio.
+
+        `movimientos` dice cuánto varía el contador de cada estado, p. ej.
+        `{"libre": -3, "reservada": 3}` al reservar tres papeletas.
+        """
+        if not sorteo_ids:
+            return
+        cambios = {"version_ocupacion": models.F("version_ocupacion") + 1}
+        for estado, cantidad in (movimientos or {}).items():
+            if cantidad:
+                campo = CONTADORES[estado]
+                cambios[campo] = models.F(campo) + cantidad
+        Sorteo.objects.filter(pk__in=list(sorteo_ids)).update(**cambios)
+
+    @staticmethod
+    def registrar_cambio_ocupacion(sorteo_id, libres=(), reservadas=(), pagadas=(), movimientos=None):
+        """
+        Sube la versión y deja en `CambioOcupacion` qué números han cambiado,
+        para el flujo de eventos de la portada. Dentro de la transacción del
+        cambio, igual que `subir_version_ocupacion`.
+        """
+        Sorteo.subir_version_ocupacion([sorteo_id], movimientos)
+        version = Sorteo.objects.filter(pk=sorteo_id).values_list("version_ocupacion", flat=True).get()
+        CambioOcupacion.objects.create(
+            sorteo_id=sorteo_id,
+            version=version,
+            cambios={"libres": sorted(libres), "reservadas": sorted(reservadas), "pagadas": sorted(pagadas)},
+        )
+        return version
+
 
 class Pedido(models.Model):
     class Estado(models.TextChoices):
@@ -359,6 +423,14 @@ class Papeleta(models.Model):
         return "#{} ({})".format(self.numero, self.get_estado_display())
 
 
+# Contador de `Sorteo` que lleva las papeletas de cada estado.
+CONTADORES = {
+    Papeleta.Estado.LIBRE: "papeletas_libres",
+    Papeleta.Estado.RESERVADA: "papeletas_reservadas",
+    Papeleta.Estado.PAGADA: "papeletas_pagadas",
+}
+
+
 class Interesado(models.Model):
     """
     Lista de espera previa a la autorización.
@@ -686,6 +758,33 @@ class EstudioRifa(models.Model):
         }
 
 
+class CambioOcupacion(models.Model):
+    """
+    Qué números cambiaron de estado en cada versión de ocupación de un sorteo.
+
+    Es el registro del que lee el flujo de eventos de la portada. Está en la
+    base de datos y no en la caché ni en memoria porque cada worker atiende sus
+    propios flujos y todos tienen que enterarse de las ventas de los demás, sin
+    montar un broker para ello. Solo hace falta lo reciente: `liberar_reservas`
+    borra lo antiguo.
+    """
+
+    sorteo = models.ForeignKey(Sorteo, on_delete=models.CASCADE, related_name="cambios_ocupacion")
+    version = models.PositiveBigIntegerField()
+    cambios = models.JSONField(default=dict)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "cambio de ocupación"
+        verbose_name_plural = "cambios de ocupación"
+        ordering = ["sorteo", "version"]
+        constraints = [models.UniqueConstraint(fields=["sorteo", "version"], name="cambio_ocupacion_unico")]
+        indexes = [models.Index(fields=["creado_en"])]
+
+    def __str__(self):
+        return "{} · v{}".format(self.sorteo_id, self.version)
+
+
 class SolicitudReenvio(models.Model):
     """
     Cada petición de «reenvíame mis participaciones».
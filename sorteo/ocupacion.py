@@ -0,0 +1,95 @@
+"""
+Ocupación de la rejilla en formato compacto, para la portada y el sondeo.
+
+Una lista `{"n": numero, "e": estado}` por papeleta no libre crece con las
+ventas: a punto de agotarse la rifa es la rejilla entera. Aquí van dos mapas de
+bits en base64, uno de reservadas y otro de pagadas, con un bit por número: el
+bit más alto del primer byte es el número 1. Con 5.000 participaciones cada
+mapa ocupa 625 bytes como mucho, y comprimido con gzip mucho menos cuando está
+casi vacío o casi lleno.
+
+Entre dos versiones basta con mandar lo que ha cambiado (`delta`).
+"""
+
+import base64
+
+from django.core.cache import cache
+
+from .models import Papeleta
+
+# Cuánto se guarda la ocupación de cada versión para poder calcular deltas.
+# Un navegador que lleve más tiempo sin preguntar recibe la ocupación entera.
+SEGUNDOS_EN_CACHE = 3600
+
+
+def _mapas(sorteo):
+    tamano = (sorteo.total_participaciones + 7) // 8
+    reservadas = bytearray(tamano)
+    pagadas = bytearray(tamano)
+    ocupadas = sorteo.papeletas.exclude(estado=Papeleta.Estado.LIBRE).values_list("numero", "estado")
+    for numero, estado in ocupadas:
+        byte, bit = divmod(numero - 1, 8)
+        if not 0 <= byte < tamano:
+            continue
+        mapa = pagadas if estado == Papeleta.Estado.PAGADA else reservadas
+        mapa[byte] |= 0x80 >> bit
+    return bytes(reservadas), bytes(pagadas)
+
+
+def _b64(datos):
+    return base64.b64encode(datos).decode("ascii")
+
+
+def _clave(sorteo_id, version):
+    return "sorteo:ocupacion:{}:{}".format(sorteo_id, version)
+
+
+def completa(sorteo):
+    """Ocupación de la versión actual del sorteo. Se calcula una vez por versión."""
+    clave = _clave(sorteo.pk, sorteo.version_ocupacion)
+    datos = cache.get(clave)
+    if datos is None:
+        reservadas, pagadas = _mapas(sorteo)
+        datos = {
+            "v": sorteo.version_ocupacion,
+            "total": sorteo.total_participaciones,
+            "r": _b64(reservadas),
+            "p": _b64(pagadas),
+        }
+        cache.set(clave, datos, SEGUNDOS_EN_CACHE)
+    return datos
+
+
+def _numeros(b64):
+    resultado = set()
+    for byte, valor in enumerate(base64.b64decode(b64)):
+        if not valor:
+            continue
+        for bit in range(8):
+            if valor & (0x80 >> bit):
+                resultado.add(byte * 8 + bit + 1)
+    return resultado
+
+
+def delta(sorteo, desde):
+    """
+    Lo que ha cambiado desde la versión `desde`: los números que han pasado a
+    libres, a reservadas y a pagadas. None si esa versión ya no está guardada o
+    si el delta no iba a ser más corto que la ocupación entera.
+    """
+    actual = completa(sorteo)
+    anterior = cache.get(_clave(sorteo.pk, desde))
+    if anterior is None or anterior["total"] != actual["total"]:
+        return None
+
+    antes_r, antes_p = _numeros(anterior["r"]), _numeros(anterior["p"])
+    ahora_r, ahora_p = _numeros(actual["r"]), _numeros(actual["p"])
+    cambios = {
+        "libres": sorted((antes_r | antes_p) - ahora_r - ahora_p),
+        "reservadas": sorted(ahora_r - antes_r),
+        "pagadas": sorted(ahora_p - antes_p),
+    }
+    # Un número ocupa en decimal más de lo que ocupan sus dos bits.
+    if sum(len(numeros) for numeros in cambios.values()) * 4 > len(actual["r"]) + len(actual["p"]):
+        return None
+    return {"v": actual["v"], "desde": desde, **cambios}
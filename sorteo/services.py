@@ -2,14 +2,24 @@
 Lógica de negocio del sorteo. Las vistas no tocan la base de datos: llaman aquí.
 """
 
+import math
 import secrets
+from collections import defaultdict
 from datetime import timedelta
 
 from django.db import connection, transaction
-from django.db.models import Q
+from django.db.models import Count, Q
 from django.utils import timezone
 
-from .models import ActaSorteo, Papeleta, Pedido, SolicitudReenvio, Sorteo
+from .models import (
+    CONTADORES,
+    ActaSorteo,
+    CambioOcupacion,
+    Papeleta,
+    Pedido,
+    SolicitudReenvio,
+    Sorteo,
+)
 
 
 class ErrorSorteo(Exception):
@@ -53,7 +63,7 @@ class NumeroNoVendido(ErrorSorteo):
         )
 
 
-def _bloqueadas(qs):
+def _bloqueadas(qs, esperar=False):
     """
     Bloquea las filas para que dos compradores simultáneos no se lleven la
     misma papeleta.
@@ -62,15 +72,62 @@ def _bloqueadas(qs):
     que otro está reservando y se lleva otras distintas. Es la diferencia entre
     una cola y dos ventas en paralelo, y en un pico de tráfico se nota.
 
+    Con `esperar` no se salta nada: es para filas que ya tienen dueño, como
+    las de un pedido que se está cobrando, donde hay que esperar al otro.
+
     SQLite (desarrollo) no soporta SELECT FOR UPDATE, pero serializa las
     escrituras con un lock de base de datos, así que dentro de la transacción
     el resultado es igual de correcto.
     """
     if connection.features.has_select_for_update:
-        return qs.select_for_update(skip_locked=True)
+        return qs.select_for_update(skip_locked=not esperar)
     return qs
 
 
+_azar = secrets.SystemRandom()
+
+# Rondas de números al azar antes de leer todas las libres que queden, y
+# números que se prueban como mucho en cada una.
+RONDAS_AL_AZAR = 3
+NUMEROS_POR_RONDA = 500
+
+
+def _libres_al_azar(sorteo, cantidad):
+    """
+    Coge `cantidad` papeletas libres al azar sin barajar todas las libres.
+
+    Se sortean números entre 1 y el total de participaciones y se leen, por el
+    índice (sorteo, numero), las que de esos estén libres. Se prueban de más
+    según lo que quede libre para que de media sobre con una ronda. Un
+    `ORDER BY ?` ordenaba todas las libres en cada compra, con las filas
+    bloqueadas mientras tanto.
+
+    Cada papeleta libre tiene la misma probabilidad, sea cual sea el hueco que
+    dejen las vendidas a su alrededor, y las de una misma compra no tienen
+    nada que ver entre sí. Con `skip_locked` las que otro comprador tiene
+    bloqueadas cuentan como ocupadas. Si tras unas rondas no hay bastantes, o
+    queda tan poco que habría que probar casi todos los números, se leen las
+    libres que queden y se elige entre ellas.
+    """
+    libres = _bloqueadas(sorteo.papeletas.filter(estado=Papeleta.Estado.LIBRE))
+    total = sorteo.total_participaciones
+    quedan = max(sorteo.papeletas_libres, 1)
+    elegidas = []
+    for _ in range(RONDAS_AL_AZAR):
+        faltan = cantidad - len(elegidas)
+        tanda = math.ceil(2 * faltan * total / quedan)
+        if not faltan or tanda > min(NUMEROS_POR_RONDA, total // 2):
+            break
+        numeros = _azar.sample(range(1, total + 1), tanda)
+        encontradas = {p.numero: p for p in libres.filter(numero__in=numeros).exclude(pk__in=[p.pk for p in elegidas])}
+        elegidas += [encontradas[n] for n in numeros if n in encontradas][:faltan]
+    faltan = cantidad - len(elegidas)
+    if faltan:
+        resto = list(libres.exclude(pk__in=[p.pk for p in elegidas]))
+        elegidas += _azar.sample(resto, min(faltan, len(resto)))
+    return elegidas
+
+
 def _crear_pedido(sorteo, papeletas, datos, ahora):
     pedido = Pedido.objects.create(
         sorteo=sorteo,
@@ -84,9 +141,14 @@ def _crear_pedido(sorteo, papeletas, datos, ahora):
         ip=datos.get("ip"),
     )
     expira = ahora + timedelta(minutes=sorteo.reserva_minutos)
-    Papeleta.objects.filter(pk__in=[p.pk for p in papeletas]).update(
+    movidas = Papeleta.objects.filter(pk__in=[p.pk for p in papeletas]).update(
         estado=Papeleta.Estado.RESERVADA, reserva_expira=expira, pedido=pedido
     )
+    Sorteo.registrar_cambio_ocupacion(
+        sorteo.pk,
+        reservadas=[p.numero for p in papeletas],
+        movimientos={Papeleta.Estado.LIBRE: -movidas, Papeleta.Estado.RESERVADA: movidas},
+    )
     return pedido
 
 
@@ -96,7 +158,7 @@ def reservar_cantidad(sorteo, cantidad, datos):
     liberar_caducadas(sorteo)
     ahora = timezone.now()
 
-    libres = list(_bloqueadas(sorteo.papeletas.filter(estado=Papeleta.Estado.LIBRE).order_by("?"))[:cantidad])
+    libres = _libres_al_azar(sorteo, cantidad)
     if len(libres) < cantidad:
         raise SinPapeletasSuficientes(len(libres))
 
@@ -210,6 +272,7 @@ def comprobar_ritmo_reenvio(sorteo, ip, email):
         raise DemasiadasReservas(VENTANA_RESERVAS_MINUTOS)
 
 
+@transaction.atomic
 def liberar_caducadas(sorteo=None):
     """
     Devuelve al estado libre las reservas expiradas. Idempotente y barato.
@@ -225,7 +288,21 @@ def liberar_caducadas(sorteo=None):
         papeletas = papeletas.filter(sorteo=sorteo)
         pedidos = pedidos.filter(sorteo=sorteo)
 
-    liberadas = papeletas.update(estado=Papeleta.Estado.LIBRE, reserva_expira=None, pedido=None)
+    # Se bloquean antes para que lo que se cuenta sea exactamente lo que se
+    # libera: una que otro está cobrando ahora se queda para la siguiente vez.
+    filas = list(_bloqueadas(papeletas).values_list("pk", "sorteo_id", "numero"))
+    liberadas = Papeleta.objects.filter(pk__in=[pk for pk, _, _ in filas]).update(
+        estado=Papeleta.Estado.LIBRE, reserva_expira=None, pedido=None
+    )
+    por_sorteo = defaultdict(list)
+    for _, sorteo_id, numero in filas:
+        por_sorteo[sorteo_id].append(numero)
+    for sorteo_id, numeros in por_sorteo.items():
+        Sorteo.registrar_cambio_ocupacion(
+            sorteo_id,
+            libres=numeros,
+            movimientos={Papeleta.Estado.RESERVADA: -len(numeros), Papeleta.Estado.LIBRE: len(numeros)},
+        )
     # Un pedido pendiente que se ha quedado sin papeletas ya no puede pagarse.
     # Los recién creados no corren peligro: hasta que la transacción que los
     # crea no confirma, ninguna otra conexión los ve.
@@ -233,6 +310,56 @@ def liberar_caducadas(sorteo=None):
     return liberadas
 
 
+def _contadores_reales(sorteo_id):
+    reales = dict.fromkeys(CONTADORES.values(), 0)
+    for estado, n in (
+        Papeleta.objects.filter(sorteo_id=sorteo_id).values_list("estado").annotate(n=Count("id")).order_by()
+    ):
+        if estado in CONTADORES:
+            reales[CONTADORES[estado]] = n
+    return reales
+
+
+def cuadrar_contadores(sorteo_ids=None, aplicar=False):
+    """
+    Compara los contadores de cada sorteo con sus papeletas.
+
+    Devuelve `(sorteo, guardados, reales)` de los que no cuadran y, con
+    `aplicar`, los corrige. Se bloquea el sorteo antes de contar: una venta
+    que esté a medias espera para sumar su parte y la suma sale sobre la cifra
+    ya corregida.
+    """
+    qs = Sorteo.objects.order_by("pk")
+    if sorteo_ids:
+        qs = qs.filter(pk__in=sorteo_ids)
+    descuadres = []
+    for sorteo_id in qs.values_list("pk", flat=True):
+        with transaction.atomic():
+            sorteos = Sorteo.objects.select_for_update() if aplicar else Sorteo.objects
+            sorteo = sorteos.get(pk=sorteo_id)
+            guardados = {campo: getattr(sorteo, campo) for campo in CONTADORES.values()}
+            reales = _contadores_reales(sorteo_id)
+            if guardados == reales:
+                continue
+            descuadres.append((sorteo, guardados, reales))
+            if aplicar:
+                Sorteo.objects.filter(pk=sorteo_id).update(**reales)
+                # Las cifras cacheadas por versión tienen que volver a calcularse.
+                Sorteo.subir_version_ocupacion([sorteo_id])
+    return descuadres
+
+
+# Lo que se guarda del registro de cambios de ocupación. Un navegador que se
+# reconecta después de más tiempo recibe la ocupación entera, no los cambios.
+HORAS_CAMBIOS_OCUPACION = 2
+
+
+def borrar_cambios_antiguos():
+    """Poda `CambioOcupacion`. La llama `liberar_reservas` en cada pasada."""
+    limite = timezone.now() - timedelta(hours=HORAS_CAMBIOS_OCUPACION)
+    return CambioOcupacion.objects.filter(creado_en__lt=limite).delete()[0]
+
+
 @transaction.atomic
 def confirmar_pago(pedido_id):
     """
@@ -253,7 +380,17 @@ def confirmar_pago(pedido_id):
 
     # Se marcan por pedido, no por número: si la reserva caducó y otra persona
     # compró la papeleta, esta consulta no se la quita.
-    pedido.papeletas.filter(estado=Papeleta.Estado.RESERVADA).update(estado=Papeleta.Estado.PAGADA, reserva_expira=None)
+    reservadas = _bloqueadas(pedido.papeletas.filter(estado=Papeleta.Estado.RESERVADA), esperar=True)
+    filas = list(reservadas.values_list("pk", "numero"))
+    pagadas = Papeleta.objects.filter(pk__in=[pk for pk, _ in filas]).update(
+        estado=Papeleta.Estado.PAGADA, reserva_expira=None
+    )
+    if pagadas:
+        Sorteo.registrar_cambio_ocupacion(
+            pedido.sorteo_id,
+            pagadas=[numero for _, numero in filas],
+            movimientos={Papeleta.Estado.RESERVADA: -pagadas, Papeleta.Estado.PAGADA: pagadas},
+        )
     return pedido
 
 
@@ -9,10 +9,28 @@
   var cfg = JSON.parse(datos.textContent);
   var BLOQUE = 100;
 
-  var ocupadas = new Map();
-  cfg.ocupadas.forEach(function (o) {
-    ocupadas.set(o.n, o.e);
-  });
+  // Ocupación: dos mapas de bits en base64 (reservadas y pagadas), un bit por
+  // número empezando por el más alto del primer byte. Ver sorteo/ocupacion.py.
+  function marcar(mapa, b64, valor) {
+    var bytes = atob(b64);
+    for (var i = 0; i < bytes.length; i++) {
+      var byte = bytes.charCodeAt(i);
+      if (!byte) continue;
+      for (var bit = 0; bit < 8; bit++) {
+        if (byte & (0x80 >> bit)) mapa.set(i * 8 + bit + 1, valor);
+      }
+    }
+  }
+
+  function decodificar(o) {
+    var mapa = new Map();
+    marcar(mapa, o.r, "reservada");
+    marcar(mapa, o.p, "pagada");
+    return mapa;
+  }
+
+  var ocupadas = decodificar(cfg.ocupacion);
+  var version = cfg.ocupacion.v;
 
   var estado = {
     modo: "rapida",
@@ -234,11 +252,23 @@
 
   // -- Disponibilidad en vivo ---------------------------------------------
 
-  function sincronizar(lista) {
-    ocupadas = new Map();
-    lista.forEach(function (o) {
-      ocupadas.set(o.n, o.e);
-    });
+  function sincronizar(o) {
+    if (o.desde === undefined) {
+      ocupadas = decodificar(o);
+    } else if (o.desde === version) {
+      o.libres.forEach(function (n) {
+        ocupadas.delete(n);
+      });
+      o.reservadas.forEach(function (n) {
+        ocupadas.set(n, "reservada");
+      });
+      o.pagadas.forEach(function (n) {
+        ocupadas.set(n, "pagada");
+      });
+    } else {
+      return;
+    }
+    version = o.v;
     estado.elegidos = estado.elegidos.filter(function (n) {
       return !ocupadas.has(n);
     });
@@ -247,14 +277,29 @@
     refrescar();
   }
 
-  // Otra persona puede comprar mientras miras la página.
+  // Con eventos en vivo los cambios llegan solos; el navegador reconecta
+  // por su cuenta pasando la última versión recibida.
+  var fuente = null;
+  if (cfg.eventos && window.EventSource) {
+    fuente = new EventSource("/sorteo/eventos/?desde=" + version);
+    fuente.addEventListener("ocupacion", function (e) {
+      sincronizar(JSON.parse(e.data));
+    });
+  }
+
+  // Otra persona puede comprar mientras miras la página. Si el flujo de
+  // eventos se ha caído del todo, se vuelve a preguntar cada poco.
   setInterval(function () {
-    fetch("/sorteo/estado/", { headers: { Accept: "application/json" } })
+    if (fuente && fuente.readyState !== EventSource.CLOSED) return;
+    fetch("/sorteo/estado/?desde=" + version, {
+      cache: "no-cache",
+      headers: { Accept: "application/json" },
+    })
       .then(function (r) {
         return r.ok ? r.json() : null;
       })
       .then(function (d) {
-        if (d) sincronizar(d.ocupadas);
+        if (d) sincronizar(d.ocupacion);
       })
       .catch(function () {
         /* sin conexión: se reintenta al siguiente ciclo */
@@ -301,7 +346,7 @@
       .then(function (res) {
         if (!res.ok) {
           mostrarError(res.datos.error || "No se pudo completar la reserva.");
-          if (res.datos.ocupadas) sincronizar(res.datos.ocupadas);
+          if (res.datos.ocupacion) sincronizar(res.datos.ocupacion);
           return;
         }
         window.location.href = res.datos.url;
@@ -6,14 +6,19 @@ dinero o credibilidad — vender dos veces la misma papeleta, cobrar sin
 consentimiento, duplicar un pago y publicar un ganador que no compró.
 """
 
+import base64
 import datetime
 import json
 import math
 from decimal import Decimal
 
+from asgiref.sync import async_to_sync
 from django.contrib.auth import get_user_model
 from django.core import mail
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from core.models import Proyecto
@@ -48,7 +53,7 @@ from .services import (
 DATOS = {"nombre": "Ana Ruiz", "email": "ana@ejemplo.com"}
 
 
-class BaseSorteo(TestCase):
+class DatosSorteo:
     def setUp(self):
         proyecto = Proyecto.objects.create(nombre="Proyecto de prueba")
         organizador = Organizador.objects.create(nombre="Organizador", email="o@ejemplo.com")
@@ -68,6 +73,10 @@ class BaseSorteo(TestCase):
         self.sorteo.generar_papeletas()
 
 
+class BaseSorteo(DatosSorteo, TestCase):
+    pass
+
+
 class Reservas(BaseSorteo):
     def test_no_se_vende_dos_veces_la_misma_papeleta(self):
         reservar_numeros(self.sorteo, [7], DATOS)
@@ -85,6 +94,48 @@ class Reservas(BaseSorteo):
         p2 = reservar_cantidad(self.sorteo, 20, dict(DATOS, email="b@e.com"))
         self.assertEqual(len(set(p1.numeros) & set(p2.numeros)), 0)
 
+    def test_la_compra_rapida_no_baraja_todas_las_libres(self):
+        with CaptureQueriesContext(connection) as consultas:
+            pedido = reservar_cantidad(self.sorteo, 5, DATOS)
+        self.assertEqual(len(pedido.numeros), 5)
+        self.assertFalse(any("RAND" in q["sql"].upper() for q in consultas.captured_queries))
+
+    def _frecuencias(self, cantidad, compras):
+        from collections import Counter
+
+        from .services import _libres_al_azar
+
+        self.sorteo.refresh_from_db()
+        veces = Counter()
+        for _ in range(compras):
+            veces.update(p.numero for p in _libres_al_azar(self.sorteo, cantidad))
+        return veces
+
+    def _uniforme(self, veces, libres):
+        self.assertEqual(set(veces), libres)
+        esperado = sum(veces.values()) / len(libres)
+        chi2 = sum((veces[n] - esperado) ** 2 / esperado for n in libres)
+        # 39 grados de libertad: por encima de 100 pasa menos de una vez en
+        # diez millones si el reparto es uniforme. Con una clave al azar fija
+        # por papeleta salía de varios cientos.
+        self.assertLess(chi2, 100)
+
+    def test_la_compra_rapida_reparte_por_igual_entre_las_libres(self):
+        # Huecos irregulares entre las libres, que es lo que sesgaba el reparto.
+        reservar_numeros(self.sorteo, [1, 2, 3, 4, 5, 6, 20, 21, 33, 50], DATOS)
+        libres = set(range(1, 51)) - {1, 2, 3, 4, 5, 6, 20, 21, 33, 50}
+        self._uniforme(self._frecuencias(1, 2000), libres)
+
+    def test_en_una_compra_de_varias_no_salen_vecinas(self):
+        reservar_numeros(self.sorteo, [1, 2, 3, 4, 5, 6, 20, 21, 33, 50], DATOS)
+        libres = set(range(1, 51)) - {1, 2, 3, 4, 5, 6, 20, 21, 33, 50}
+        self._uniforme(self._frecuencias(3, 700), libres)
+
+    def test_con_pocas_libres_se_eligen_entre_las_que_quedan(self):
+        reservar_numeros(self.sorteo, list(range(1, 48)), DATOS)
+        pedido = reservar_cantidad(self.sorteo, 3, dict(DATOS, email="b@e.com"))
+        self.assertEqual(sorted(pedido.numeros), [48, 49, 50])
+
     def test_no_se_puede_reservar_mas_de_lo_que_queda(self):
         reservar_cantidad(self.sorteo, 45, DATOS)
         with self.assertRaises(SinPapeletasSuficientes):
@@ -96,6 +147,7 @@ class Reservas(BaseSorteo):
             reserva_expira=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
         )
         liberar_caducadas(self.sorteo)
+        self.sorteo.refresh_from_db()
         self.assertEqual(self.sorteo.disponibles, 50)
         pedido.refresh_from_db()
         self.assertEqual(pedido.estado, Pedido.Estado.CADUCADO)
@@ -111,11 +163,143 @@ class Reservas(BaseSorteo):
         self.assertEqual(pedido.ip, "1.2.3.4")
 
 
+class ContadoresDePapeletas(BaseSorteo):
+    def _cuadran(self):
+        self.sorteo.refresh_from_db()
+        reales = {
+            estado: Papeleta.objects.filter(sorteo=self.sorteo, estado=estado).count()
+            for estado in (Papeleta.Estado.LIBRE, Papeleta.Estado.RESERVADA, Papeleta.Estado.PAGADA)
+        }
+        self.assertEqual(
+            (self.sorteo.disponibles, self.sorteo.reservadas, self.sorteo.vendidas),
+            (reales["libre"], reales["reservada"], reales["pagada"]),
+        )
+
+    def test_siguen_a_reservas_pagos_y_caducidades(self):
+        self._cuadran()
+        # Primero los números fijos: la compra rápida podría llevarse alguno.
+        caducado = reservar_numeros(self.sorteo, [49, 50], dict(DATOS, email="b@e.com"))
+        pagado = reservar_cantidad(self.sorteo, 4, DATOS)
+        confirmar_pago(pagado.id)
+        self._cuadran()
+        self.assertEqual((self.sorteo.disponibles, self.sorteo.reservadas, self.sorteo.vendidas), (44, 2, 4))
+
+        Papeleta.objects.filter(pedido=caducado).update(
+            reserva_expira=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        )
+        liberar_caducadas()
+        self._cuadran()
+        self.assertEqual(self.sorteo.reservadas, 0)
+
+    def test_leer_las_cifras_no_consulta_las_papeletas(self):
+        self.sorteo.refresh_from_db()
+        with self.assertNumQueries(0):
+            cifras = (
+                self.sorteo.vendidas,
+                self.sorteo.disponibles,
+                self.sorteo.recaudado,
+                self.sorteo.porcentaje_vendido,
+            )
+        self.assertEqual(cifras, (0, 50, 0, 0))
+
+    def test_guardar_un_sorteo_viejo_no_pisa_las_cifras(self):
+        """Como el formulario del admin abierto mientras se vende."""
+        viejo = Sorteo.objects.get(pk=self.sorteo.pk)
+        confirmar_pago(reservar_numeros(self.sorteo, [1, 2], DATOS).id)
+        actual = Sorteo.objects.get(pk=self.sorteo.pk)
+
+        viejo.titulo = "Sorteo renombrado"
+        viejo.save()
+
+        self.sorteo.refresh_from_db()
+        self.assertEqual(self.sorteo.titulo, "Sorteo renombrado")
+        self.assertEqual(self.sorteo.version_ocupacion, actual.version_ocupacion)
+        self._cuadran()
+        self.assertEqual(self.sorteo.vendidas, 2)
+        # La versión no ha ido hacia atrás: el siguiente cambio se registra.
+        reservar_numeros(self.sorteo, [3], dict(DATOS, email="b@e.com"))
+        self.sorteo.refresh_from_db()
+        self.assertEqual(self.sorteo.version_ocupacion, actual.version_ocupacion + 1)
+
+    def test_en_el_admin_las_papeletas_no_se_borran_ni_cambian_de_sorteo(self):
+        from django.contrib.admin.sites import AdminSite
+        from django.test import RequestFactory
+
+        from .admin import PapeletaAdmin
+
+        peticion = RequestFactory().get("/admin/")
+        peticion.user = get_user_model().objects.create_superuser("jefe", "j@e.com", "clave-larga-de-prueba")
+        admin_papeletas = PapeletaAdmin(Papeleta, AdminSite())
+        papeleta = self.sorteo.papeletas.first()
+
+        self.assertFalse(admin_papeletas.has_delete_permission(peticion, papeleta))
+        self.assertNotIn("delete_selected", admin_papeletas.get_actions(peticion))
+        self.assertIn("sorteo", admin_papeletas.get_readonly_fields(peticion, papeleta))
+
+    def _formulario_papeleta(self, papeleta, **cambios):
+        from .admin import PapeletaForm
+
+        datos = {"estado": papeleta.estado, "reserva_expira": papeleta.reserva_expira, "pedido": papeleta.pedido_id}
+        datos.update(cambios)
+        return PapeletaForm(data={k: v for k, v in datos.items() if v is not None}, instance=papeleta)
+
+    def test_en_el_admin_no_se_reserva_una_papeleta_sin_pedido_ni_caducidad(self):
+        papeleta = self.sorteo.papeletas.get(numero=8)
+        self.assertFalse(self._formulario_papeleta(papeleta, estado=Papeleta.Estado.RESERVADA).is_valid())
+
+        pedido = reservar_numeros(self.sorteo, [9], DATOS)
+        caduca = "2030-01-01 00:00:00"
+        self.assertFalse(
+            self._formulario_papeleta(papeleta, estado=Papeleta.Estado.RESERVADA, pedido=pedido.pk).is_valid()
+        )
+        self.assertTrue(
+            self._formulario_papeleta(
+                papeleta, estado=Papeleta.Estado.RESERVADA, pedido=pedido.pk, reserva_expira=caduca
+            ).is_valid()
+        )
+
+    def test_el_admin_mueve_los_contadores_desde_el_estado_real(self):
+        """Como el formulario abierto mientras la papeleta se reserva y se paga."""
+        from django.contrib.admin.sites import AdminSite
+        from django.test import RequestFactory
+
+        from .admin import PapeletaAdmin
+
+        vista = self.sorteo.papeletas.get(numero=4)
+        confirmar_pago(reservar_numeros(self.sorteo, [4], DATOS).id)
+
+        vista.estado = Papeleta.Estado.LIBRE
+        admin_papeletas = PapeletaAdmin(Papeleta, AdminSite())
+        admin_papeletas.save_model(RequestFactory().post("/admin/"), vista, None, True)
+
+        self._cuadran()
+        self.assertEqual(self.sorteo.vendidas, 0)
+
+    def test_el_comando_encuentra_y_corrige_los_descuadres(self):
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        Sorteo.objects.filter(pk=self.sorteo.pk).update(papeletas_libres=7, papeletas_pagadas=3)
+        salida = StringIO()
+        call_command("cuadrar_contadores", stdout=salida)
+        self.assertIn("papeletas_libres 7 → 50", salida.getvalue())
+        self.sorteo.refresh_from_db()
+        self.assertEqual(self.sorteo.disponibles, 7)
+
+        call_command("cuadrar_contadores", "--apply", stdout=StringIO())
+        self._cuadran()
+        salida = StringIO()
+        call_command("cuadrar_contadores", stdout=salida)
+        self.assertIn("Todos los contadores cuadran", salida.getvalue())
+
+
 class Pagos(BaseSorteo):
     def test_confirmar_dos_veces_no_duplica(self):
         pedido = reservar_cantidad(self.sorteo, 2, DATOS)
         confirmar_pago(pedido.id)
         confirmar_pago(pedido.id)
+        self.sorteo.refresh_from_db()
         self.assertEqual(self.sorteo.vendidas, 2)
         self.assertEqual(Pedido.objects.count(), 1)
 
@@ -157,6 +341,146 @@ class PortalPublico(BaseSorteo):
         self.assertEqual(r.status_code, 400)
 
 
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class SondeoDeEstado(BaseSorteo):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_sin_cambios_contesta_304_sin_mirar_las_papeletas(self):
+        primera = self.client.get("/sorteo/estado/")
+        self.assertEqual(primera.status_code, 200)
+        self.assertEqual(primera.json()["disponibles"], 50)
+
+        with CaptureQueriesContext(connection) as consultas:
+            segunda = self.client.get("/sorteo/estado/", HTTP_IF_NONE_MATCH=primera["ETag"])
+        self.assertEqual(segunda.status_code, 304)
+        self.assertFalse(any("sorteo_papeleta" in q["sql"] for q in consultas.captured_queries))
+
+    def test_una_reserva_cambia_la_version(self):
+        primera = self.client.get("/sorteo/estado/")
+        reservar_numeros(self.sorteo, [7], DATOS)
+
+        segunda = self.client.get("/sorteo/estado/", HTTP_IF_NONE_MATCH=primera["ETag"])
+        self.assertEqual(segunda.status_code, 200)
+        self.assertNotEqual(segunda["ETag"], primera["ETag"])
+        # Número 7: séptimo bit del primer byte.
+        self.assertEqual(base64.b64decode(segunda.json()["ocupacion"]["r"])[:1], b"\x02")
+
+    def test_la_ocupacion_cabe_en_menos_de_un_kilobyte(self):
+        self.sorteo.total_participaciones = 5000
+        self.sorteo.save()
+        self.sorteo.generar_papeletas()
+        pedido = reservar_cantidad(self.sorteo, 50, DATOS)
+        confirmar_pago(pedido.id)
+        Papeleta.objects.filter(sorteo=self.sorteo, numero__gt=2000).update(estado=Papeleta.Estado.PAGADA)
+        Sorteo.subir_version_ocupacion([self.sorteo.pk])
+
+        r = self.client.get("/sorteo/estado/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(r["Content-Encoding"], "gzip")
+        self.assertLess(len(r.content), 1024)
+
+    def test_con_desde_solo_llegan_los_cambios(self):
+        primera = self.client.get("/sorteo/estado/").json()
+        reservar_numeros(self.sorteo, [7, 9], DATOS)
+        pedido = reservar_numeros(self.sorteo, [12], dict(DATOS, email="b@e.com"))
+        confirmar_pago(pedido.id)
+
+        r = self.client.get("/sorteo/estado/", {"desde": primera["version"]}).json()
+        self.assertEqual(r["ocupacion"]["desde"], primera["version"])
+        self.assertEqual(r["ocupacion"]["reservadas"], [7, 9])
+        self.assertEqual(r["ocupacion"]["pagadas"], [12])
+        self.assertEqual(r["ocupacion"]["libres"], [])
+
+        # Una versión que ya no está en caché: llega la ocupación entera.
+        r = self.client.get("/sorteo/estado/", {"desde": 999}).json()
+        self.assertNotIn("desde", r["ocupacion"])
+
+    def test_pagar_y_caducar_tambien_la_cambian(self):
+        pedido = reservar_numeros(self.sorteo, [3], DATOS)
+        version = Sorteo.objects.get(pk=self.sorteo.pk).version_ocupacion
+        confirmar_pago(pedido.id)
+        confirmar_pago(pedido.id)  # repetido no cambia nada
+        self.assertEqual(Sorteo.objects.get(pk=self.sorteo.pk).version_ocupacion, version + 1)
+
+        otro = reservar_numeros(self.sorteo, [4], dict(DATOS, email="b@e.com"))
+        Papeleta.objects.filter(pedido=otro).update(
+            reserva_expira=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        )
+        version = Sorteo.objects.get(pk=self.sorteo.pk).version_ocupacion
+        liberar_caducadas()
+        liberar_caducadas()
+        self.assertEqual(Sorteo.objects.get(pk=self.sorteo.pk).version_ocupacion, version + 1)
+
+    def test_tras_liberar_caducadas_las_disponibles_ya_las_cuentan(self):
+        pedido = reservar_numeros(self.sorteo, [5, 6], DATOS)
+        Papeleta.objects.filter(pedido=pedido).update(
+            reserva_expira=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        )
+
+        r = self.client.get("/sorteo/estado/").json()
+        self.assertEqual(r["disponibles"], 50)
+        self.assertEqual(base64.b64decode(r["ocupacion"]["r"])[:1], b"\x00")
+
+
+@override_settings(
+    SORTEO_EVENTOS=True,
+    SORTEO_EVENTOS_SEGUNDOS=0,
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class EventosEnVivo(DatosSorteo, TransactionTestCase):
+    # El flujo consulta desde otro hilo, con su propia conexión: tiene que ver
+    # los datos ya confirmados, no los de la transacción de cada prueba.
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def _eventos(self, **cabeceras):
+        r = self.client.get("/sorteo/eventos/", **cabeceras)
+        self.assertEqual(r["Content-Type"], "text/event-stream")
+
+        async def leer():
+            return b"".join([trozo async for trozo in r.streaming_content])
+
+        texto = async_to_sync(leer)().decode()
+        return [json.loads(linea[len("data: ") :]) for linea in texto.splitlines() if linea.startswith("data: ")]
+
+    def test_sin_version_llega_la_ocupacion_entera(self):
+        reservar_numeros(self.sorteo, [5], DATOS)
+        (datos,) = self._eventos()
+        self.assertNotIn("desde", datos)
+        self.assertEqual(base64.b64decode(datos["r"])[:1], b"\x08")
+
+    def test_al_reconectar_llegan_los_cambios_en_orden(self):
+        version = Sorteo.objects.get(pk=self.sorteo.pk).version_ocupacion
+        pedido = reservar_numeros(self.sorteo, [3, 4], DATOS)
+        confirmar_pago(pedido.id)
+
+        eventos = self._eventos(HTTP_LAST_EVENT_ID=str(version))
+        self.assertEqual(
+            eventos,
+            [
+                {"v": version + 1, "desde": version, "libres": [], "reservadas": [3, 4], "pagadas": []},
+                {"v": version + 2, "desde": version + 1, "libres": [], "reservadas": [], "pagadas": [3, 4]},
+            ],
+        )
+        self.assertEqual(self._eventos(HTTP_LAST_EVENT_ID=str(version + 2)), [])
+
+    def test_si_falta_un_cambio_en_el_registro_llega_todo(self):
+        version = Sorteo.objects.get(pk=self.sorteo.pk).version_ocupacion
+        reservar_numeros(self.sorteo, [3], DATOS)
+        Sorteo.subir_version_ocupacion([self.sorteo.pk])  # sin rastro en el registro
+
+        (datos,) = self._eventos(HTTP_LAST_EVENT_ID=str(version))
+        self.assertEqual(datos["v"], version + 2)
+        self.assertNotIn("desde", datos)
+
+    @override_settings(SORTEO_EVENTOS=False)
+    def test_apagados_no_hay_flujo(self):
+        self.assertEqual(self.client.get("/sorteo/eventos/").status_code, 404)
+
+
 class Acta(BaseSorteo):
     def test_rechaza_un_numero_no_vendido(self):
         confirmar_pago(reservar_numeros(self.sorteo, [5], DATOS).id)
@@ -806,8 +1130,10 @@ class ReservasCaducadasEnElErp(BaseSorteo):
         return detalle(peticion, pk=self.sorteo.pk)
 
     def test_abrir_la_ficha_devuelve_las_caducadas_a_la_venta(self):
+        self.sorteo.refresh_from_db()
         self.assertEqual(self.sorteo.disponibles, 47)
         self.assertEqual(self._abrir_ficha().status_code, 200)
+        self.sorteo.refresh_from_db()
         self.assertEqual(self.sorteo.disponibles, 50)
         self.assertEqual(self.sorteo.reservadas, 0)
 
@@ -880,6 +1206,7 @@ class RitmoDeReservas(BaseSorteo):
         """El tope es para el portal público, no para el mostrador."""
         for _ in range(RESERVAS_POR_VENTANA + 3):
             registrar_venta_manual(self.sorteo, 1, dict(DATOS, medio_pago="efectivo"))
+        self.sorteo.refresh_from_db()
         self.assertEqual(self.sorteo.vendidas, RESERVAS_POR_VENTANA + 3)
 
 
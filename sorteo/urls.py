@@ -9,6 +9,7 @@ urlpatterns = [
     path("bases/", views.bases, name="bases"),
     path("baja/<uuid:token>/", views.baja, name="baja"),
     path("estado/", views.estado, name="estado"),
+    path("eventos/", views.eventos, name="eventos"),
     path("reservar/", views.reservar, name="reservar"),
     path("pago/<uuid:pedido_id>/", views.pago_pendiente, name="pago"),
     path("pedido/<uuid:pedido_id>/", views.pedido, name="pedido"),
@@ -1,14 +1,21 @@
+import asyncio
 import json
+import time
 
+from asgiref.sync import sync_to_async
 from django import forms
 from django.conf import settings
-from django.http import Http404, JsonResponse
+from django.core.cache import cache
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.gzip import gzip_page
 from django.views.decorators.http import require_POST
 
+from . import ocupacion
 from .correo import confirmar_alta, confirmar_pedido, reenviar_participaciones
-from .models import Interesado, Papeleta, Pedido, Sorteo
+from .models import CONTADORES, CambioOcupacion, Interesado, Pedido, Sorteo
 from .services import (
     DemasiadasReservas,
     ErrorSorteo,
@@ -45,20 +52,38 @@ def _ip(request):
     return request.META.get("REMOTE_ADDR")
 
 
-def _ocupadas(sorteo):
+# Cada cuántos segundos, como mucho, el sondeo de estado libera reservas
+# caducadas. La compra ya las libera antes de reservar y el cron
+# `liberar_reservas` hace el resto: el sondeo solo adelanta lo que se ve.
+LIBERAR_DESDE_SONDEO_SEGUNDOS = 30
+
+
+def _etiqueta_estado(sorteo):
+    # La ocupación la cubre la versión; precio y demás datos del sorteo, la
+    # fecha de su último guardado.
+    return "{}-{}-{}".format(sorteo.pk, sorteo.version_ocupacion, int(sorteo.actualizado_en.timestamp()))
+
+
+def _estado_payload(sorteo, desde=None):
     """
-    Solo los números NO libres.
+    Lo que devuelve el sondeo, guardado en caché por versión de ocupación.
 
-    Con 5.000 participaciones, mandar la rejilla entera al navegador en cada
-    sondeo serían cientos de kB por usuario. Se manda la excepción, no la
-    norma: el cliente asume que el resto está libre.
+    Con `desde` se manda solo lo que ha cambiado desde esa versión, si todavía
+    se puede calcular; si no, la ocupación entera.
     """
-    return [
-        {"n": numero, "e": estado}
-        for numero, estado in sorteo.papeletas.exclude(estado=Papeleta.Estado.LIBRE)
-        .order_by("numero")
-        .values_list("numero", "estado")
-    ]
+    clave = "sorteo:estado:{}:{}".format(_etiqueta_estado(sorteo), desde)
+    datos = cache.get(clave)
+    if datos is None:
+        cambios = ocupacion.delta(sorteo, desde) if desde is not None else None
+        datos = {
+            "version": sorteo.version_ocupacion,
+            "ocupacion": cambios or ocupacion.completa(sorteo),
+            "vendidas": sorteo.vendidas,
+            "disponibles": sorteo.disponibles,
+            "precio": str(sorteo.precio_participacion),
+        }
+        cache.set(clave, datos, ocupacion.SEGUNDOS_EN_CACHE)
+    return datos
 
 
 class AltaForm(forms.Form):
@@ -112,7 +137,8 @@ def portada(request):
         {
             "sorteo": sorteo,
             "acta": acta,
-            "ocupadas_json": json.dumps(_ocupadas(sorteo)),
+            "ocupacion_json": json.dumps(ocupacion.completa(sorteo)),
+            "eventos": settings.SORTEO_EVENTOS,
         },
     )
 
@@ -168,17 +194,119 @@ def bases(request):
     return render(request, "sorteo/bases.html", {"sorteo": sorteo})
 
 
+@gzip_page
 def estado(request):
+    """
+    Sondeo de la portada, cada 15 segundos por navegador abierto.
+
+    Contesta por versión de ocupación: si no ha cambiado desde la última vez,
+    un 304 sin tocar las papeletas; si ha cambiado, el primero que pregunta
+    calcula el estado y los demás lo leen de la caché. Así el coste no crece
+    con visitantes × papeletas.
+
+    El navegador pasa en `?desde=` la versión que ya tiene y recibe solo los
+    cambios (ver `ocupacion.delta`).
+    """
     sorteo = _sorteo_activo()
-    liberar_caducadas(sorteo)
-    return JsonResponse(
-        {
-            "ocupadas": _ocupadas(sorteo),
-            "vendidas": sorteo.vendidas,
-            "disponibles": sorteo.disponibles,
-            "precio": str(sorteo.precio_participacion),
-        }
-    )
+    if cache.add("sorteo:liberar:{}".format(sorteo.pk), True, LIBERAR_DESDE_SONDEO_SEGUNDOS):
+        if liberar_caducadas(sorteo):
+            sorteo.refresh_from_db(fields=["version_ocupacion", *CONTADORES.values()])
+
+    try:
+        desde = int(request.GET["desde"])
+    except (KeyError, ValueError):
+        desde = None
+
+    etag = '"{}-{}"'.format(_etiqueta_estado(sorteo), "" if desde is None else desde)
+    respuesta = get_conditional_response(request, etag=etag)
+    if respuesta is None:
+        respuesta = JsonResponse(_estado_payload(sorteo, desde))
+    respuesta["ETag"] = etag
+    # El navegador guarda la respuesta pero pregunta siempre antes de usarla.
+    patch_cache_control(respuesta, no_cache=True)
+    return respuesta
+
+
+# Cada cuánto mira un flujo abierto si hay cambios, y cada cuánto manda un
+# latido si no los hay (los proxies cortan las conexiones mudas).
+EVENTOS_INTERVALO_SEGUNDOS = 1
+EVENTOS_LATIDO_SEGUNDOS = 15
+
+
+def _evento(datos):
+    return "id: {}\nevent: ocupacion\ndata: {}\n\n".format(datos["v"], json.dumps(datos, separators=(",", ":")))
+
+
+def _eventos_pendientes(sorteo_id, version):
+    """
+    Los eventos que le faltan a quien tiene la ocupación en `version`.
+
+    Si el registro cubre todas las versiones intermedias, un delta por
+    versión; si no (no sabía de ninguna, se ha podado o el cambio no dejó
+    rastro, como emitir más papeletas), la ocupación entera.
+    """
+    actual = Sorteo.objects.filter(pk=sorteo_id).values_list("version_ocupacion", flat=True).first()
+    if actual is None or actual == version:
+        return [], version
+    if version is not None and version < actual:
+        cambios = list(
+            CambioOcupacion.objects.filter(sorteo_id=sorteo_id, version__gt=version, version__lte=actual).order_by(
+                "version"
+            )
+        )
+        if [c.version for c in cambios] == list(range(version + 1, actual + 1)):
+            return [_evento({"v": c.version, "desde": c.version - 1, **c.cambios}) for c in cambios], actual
+    sorteo = Sorteo.objects.get(pk=sorteo_id)
+    datos = ocupacion.completa(sorteo)
+    return [_evento(datos)], datos["v"]
+
+
+async def _flujo_eventos(sorteo_id, version):
+    fin = time.monotonic() + settings.SORTEO_EVENTOS_SEGUNDOS
+    yield "retry: 3000\n\n"
+    latido = time.monotonic()
+    while True:
+        # Fuera del hilo único de las vistas síncronas: con él, cada flujo
+        # abierto esperaría en cola a las consultas de todos los demás.
+        eventos, version = await sync_to_async(_eventos_pendientes, thread_sensitive=False)(sorteo_id, version)
+        for evento in eventos:
+            yield evento
+        ahora = time.monotonic()
+        if eventos:
+            latido = ahora
+        elif ahora - latido >= EVENTOS_LATIDO_SEGUNDOS:
+            yield ": latido\n\n"
+            latido = ahora
+        if ahora >= fin:
+            return
+        await asyncio.sleep(EVENTOS_INTERVALO_SEGUNDOS)
+
+
+async def eventos(request):
+    """
+    Ocupación en vivo por server-sent events, en lugar del sondeo.
+
+    Lee de `CambioOcupacion`, que escriben en la base de datos las mismas
+    transacciones que reservan, cobran o liberan: funciona con varios workers
+    sin broker. Cada flujo mira una vez por segundo la versión del sorteo, una
+    consulta por clave primaria, y solo lee el registro si ha cambiado.
+
+    El navegador reanuda con `Last-Event-ID` (la versión que ya tiene) al
+    reconectar; la primera vez la pasa en `?desde=`.
+    """
+    if not settings.SORTEO_EVENTOS:
+        raise Http404("Los eventos en vivo están desactivados.")
+    sorteo = await sync_to_async(_sorteo_activo)()
+    try:
+        version = int(request.headers.get("Last-Event-ID") or request.GET["desde"])
+    except (KeyError, ValueError):
+        version = None
+
+    respuesta = StreamingHttpResponse(_flujo_eventos(sorteo.pk, version), content_type="text/event-stream")
+    respuesta["Cache-Control"] = "no-cache"
+    # nginx y similares no deben acumular la respuesta antes de mandarla.
+    respuesta["X-Accel-Buffering"] = "no"
+    return respuesta
 
 
 @require_POST
@@ -246,7 +374,8 @@ def reservar(request):
         else:
             pedido = reservar_cantidad(sorteo, cantidad, datos)
     except ErrorSorteo as exc:
-        return JsonResponse({"error": str(exc), "ocupadas": _ocupadas(sorteo)}, status=409)
+        sorteo.refresh_from_db(fields=["version_ocupacion", *CONTADORES.values()])
+        return JsonResponse({"error": str(exc), "ocupacion": ocupacion.completa(sorteo)}, status=409)
 
     # TODO(paso 3): crear aquí la sesión de Stripe Checkout y devolver su URL.
     return JsonResponse({"url": "/sorteo/pago/{}/".format(pedido.id)})
@@ -6,7 +6,8 @@ from django.urls import reverse
 
 from accounts import views
 from accounts.models import UserAccess
-from accounts.utils import is_direccion_user, resolve_permissions
+from accounts.utils import is_admin_user, is_direccion_user, resolve_permissions, use_custom_permissions
+from core.views import _admin_notify_users
 
 from .factories import UserFactory
 
@@ -106,3 +107,28 @@ def test_webpush_send_patches_pywebpush_curve_compatibility(monkeypatch):
     assert seen["content_encoding"] == "aes128gcm"
     assert seen["curve_call_works"] is True
     assert isinstance(views.pywebpush.ec.SECP256R1, type)
+
+
+def test_permissions_are_resolved_once_per_user_object(django_assert_num_queries):
+    user = UserFactory()
+    UserAccess.objects.create(user=user, role="Dirección")
+    user = type(user).objects.get(pk=user.pk)
+
+    with django_assert_num_queries(1):
+        for _ in range(5):
+            assert resolve_permissions(user)["can_inversores"] is True
+            assert is_direccion_user(user)
+            assert not is_admin_user(user)
+            assert not use_custom_permissions(user)
+
+
+def test_admin_notify_users_uses_a_single_query(direccion_user, django_assert_num_queries):
+    superuser = UserFactory(is_superuser=True)
+    for _ in range(3):
+        UserAccess.objects.create(user=UserFactory(), role=UserAccess.ROLE_COMERCIAL)
+    UserFactory()
+
+    with django_assert_num_queries(1):
+        users = _admin_notify_users()
+
+    assert {u.pk for u in users} == {direccion_user.pk, superuser.pk}
@@ -1,10 +1,19 @@
+from datetime import timedelta
 from types import SimpleNamespace
 
+import pytest
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import connection
 from django.http import HttpResponse
 from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from accounts.middleware import RoleAccessMiddleware
+from accounts.middleware import HEARTBEAT_SECONDS, RoleAccessMiddleware, UserSessionMiddleware
+from accounts.models import UserSession
+
+from .factories import UserFactory
 
 
 def _make_request(username: str) -> SimpleNamespace:
@@ -56,3 +65,58 @@ def test_non_bypass_user_is_redirected_to_two_factor_setup(monkeypatch):
 
     assert response.status_code == 302
     assert response.url == reverse("two_factor:setup")
+
+
+def _session_request(user, session, ip="10.0.0.1", agent="Navegador"):
+    request = RequestFactory().get("/app/", REMOTE_ADDR=ip, HTTP_USER_AGENT=agent)
+    request.user = user
+    request.session = session
+    return request
+
+
+def _queries(queries):
+    return [q["sql"] for q in queries.captured_queries]
+
+
+@pytest.mark.django_db
+def test_session_heartbeat_skips_the_database_within_the_interval():
+    user = UserFactory()
+    session = SessionStore()
+    middleware = UserSessionMiddleware(lambda req: HttpResponse("ok"))
+    middleware(_session_request(user, session))
+
+    with CaptureQueriesContext(connection) as queries:
+        for _ in range(5):
+            middleware(_session_request(user, session))
+
+    # Ni la tabla de sesiones ni la caché (que por defecto también es una tabla).
+    assert _queries(queries) == []
+    assert UserSession.objects.get(session_key=session.session_key).user == user
+
+
+@pytest.mark.django_db
+def test_session_heartbeat_updates_last_seen_once_the_interval_passes(monkeypatch):
+    user = UserFactory()
+    session = SessionStore()
+    middleware = UserSessionMiddleware(lambda req: HttpResponse("ok"))
+    middleware(_session_request(user, session))
+    later = timezone.now() + timedelta(seconds=HEARTBEAT_SECONDS + 1)
+    monkeypatch.setattr("accounts.middleware.timezone.now", lambda: later)
+
+    with CaptureQueriesContext(connection) as queries:
+        middleware(_session_request(user, session))
+
+    assert [sql.split()[0] for sql in _queries(queries)] == ["UPDATE"]
+    assert UserSession.objects.get(session_key=session.session_key).last_seen_at == later
+
+
+@pytest.mark.django_db
+def test_session_heartbeat_writes_ip_changes_immediately():
+    user = UserFactory()
+    session = SessionStore()
+    middleware = UserSessionMiddleware(lambda req: HttpResponse("ok"))
+    middleware(_session_request(user, session))
+
+    middleware(_session_request(user, session, ip="10.0.0.2"))
+
+    assert UserSession.objects.get(session_key=session.session_key).ip_address == "10.0.0.2"
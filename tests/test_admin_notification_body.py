@@ -25,7 +25,11 @@ def test_admin_notify_users_excludes_non_admin_username_bypass(monkeypatch):
     admin = SimpleNamespace(username="admin")
     mperez = SimpleNamespace(username="mperez")
 
-    monkeypatch.setattr(core_views.User.objects, "filter", lambda **kwargs: [admin, mperez])
+    monkeypatch.setattr(
+        core_views.User.objects,
+        "filter",
+        lambda *args, **kwargs: SimpleNamespace(select_related=lambda *fields: [admin, mperez]),
+    )
     monkeypatch.setattr(core_views, "is_admin_user", lambda user: getattr(user, "username", "") == "admin")
     monkeypatch.setattr(core_views, "is_direccion_user", lambda user: False)
 
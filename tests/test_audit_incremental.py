@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from core.models import EstadoAuditoria, EstudioSnapshot, GastoProyecto
+from core.services import audit_state
+from core.services.inversure_metric_audit import InversureMetricAuditService
+
+from .factories import EstudioFactory
+from .financial_audit_support import build_audit_portfolio
+
+pytestmark = pytest.mark.django_db
+
+
+def _row_keys(rows):
+    return sorted(
+        (row["project_id"], row["surface"], row["subject_id"], row["metric"], str(row["shown_value"]), row["severity"])
+        for row in rows
+    )
+
+
+def _audited_ids(service, **kwargs):
+    audited = []
+    original = service.audit_project
+
+    def _counting(project):
+        audited.append(project.id)
+        return original(project)
+
+    with patch.object(service, "audit_project", side_effect=_counting):
+        report = service.audit(incremental=True, **kwargs)
+    return report, audited
+
+
+def test_la_segunda_auditoria_reutiliza_los_proyectos_sin_cambios(direccion_user):
+    scenarios = build_audit_portfolio()
+    full = InversureMetricAuditService(viewer_user=direccion_user).audit()
+
+    service = InversureMetricAuditService(viewer_user=direccion_user)
+    first, audited_first = _audited_ids(service)
+    second, audited_second = _audited_ids(service)
+
+    assert len(audited_first) == len(scenarios)
+    assert audited_second == []
+    assert second["reused_project_count"] == len(scenarios)
+    assert _row_keys(second["rows"]) == _row_keys(first["rows"]) == _row_keys(full["rows"])
+    assert second["summary"] == first["summary"]
+    assert [r["project_id"] for r in second["project_results"]] == [s.project.id for s in scenarios]
+
+
+def test_un_gasto_o_una_participacion_nuevos_vuelven_a_auditar_el_proyecto(direccion_user):
+    scenarios = build_audit_portfolio()
+    service = InversureMetricAuditService(viewer_user=direccion_user)
+    _audited_ids(service)
+
+    gasto = GastoProyecto.objects.filter(proyecto=scenarios[0].project).first()
+    gasto.importe = (gasto.importe or Decimal("0")) + Decimal("10.00")
+    gasto.save()
+    participacion = scenarios[1].participations[0]
+    participacion.importe_invertido += Decimal("1.00")
+    participacion.save()
+
+    _, audited = _audited_ids(service)
+
+    assert sorted(audited) == sorted([scenarios[0].project.id, scenarios[1].project.id])
+
+
+def test_cambiar_el_snapshot_de_origen_vuelve_a_auditar_el_proyecto(direccion_user):
+    scenarios = build_audit_portfolio()
+    snapshot = EstudioSnapshot.objects.create(
+        estudio=EstudioFactory(), codigo_version="EST-1-v1", datos={"inversor": {"roi": 10}}
+    )
+    proyecto = scenarios[0].project
+    proyecto.origen_snapshot = snapshot
+    proyecto.save(update_fields=["origen_snapshot"])
+    service = InversureMetricAuditService(viewer_user=direccion_user)
+    _audited_ids(service)
+
+    snapshot.datos = {"inversor": {"roi": 12}}
+    snapshot.save()
+    _, audited = _audited_ids(service)
+
+    assert audited == [proyecto.id]
+
+
+def test_otro_usuario_no_reutiliza_lo_auditado(direccion_user, admin_user):
+    build_audit_portfolio()
+    _audited_ids(InversureMetricAuditService(viewer_user=direccion_user))
+
+    _, audited = _audited_ids(InversureMetricAuditService(viewer_user=admin_user))
+
+    assert len(audited) == 5
+
+
+def test_otro_codigo_no_reutiliza_lo_auditado(direccion_user, monkeypatch):
+    scenarios = build_audit_portfolio()
+    service = InversureMetricAuditService(viewer_user=direccion_user)
+    _audited_ids(service)
+
+    monkeypatch.setattr(audit_state, "audit_code_signature", lambda: "despliegue-nuevo")
+    _, audited = _audited_ids(service)
+
+    assert len(audited) == len(scenarios)
+
+
+def test_sin_incremental_no_se_guarda_estado(direccion_user):
+    build_audit_portfolio()
+
+    InversureMetricAuditService(viewer_user=direccion_user).audit()
+
+    assert not EstadoAuditoria.objects.exists()
+
+
+@pytest.mark.parametrize(
+    "command",
+    ["audit_kpis", "audit_logica_economica", "audit_integridad_datos"],
+)
+def test_los_comandos_repiten_el_informe_sin_recalcular(command):
+    build_audit_portfolio()
+    first = StringIO()
+    call_command(command, "--incremental", stdout=first)
+    second = StringIO()
+    call_command(command, "--incremental", stdout=second)
+
+    def informe(out):
+        return [linea for linea in out.getvalue().splitlines() if not linea.startswith("Sin cambios")]
+
+    assert informe(second) == informe(first)
+    assert "Sin cambios desde la auditoría anterior: 0/5" in first.getvalue()
+    assert "Sin cambios desde la auditoría anterior: 5/5" in second.getvalue()
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ("audit_kpis", "--fix-participacion"),
+        ("audit_kpis", "--fix-snapshot-roi"),
+        ("audit_integridad_datos", "--fix"),
+    ],
+)
+def test_incremental_no_se_combina_con_los_arreglos(args):
+    with pytest.raises(CommandError):
+        call_command(*args, "--incremental", stdout=StringIO())
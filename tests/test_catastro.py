@@ -0,0 +1,143 @@
+import json
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from django.core.cache import cache
+from django.utils import timezone
+
+from core.catastro import RUTA_COORDENADAS, RUTAS_DATOS, CatastroClient
+from core.models import ConsultaCatastro
+
+pytestmark = pytest.mark.django_db
+
+REFCAT = "1234567AB1234C0001XY"
+
+
+class _Catastro:
+    """Servidor HTTP local que imita las rutas del Catastro."""
+
+    def __init__(self):
+        self.peticiones = []
+        self.respuestas = {}
+        self.lentas = set()
+        self.estado = 200
+        servidor = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                servidor.peticiones.append((url.path, params))
+                clave = (url.path, params.get("RefCat") or params.get("RC"))
+                if clave in servidor.lentas:
+                    time.sleep(1.5)
+                cuerpo = json.dumps(servidor.respuestas.get(clave, {})).encode()
+                self.send_response(servidor.estado)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, *args):
+                pass
+
+        self.http = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.url = "http://127.0.0.1:{}".format(self.http.server_address[1])
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+
+    def cerrar(self):
+        self.http.shutdown()
+        self.http.server_close()
+
+
+@pytest.fixture
+def catastro(settings):
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    cache.clear()
+    servidor = _Catastro()
+    yield servidor
+    servidor.cerrar()
+    cache.clear()
+
+
+def test_la_respuesta_se_guarda_y_no_se_vuelve_a_preguntar(catastro):
+    catastro.respuestas[(RUTA_COORDENADAS, REFCAT)] = {"coord": {"geo": {"xcen": "-3,70", "ycen": "40,41"}}}
+    cliente = CatastroClient(catastro.url)
+
+    assert cliente.coordenadas(REFCAT) == (-3.70, 40.41)
+    time.sleep(0.3)  # las variantes que no hacían falta terminan por su cuenta
+    peticiones = len(catastro.peticiones)
+    assert cliente.coordenadas(REFCAT.lower()) == (-3.70, 40.41)
+
+    assert len(catastro.peticiones) == peticiones
+    assert ConsultaCatastro.objects.get(tipo="coordenadas").resultado == [-3.70, 40.41]
+
+
+def test_las_variantes_van_a_la_vez_y_no_se_espera_a_las_de_detras(catastro):
+    # Las variantes de la parcela tardan, pero la del inmueble ya tiene datos.
+    catastro.lentas.update((ruta, REFCAT[:14]) for ruta in RUTAS_DATOS)
+    catastro.respuestas[(RUTAS_DATOS[1], REFCAT)] = {"bico": {"bi": {"ldt": "CL MAYOR 1", "luso": "Residencial"}}}
+    cliente = CatastroClient(catastro.url, timeout=(2, 3))
+
+    inicio = time.monotonic()
+    datos = cliente.datos_no_protegidos(REFCAT)
+
+    assert time.monotonic() - inicio < 1.2
+    assert datos["direccion"] == "CL MAYOR 1"
+    assert datos["ref_catastral"] == REFCAT
+
+
+def test_la_parcela_no_gana_al_inmueble_aunque_conteste_antes(catastro):
+    catastro.lentas.add((RUTAS_DATOS[0], REFCAT))
+    catastro.respuestas[(RUTAS_DATOS[0], REFCAT)] = {
+        "bico": {"bi": {"ldt": "CL MAYOR 1 Pl:02 Pt:B", "luso": "Residencial"}}
+    }
+    catastro.respuestas[(RUTAS_DATOS[0], REFCAT[:14])] = {"bico": {"bi": {"ldt": "CL MAYOR 1", "luso": "Residencial"}}}
+    cliente = CatastroClient(catastro.url, timeout=(2, 3))
+
+    datos = cliente.datos_no_protegidos(REFCAT)
+
+    assert datos["direccion"] == "CL MAYOR 1 Pl:02 Pt:B"
+    assert ConsultaCatastro.objects.get(tipo="datos").resultado["direccion"] == "CL MAYOR 1 Pl:02 Pt:B"
+
+
+def test_una_referencia_inexistente_se_recuerda_poco_tiempo(catastro):
+    cliente = CatastroClient(catastro.url)
+
+    assert cliente.datos_no_protegidos(REFCAT) is None
+    consulta = ConsultaCatastro.objects.get(tipo="datos")
+    assert consulta.encontrado is False
+
+    peticiones = len(catastro.peticiones)
+    assert cliente.datos_no_protegidos(REFCAT) is None
+    assert len(catastro.peticiones) == peticiones
+
+    ConsultaCatastro.objects.filter(pk=consulta.pk).update(consultado=timezone.now() - timedelta(days=2))
+    cliente.datos_no_protegidos(REFCAT)
+    assert len(catastro.peticiones) > peticiones
+
+
+def test_con_el_catastro_caido_se_corta_y_se_usa_lo_guardado(catastro, settings):
+    settings.CATASTRO_FALLOS_PARA_CORTAR = 2
+    ConsultaCatastro.objects.create(
+        ref_catastral=REFCAT,
+        tipo="coordenadas",
+        resultado=[1.0, 2.0],
+        consultado=timezone.now() - timedelta(days=365),
+    )
+    catastro.estado = 503
+    cliente = CatastroClient(catastro.url)
+
+    assert cliente.coordenadas(REFCAT) == (1.0, 2.0)
+    assert cliente.coordenadas("9999999ZZ9999Z") is None
+    peticiones = len(catastro.peticiones)
+
+    # Circuito abierto: ni una petición más, y sigue saliendo lo guardado.
+    assert cliente.coordenadas(REFCAT) == (1.0, 2.0)
+    assert cliente.datos_no_protegidos("8888888YY8888Y") is None
+    assert len(catastro.peticiones) == peticiones
+    # Un fallo no se guarda como "no existe".
+    assert not ConsultaCatastro.objects.filter(ref_catastral="9999999ZZ9999Z").exists()
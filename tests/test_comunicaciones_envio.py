@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+from decimal import Decimal
+
+import pytest
+from django.core import mail
+from django.core.management import call_command
+from django.urls import reverse
+
+from core import views as core_views
+from core.models import ComunicacionInversor, EnvioComunicacion, EnvioComunicacionDestinatario, Participacion
+from core.services import communication_jobs
+
+from .factories import ClienteFactory, ProyectoFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def _sin_pdf(monkeypatch, settings):
+    settings.COMUNICACIONES_EN_SEGUNDO_PLANO = True
+    settings.EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
+    monkeypatch.setattr(core_views, "_build_carta_pdf", lambda *args, **kwargs: None)
+
+
+def _proyecto_con_inversores(n=3):
+    proyecto = ProyectoFactory()
+    for i in range(n):
+        Participacion.objects.create(
+            proyecto=proyecto,
+            cliente=ClienteFactory(nombre=f"Inversor {i}"),
+            importe_invertido=Decimal("1000.00"),
+            estado="confirmada",
+        )
+    return proyecto
+
+
+def _encolar(client, proyecto):
+    return client.post(
+        reverse("core:proyecto_comunicaciones", args=[proyecto.id]),
+        data={"titulo": "Aviso", "mensaje": "Obras terminadas"},
+        content_type="application/json",
+    )
+
+
+def test_bulk_communication_is_queued_and_sent_by_the_worker(verified_client):
+    proyecto = _proyecto_con_inversores(3)
+
+    response = _encolar(verified_client, proyecto)
+
+    assert response.status_code == 202
+    body = response.json()
+    assert body["destinatarios"] == 3
+    assert ComunicacionInversor.objects.count() == 0
+    assert len(mail.outbox) == 0
+
+    call_command("procesar_comunicaciones", "--once")
+
+    assert ComunicacionInversor.objects.filter(proyecto=proyecto).count() == 3
+    assert len(mail.outbox) == 3
+    estado = verified_client.get(body["estado_url"]).json()
+    assert estado["estado"] == EnvioComunicacion.Estado.COMPLETADO
+    assert (estado["enviados"], estado["pendientes"], estado["progreso"]) == (3, 0, 100)
+    assert estado["finalizado"] is True
+
+
+def test_inline_mode_sends_within_the_request(verified_client, settings):
+    settings.COMUNICACIONES_EN_SEGUNDO_PLANO = False
+    proyecto = _proyecto_con_inversores(2)
+
+    response = _encolar(verified_client, proyecto)
+
+    assert response.status_code == 200
+    assert response.json()["enviadas"] == 2
+    assert ComunicacionInversor.objects.filter(proyecto=proyecto).count() == 2
+
+
+def test_failed_recipient_is_retried_and_then_given_up(verified_client, monkeypatch):
+    proyecto = _proyecto_con_inversores(2)
+    fallidas = Participacion.objects.filter(proyecto=proyecto).order_by("id").first()
+    enviar = core_views._enviar_comunicacion_participacion
+    llamadas = []
+
+    def _enviar(request, proyecto, part, **kwargs):
+        llamadas.append(part.id)
+        if part.id == fallidas.id:
+            raise RuntimeError("SMTP caído")
+        return enviar(request, proyecto, part, **kwargs)
+
+    monkeypatch.setattr(core_views, "_enviar_comunicacion_participacion", _enviar)
+    body = _encolar(verified_client, proyecto).json()
+
+    resumen = communication_jobs.process_pending(max_attempts=3, retry_delay=0)
+
+    assert llamadas.count(fallidas.id) == 3
+    assert resumen["procesados"] == 4
+    destinatario = EnvioComunicacionDestinatario.objects.get(participacion=fallidas)
+    assert (destinatario.estado, destinatario.intentos) == ("error", 3)
+    estado = verified_client.get(body["estado_url"]).json()
+    assert estado["estado"] == EnvioComunicacion.Estado.CON_ERRORES
+    assert (estado["enviados"], estado["errores"]) == (1, 1)
+    assert estado["fallos"][0]["error"] == "SMTP caído"
+
+
+def test_a_claimed_recipient_is_not_handed_out_twice(verified_client):
+    proyecto = _proyecto_con_inversores(1)
+    _encolar(verified_client, proyecto)
+
+    primero = communication_jobs.claim_next()
+
+    assert primero is not None
+    assert communication_jobs.claim_next() is None
+    assert EnvioComunicacion.objects.get().estado == EnvioComunicacion.Estado.EN_CURSO
+
+
+def test_status_endpoint_only_serves_jobs_of_the_project(verified_client):
+    proyecto = _proyecto_con_inversores(1)
+    otro = ProyectoFactory()
+    envio_id = _encolar(verified_client, proyecto).json()["envio_id"]
+
+    response = verified_client.get(reverse("core:proyecto_comunicacion_envio", args=[otro.id, envio_id]))
+
+    assert response.status_code == 404
+
+
+def _pdf_en_blanco(paginas=1):
+    from io import BytesIO
+
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for _ in range(paginas):
+        writer.add_blank_page(width=200, height=200)
+    buffer = BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def test_annexes_are_read_and_the_cover_rendered_once_per_job(verified_client, monkeypatch, settings, tmp_path):
+    from io import BytesIO
+
+    from django.core.files.base import ContentFile
+    from django.db.models.fields.files import FieldFile
+    from pypdf import PdfReader
+
+    from core.models import DocumentoProyecto
+
+    settings.MEDIA_ROOT = str(tmp_path)
+    proyecto = _proyecto_con_inversores(3)
+    docs = [
+        DocumentoProyecto.objects.create(
+            proyecto=proyecto,
+            categoria="inmueble",
+            titulo=f"Nota simple {i}",
+            archivo=ContentFile(_pdf_en_blanco(2), name=f"nota_{i}.pdf"),
+        )
+        for i in range(2)
+    ]
+    monkeypatch.setattr(core_views, "_build_carta_pdf", lambda *args, **kwargs: _pdf_en_blanco(1))
+    portadas = []
+    monkeypatch.setattr(core_views, "_build_anexos_cover_pdf", lambda request: portadas.append(1) or _pdf_en_blanco(1))
+    abiertos = []
+    abrir = FieldFile.open
+    monkeypatch.setattr(FieldFile, "open", lambda self, mode="rb": abiertos.append(self.name) or abrir(self, mode))
+    adjuntos = []
+    monkeypatch.setattr(
+        core_views,
+        "_send_inversor_email",
+        lambda request, perfil, titulo, mensaje, attachments=None: adjuntos.append(attachments) or True,
+    )
+
+    verified_client.post(
+        reverse("core:proyecto_comunicaciones", args=[proyecto.id]),
+        data={"titulo": "Aviso", "mensaje": "Anexos", "doc_ids": [d.id for d in docs]},
+        content_type="application/json",
+    )
+    communication_jobs.process_pending()
+
+    assert len(portadas) == 1
+    assert len(abiertos) == 2
+    assert len(adjuntos) == 3
+    # Carta (1) + portada (1) + dos anexos de dos páginas.
+    assert {len(PdfReader(BytesIO(a[0][1])).pages) for a in adjuntos} == {6}
+
+
+def test_a_rejected_email_is_retried_without_duplicating_the_communication(verified_client, monkeypatch):
+    proyecto = _proyecto_con_inversores(1)
+    respuestas = [False, True]
+    monkeypatch.setattr(core_views, "_send_inversor_email", lambda *args, **kwargs: respuestas.pop(0))
+    _encolar(verified_client, proyecto)
+
+    resumen = communication_jobs.process_pending(retry_delay=0)
+
+    assert resumen[EnvioComunicacionDestinatario.Estado.ENVIADO] == 1
+    assert EnvioComunicacionDestinatario.objects.get().intentos == 2
+    assert ComunicacionInversor.objects.filter(proyecto=proyecto).count() == 1
+
+
+def test_a_bulk_pass_reuses_one_smtp_connection(verified_client, monkeypatch):
+    from django.core.mail.backends.locmem import EmailBackend
+
+    proyecto = _proyecto_con_inversores(3)
+    _encolar(verified_client, proyecto)
+    abiertas = []
+    abrir = EmailBackend.open
+    monkeypatch.setattr(EmailBackend, "open", lambda self: abiertas.append(self) or abrir(self))
+
+    communication_jobs.process_pending()
+
+    assert len(mail.outbox) == 3
+    assert len(abiertas) == 1
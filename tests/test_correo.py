@@ -0,0 +1,78 @@
+import smtplib
+
+import pytest
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.mail.backends.locmem import EmailBackend
+
+from core import correo
+
+
+@pytest.fixture(autouse=True)
+def _conexion_limpia():
+    correo._cerrar()
+    yield
+    correo._cerrar()
+
+
+def _mensaje(i=0):
+    return EmailMessage(f"Asunto {i}", "Cuerpo", "from@example.com", [f"to{i}@example.com"])
+
+
+def test_los_correos_sueltos_reutilizan_la_conexion(monkeypatch, settings):
+    settings.EMAIL_CONEXION_SEGUNDOS = 30
+    settings.EMAIL_LOTE = 2
+    abiertas = []
+    abrir = EmailBackend.open
+    monkeypatch.setattr(EmailBackend, "open", lambda self: abiertas.append(self) or abrir(self))
+
+    resultados = [correo.enviar(_mensaje(i)) for i in range(5)]
+
+    assert all(resultados)
+    assert len(mail.outbox) == 5
+    # Una conexión nueva cada dos mensajes.
+    assert len(abiertas) == 3
+
+
+def test_sin_reutilizar_cada_correo_abre_la_suya(monkeypatch, settings):
+    settings.EMAIL_CONEXION_SEGUNDOS = 0
+    creadas = []
+    iniciar = EmailBackend.__init__
+    monkeypatch.setattr(EmailBackend, "__init__", lambda self, **kw: creadas.append(self) or iniciar(self, **kw))
+
+    correo.enviar(_mensaje(1))
+    correo.enviar(_mensaje(2))
+
+    assert len(creadas) == 2
+
+
+def test_un_fallo_se_informa_por_mensaje_sin_cortar_el_resto(monkeypatch):
+    enviar = EmailBackend.send_messages
+
+    def _send(self, mensajes):
+        if mensajes[0].to == ["to1@example.com"]:
+            raise smtplib.SMTPRecipientsRefused({"to1@example.com": (550, b"no existe")})
+        return enviar(self, mensajes)
+
+    monkeypatch.setattr(EmailBackend, "send_messages", _send)
+
+    resultados = correo.enviar_mensajes([_mensaje(i) for i in range(3)])
+
+    assert [r.enviado for r in resultados] == [True, False, True]
+    assert "to1@example.com" in resultados[1].error
+    assert len(mail.outbox) == 2
+
+
+def test_si_el_servidor_corta_la_conexion_se_reconecta(monkeypatch):
+    enviar = EmailBackend.send_messages
+    cortes = [True]
+
+    def _send(self, mensajes):
+        if cortes and cortes.pop():
+            raise smtplib.SMTPServerDisconnected("adiós")
+        return enviar(self, mensajes)
+
+    monkeypatch.setattr(EmailBackend, "send_messages", _send)
+
+    assert correo.enviar(_mensaje()).enviado
+    assert len(mail.outbox) == 1
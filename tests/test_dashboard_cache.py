@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+
+from accounts.models import UserAccess
+from core.models import GastoProyecto
+from core.services.financial_dashboard import (
+    FinancialDashboardFilters,
+    FinancialDashboardService,
+    build_financial_dashboard_data,
+)
+
+from .factories import ProyectoFactory, UserAccessFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def _build_spy():
+    return patch.object(FinancialDashboardService, "build", autospec=True, side_effect=FinancialDashboardService.build)
+
+
+def test_repeated_requests_reuse_the_cached_payload(direccion_user):
+    ProyectoFactory(nombre="Proyecto cacheado")
+
+    with _build_spy() as spy:
+        first = build_financial_dashboard_data(direccion_user)
+        second = build_financial_dashboard_data(direccion_user)
+
+    assert spy.call_count == 1
+    assert second == first
+
+
+def test_other_directors_share_the_payload_but_filters_do_not(direccion_user):
+    project = ProyectoFactory(nombre="Proyecto compartido")
+    other = UserFactory()
+    UserAccessFactory(user=other, role=UserAccess.ROLE_DIRECCION)
+
+    with _build_spy() as spy:
+        build_financial_dashboard_data(direccion_user)
+        build_financial_dashboard_data(other)
+        build_financial_dashboard_data(other, FinancialDashboardFilters(proyecto_id=project.id))
+
+    assert spy.call_count == 2
+
+
+def test_comercial_users_get_their_own_payload():
+    ProyectoFactory(nombre="Proyecto comercial")
+    first, second = UserFactory(), UserFactory()
+    UserAccessFactory(user=first, role=UserAccess.ROLE_COMERCIAL)
+    UserAccessFactory(user=second, role=UserAccess.ROLE_COMERCIAL)
+
+    with _build_spy() as spy:
+        build_financial_dashboard_data(first)
+        build_financial_dashboard_data(second)
+
+    assert spy.call_count == 2
+
+
+def test_financial_writes_invalidate_the_cached_payload(direccion_user):
+    project = ProyectoFactory(nombre="Proyecto con gasto")
+    before = build_financial_dashboard_data(direccion_user)
+
+    GastoProyecto.objects.create(
+        proyecto=project,
+        fecha=date(2026, 1, 1),
+        categoria="adquisicion",
+        concepto="Compraventa inmueble",
+        importe=Decimal("100000.00"),
+        importe_real=Decimal("100000.00"),
+        estado="confirmado",
+        imputable_inversores=True,
+        pagado=True,
+    )
+    after = build_financial_dashboard_data(direccion_user)
+
+    assert before["projects"][0]["gastos_real_total"] == 0.0
+    assert after["projects"][0]["gastos_real_total"] == pytest.approx(100000.0)
+
+
+def test_zero_timeout_disables_the_cache(settings, direccion_user):
+    settings.FINANCIAL_DASHBOARD_CACHE_SECONDS = 0
+    ProyectoFactory(nombre="Proyecto sin caché")
+
+    with _build_spy() as spy:
+        build_financial_dashboard_data(direccion_user)
+        build_financial_dashboard_data(direccion_user)
+
+    assert spy.call_count == 2
@@ -0,0 +1,187 @@
+from io import BytesIO
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from core import derivados
+from core import views as core_views
+from core.models import DocumentoProyecto
+
+from .factories import ProyectoFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def _png(ancho=1240, alto=1754):
+    buf = BytesIO()
+    Image.new("RGB", (ancho, alto), "white").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _foto(ancho, alto, formato="JPEG"):
+    buf = BytesIO()
+    Image.effect_noise((ancho, alto), 60).convert("RGB").save(buf, format=formato, quality=95)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def rasterizadas(monkeypatch, settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    llamadas = []
+    monkeypatch.setattr(derivados, "rasterizar_pdf", lambda pdf_bytes, dpi=150: llamadas.append(dpi) or _png())
+    return llamadas
+
+
+def _documento(nombre="plano.pdf", contenido=b"%PDF-1.4 plano", **kwargs):
+    kwargs.setdefault("proyecto", ProyectoFactory())
+    kwargs.setdefault("categoria", "inmueble")
+    return DocumentoProyecto.objects.create(
+        titulo="Plano",
+        archivo=ContentFile(contenido, name=nombre),
+        **kwargs,
+    )
+
+
+def test_el_pdf_se_rasteriza_una_vez_y_se_sirve_por_url(rasterizadas, rf):
+    documento = _documento()
+    request = rf.get("/")
+
+    url = core_views._documento_image_url(request, documento)
+
+    assert url.startswith("http://testserver/media/derivados/")
+    assert not url.startswith("data:")
+    version = derivados.version_archivo(documento.archivo)
+    ruta = derivados.ruta_derivado(documento.archivo.name, "vista", version=version)
+    assert url.endswith(ruta)
+    with default_storage.open(ruta) as fh, Image.open(fh) as imagen:
+        assert max(imagen.size) == 1600
+    with default_storage.open(derivados.ruta_derivado(documento.archivo.name, "miniatura", version=version)) as fh:
+        assert max(Image.open(fh).size) == 480
+
+    # La segunda vez se encuentra lo ya guardado.
+    assert core_views._documento_image_url(request, documento) == url
+    assert len(rasterizadas) == 1
+
+
+def test_los_documentos_que_no_son_pdf_ni_imagen_se_sirven_tal_cual(rasterizadas, rf):
+    documento = _documento("acta.docx")
+
+    url = core_views._documento_image_url(rf.get("/"), documento)
+
+    assert url == "http://testserver" + documento.archivo.url
+    assert rasterizadas == []
+
+
+def test_al_borrar_el_documento_se_borran_sus_derivados(rasterizadas, django_capture_on_commit_callbacks):
+    documento = _documento()
+    ruta = derivados.derivado(documento.archivo, "miniatura")
+    assert default_storage.exists(ruta)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        documento.delete()
+
+    assert not default_storage.exists(ruta)
+
+
+def test_subir_otro_archivo_con_el_mismo_nombre_da_otra_vista(rasterizadas):
+    """S3 sobrescribe lo que se sube con el mismo nombre."""
+    documento = _documento()
+    antes = derivados.derivado(documento.archivo, "vista")
+
+    nombre = documento.archivo.name
+    default_storage.delete(nombre)
+    assert default_storage.save(nombre, ContentFile(b"%PDF-1.4 otro plano distinto")) == nombre
+    despues = derivados.derivado(documento.archivo, "vista")
+
+    assert despues != antes
+    assert default_storage.exists(despues)
+    assert not default_storage.exists(antes)
+    assert len(rasterizadas) == 2
+
+
+def test_un_derivado_borrado_en_otro_proceso_se_vuelve_a_generar(rasterizadas):
+    documento = _documento()
+    ruta = derivados.derivado(documento.archivo, "vista")
+
+    # Lo que haría otro worker al borrar el documento: este no se entera.
+    derivados.borrar_derivados(documento.archivo)
+
+    assert derivados.derivado(documento.archivo, "vista") == ruta
+    assert default_storage.exists(ruta)
+    assert len(rasterizadas) == 2
+
+
+def test_el_png_de_un_pdf_en_memoria_no_se_repite(monkeypatch):
+    monkeypatch.setattr(derivados, "_png_memo", type(derivados._png_memo)())
+    llamadas = []
+    monkeypatch.setattr(derivados, "rasterizar_pdf", lambda pdf_bytes, dpi=150: llamadas.append(1) or b"png")
+
+    assert core_views._pdf_bytes_to_png(b"%PDF-1.4 a") == b"png"
+    assert core_views._pdf_bytes_to_png(b"%PDF-1.4 a") == b"png"
+    assert core_views._pdf_bytes_to_png(b"%PDF-1.4 b") == b"png"
+
+    assert len(llamadas) == 2
+
+
+def test_las_fotos_grandes_se_reducen_a_su_caja_una_sola_vez(rasterizadas, rf, monkeypatch):
+    documento = _documento("salon.jpg", _foto(4000, 3000), categoria="fotografias")
+    request = rf.get("/")
+
+    url = core_views._documento_foto_url(request, documento, "detalle")
+
+    assert url != "http://testserver" + documento.archivo.url
+    ruta = url.split("/media/", 1)[1]
+    ancho, alto = derivados.medida_caja("detalle")
+    with default_storage.open(ruta) as fh, Image.open(fh) as copia:
+        assert copia.format == "JPEG"
+        # Cubre la caja (la foto va como fondo `cover`) sin pasarse de ella.
+        assert copia.width >= ancho and copia.height >= alto
+        assert min(copia.width - ancho, copia.height - alto) <= 1
+    assert default_storage.size(ruta) < documento.archivo.size / 5
+
+    abiertos = []
+    abrir = type(documento.archivo).open
+    monkeypatch.setattr(
+        type(documento.archivo), "open", lambda self, mode="rb": abiertos.append(1) or abrir(self, mode)
+    )
+    assert core_views._documento_foto_url(request, documento, "detalle") == url
+    assert abiertos == []
+
+
+def test_una_foto_que_ya_cabe_se_sirve_tal_cual(rasterizadas, rf, monkeypatch):
+    documento = _documento("plano.jpg", _foto(300, 200), categoria="fotografias")
+
+    url = core_views._documento_foto_url(rf.get("/"), documento, "portada")
+
+    assert url == "http://testserver" + documento.archivo.url
+    # La segunda vez no se abre la foto: queda la marca de que ya cabe.
+    abiertos = []
+    abrir = type(documento.archivo).open
+    monkeypatch.setattr(
+        type(documento.archivo), "open", lambda self, mode="rb": abiertos.append(1) or abrir(self, mode)
+    )
+    assert core_views._documento_foto_url(rf.get("/"), documento, "portada") == url
+    assert abiertos == []
+
+
+def test_un_png_pequeno_se_pasa_a_jpeg(rasterizadas, rf):
+    documento = _documento("logo.png", _foto(300, 200, "PNG"), categoria="fotografias")
+
+    url = core_views._documento_foto_url(rf.get("/"), documento, "portada")
+
+    assert url.endswith(".jpg")
+
+
+def test_el_anexo_de_imagen_usa_la_copia_de_impresion(rasterizadas, rf, monkeypatch):
+    documento = _documento("fachada.jpg", _foto(3000, 4000), categoria="fotografias")
+    html = []
+    monkeypatch.setattr(core_views, "render_pdf", lambda contenido, base_url=None: html.append(contenido) or b"%PDF")
+
+    core_views._documento_pdf_bytes(rf.get("/"), documento)
+
+    ruta = derivados.copia_impresion(documento.archivo, "pagina")
+    assert ruta.startswith("derivados/")
+    assert ruta in html[0]
+    assert documento.archivo.name not in html[0]
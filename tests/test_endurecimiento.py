@@ -45,6 +45,23 @@ def test_descifrar_con_otra_clave_queda_en_el_log(caplog, settings):
     seguridad._FERNET = None
 
 
+def test_el_mismo_cifrado_se_descifra_una_sola_vez(monkeypatch):
+    """Releer a los mismos clientes en una petición no vuelve a pagar Fernet."""
+    import core.security as seguridad
+
+    cifrado = encrypt_value("12345678Z")
+    llamadas = []
+    original = seguridad.Fernet.decrypt
+    monkeypatch.setattr(
+        seguridad.Fernet,
+        "decrypt",
+        lambda self, token, *args: llamadas.append(token) or original(self, token, *args),
+    )
+
+    assert [decrypt_value(cifrado) for _ in range(5)] == ["12345678Z"] * 5
+    assert len(llamadas) == 1
+
+
 # --- M3 · validación de ficheros subidos ----------------------------------
 
 
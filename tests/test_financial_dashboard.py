@@ -179,20 +179,16 @@ def _fake_core_views_factory(dataset):
     def _fake_get_snapshot_comunicacion(project):
         return {"inversor": {"comision_inversure_pct": 0.0}}
 
-    def _fake_resultado_desde_memoria(project, snapshot):
-        return dataset["project_payloads"][project.id]
-
-    def _fake_capital_objetivo_desde_memoria(project, snapshot):
-        return dataset["capital_objetivo"][project.id]
-
-    def _fake_beneficio_estimado_real_memoria(project):
-        return dataset["memory_payloads"][project.id]
+    def _fake_memoria_proyecto(project, snapshot):
+        return SimpleNamespace(
+            resultado=dataset["project_payloads"][project.id],
+            capital_objetivo=dataset["capital_objetivo"][project.id],
+            beneficio_estimado_real=dataset["memory_payloads"][project.id],
+        )
 
     return SimpleNamespace(
         _get_snapshot_comunicacion=_fake_get_snapshot_comunicacion,
-        _resultado_desde_memoria=_fake_resultado_desde_memoria,
-        _capital_objetivo_desde_memoria=_fake_capital_objetivo_desde_memoria,
-        _beneficio_estimado_real_memoria=_fake_beneficio_estimado_real_memoria,
+        _MemoriaProyecto=_fake_memoria_proyecto,
     )
 
 
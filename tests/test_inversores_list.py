@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import pytest
+from django.urls import reverse
+
+from core import views as core_views
+from core.models import Cliente, DocumentoInversor
+
+from .factories import ClienteFactory, InversorPerfilFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def test_inversores_list_signs_only_the_documents_of_the_visible_page(verified_client, monkeypatch):
+    for i in range(10):
+        perfil = InversorPerfilFactory(cliente=ClienteFactory(nombre=f"Inversor {i:02d}"))
+        DocumentoInversor.objects.create(inversor=perfil, titulo="Contrato", archivo=f"inversores/doc-{i}.pdf")
+    signed = []
+    monkeypatch.setattr(core_views, "_s3_presigned_url", lambda key: signed.append(key) or f"signed://{key}")
+
+    first = verified_client.get(reverse("core:inversores_list"))
+    signed_first_page = list(signed)
+    second = verified_client.get(reverse("core:inversores_list"), {"page": 2})
+
+    assert first.status_code == 200
+    assert len(signed_first_page) == 8
+    assert len(signed) == 10
+    assert b"signed://inversores/doc-0.pdf" in first.content
+    assert b"signed://inversores/doc-9.pdf" in second.content
+
+
+@pytest.mark.parametrize("q", ["Lucía", "87654", "LUCIA.ferrer", "ejemplo", "600 11", "1122"])
+def test_inversores_list_searches_encrypted_fields_in_the_database(verified_client, q):
+    ClienteFactory(
+        nombre="Lucía Ferrer", dni_cif="87654321X", email="lucia.ferrer@ejemplo.es", telefono="+34 600 111 122"
+    )
+    ClienteFactory(nombre="Otro Inversor", dni_cif="12345678Z", email="otro@example.com", telefono="699000000")
+
+    response = verified_client.get(reverse("core:inversores_list"), {"q": q})
+
+    nombres = [inv["cliente"].nombre for inv in response.context["inversores"]]
+    assert nombres == ["Lucía Ferrer"]
+    assert response.context["total_inversores"] == 2
+    assert response.context["page_obj"].paginator.count == 1
+
+
+def test_search_index_follows_changes_to_the_client():
+    cliente = ClienteFactory(nombre="Cliente", dni_cif="11111111H", email="antes@example.com", telefono="")
+
+    cliente.email = "despues@example.com"
+    cliente.save(update_fields=["email"])
+
+    assert not Cliente.objects.filter(Cliente.search_q("antes")).exists()
+    assert Cliente.objects.filter(Cliente.search_q("despues")).get() == cliente
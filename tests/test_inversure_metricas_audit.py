@@ -714,3 +714,76 @@ def test_audit_command_detects_discrepancy_and_fails_on_threshold(tmp_path, dire
 
     assert (tmp_path / "audit_inversure_metricas.csv").exists()
     assert (tmp_path / "audit_inversure_metricas.md").exists()
+
+
+def _row_keys(rows):
+    return sorted(
+        (row["project_id"], row["surface"], row["subject_id"], row["metric"], str(row["shown_value"]), row["severity"])
+        for row in rows
+    )
+
+
+def test_audit_service_builds_the_dashboard_once_for_the_portfolio(direccion_user):
+    from core import views as core_views
+
+    build_audit_portfolio()
+    service = InversureMetricAuditService(viewer_user=direccion_user)
+    per_project_rows = []
+    for project in service._load_projects(project_id=None, limit=None):
+        recalc = service.recalculate_project(project)
+        per_project_rows.extend(
+            row.to_dict() for row in service.compare_project(project, recalc, service.collect_surfaces(project))
+        )
+
+    calls = []
+    original = core_views.build_financial_dashboard_data
+
+    def _counting(user, filters=None):
+        calls.append(filters)
+        return original(user, filters)
+
+    with patch.object(core_views, "build_financial_dashboard_data", side_effect=_counting):
+        report = service.audit()
+
+    assert len(calls) == 2  # HTML y JSON, una vez para toda la cartera
+    assert all(getattr(f, "proyecto_id", None) is None for f in calls)
+    assert _row_keys(report["rows"]) == _row_keys(per_project_rows)
+
+
+class _InlinePool:
+    """Stands in for the process pool: same task split, run in this process."""
+
+    created = []
+
+    def __init__(self, max_workers, initializer=None, initargs=(), **kwargs):
+        self.max_workers = max_workers
+        initializer(*initargs)
+        _InlinePool.created.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def map(self, fn, *iterables):
+        return map(fn, *iterables)
+
+
+def test_audit_command_spreads_projects_over_jobs(direccion_user):
+    from core.services import inversure_metric_audit
+
+    build_audit_portfolio()
+    serial = InversureMetricAuditService(viewer_user=direccion_user).audit()
+    _InlinePool.created = []
+
+    with patch.object(inversure_metric_audit, "ProcessPoolExecutor", _InlinePool):
+        command_stdout = StringIO()
+        call_command("audit_inversure_metricas", jobs=3, fail_on_severity="critical", stdout=command_stdout)
+
+    assert [pool.max_workers for pool in _InlinePool.created] == [3]
+    assert "5 proyectos" in command_stdout.getvalue()
+    parallel = InversureMetricAuditService(viewer_user=direccion_user)
+    with patch.object(inversure_metric_audit, "ProcessPoolExecutor", _InlinePool):
+        report = parallel.audit(jobs=3)
+    assert _row_keys(report["rows"]) == _row_keys(serial["rows"])
@@ -10,6 +10,7 @@ from django.urls import reverse
 
 from core import views as core_views
 from core.models import GastoProyecto, IngresoProyecto
+from core.services.financial_dashboard import FinancialDashboardService
 
 from .factories import ProyectoFactory
 
@@ -126,3 +127,36 @@ def test_lista_proyectos_preserves_roi_when_capital_objective_derivation_fails(v
     assert proyecto_ctx.id == project.id
     assert proyecto_ctx.capital_objetivo == pytest.approx(0.0)
     assert proyecto_ctx.roi == pytest.approx(40.0)
+
+
+def test_dashboard_metric_calls_resultado_helper_once_per_project():
+    project = ProyectoFactory(nombre="Proyecto panel", estado="captacion")
+    GastoProyecto.objects.create(
+        proyecto=project,
+        fecha=date(2026, 1, 1),
+        categoria="adquisicion",
+        concepto="Compraventa inmueble",
+        importe=Decimal("100000.00"),
+        importe_estimado=Decimal("100000.00"),
+        importe_real=Decimal("100000.00"),
+        estado="confirmado",
+        imputable_inversores=True,
+        pagado=True,
+    )
+
+    with patch("core.views._resultado_desde_memoria", wraps=core_views._resultado_desde_memoria) as spy:
+        row = FinancialDashboardService(user=None).build_project_metric(project)
+
+    assert spy.call_count == 1
+    assert row["capital_objetivo"] == Decimal("100000.0")
+
+
+def test_memoria_proyecto_lists_movements_once(django_assert_num_queries):
+    project = ProyectoFactory(nombre="Proyecto memoria", estado="captacion")
+    memoria = core_views._MemoriaProyecto(project, {})
+
+    with django_assert_num_queries(2):
+        _ = memoria.resultado
+        _ = memoria.resultado_inversores
+        _ = memoria.capital_objetivo
+        _ = memoria.beneficio_estimado_real
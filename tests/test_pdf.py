@@ -331,3 +331,109 @@ def test_ningun_pdf_se_genera_saltandose_el_ayudante():
             culpables.append(str(ruta.relative_to(raiz)))
 
     assert culpables == [], "generan el PDF sin compartir las fuentes: {}".format(culpables)
+
+
+# --- Grupo de procesos --------------------------------------------------------
+
+
+def test_sin_procesos_el_pdf_se_maqueta_en_el_propio_hilo(monkeypatch, settings):
+    from core import pdf as core_pdf
+
+    settings.PDF_PROCESOS = 0
+    monkeypatch.setattr(core_pdf, "_obtener_grupo", lambda *a: pytest.fail("no debería usar el grupo"))
+    monkeypatch.setattr(core_pdf, "_render_local", lambda html, base_url=None: html.encode())
+
+    assert core_pdf.render_pdf("<p>x</p>") == b"<p>x</p>"
+
+
+def test_el_grupo_corta_por_tiempo_y_no_admite_mas_de_la_cola(monkeypatch, settings):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    from core import pdf as core_pdf
+
+    settings.PDF_PROCESOS = 1
+    settings.PDF_TIMEOUT = 0.2
+    settings.PDF_COLA_MAXIMA = 1
+    suelta = threading.Event()
+    ejecutor = ThreadPoolExecutor(max_workers=1)
+    plazas = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(core_pdf, "_obtener_grupo", lambda procesos, cola: (ejecutor, plazas))
+    monkeypatch.setattr(core_pdf, "_render_local", lambda html, base_url=None: suelta.wait(5) and b"%PDF-")
+
+    try:
+        with pytest.raises(core_pdf.PdfNoDisponible, match="tardado"):
+            core_pdf.render_pdf("<p>lento</p>")
+        # El primero sigue ocupando su plaza aunque ya nadie lo espere.
+        with pytest.raises(core_pdf.PdfNoDisponible, match="cola"):
+            core_pdf.render_pdf("<p>otro</p>")
+        suelta.set()
+        settings.PDF_TIMEOUT = 5
+        assert core_pdf.render_pdf("<p>ya</p>") == b"%PDF-"
+    finally:
+        suelta.set()
+        ejecutor.shutdown(wait=True)
+
+
+# --- Caché por contenido ------------------------------------------------------
+
+
+def test_el_mismo_html_se_sirve_de_la_cache(monkeypatch, settings, tmp_path):
+    from core import pdf as core_pdf
+
+    settings.PDF_PROCESOS = 0
+    settings.PDF_CACHE_DIR = str(tmp_path)
+    settings.PDF_CACHE_MAX_BYTES = 1024 * 1024
+    maquetados = []
+    monkeypatch.setattr(
+        core_pdf, "_render_local", lambda html, base_url=None: maquetados.append(html) or f"%PDF-{html}".encode()
+    )
+
+    primero = core_pdf.render_pdf("<p>memoria</p>", "https://a.test/", cachear=True)
+    segundo = core_pdf.render_pdf("<p>memoria</p>", "https://a.test/", cachear=True)
+    otra_base = core_pdf.render_pdf("<p>memoria</p>", "https://b.test/", cachear=True)
+
+    assert primero == segundo == otra_base == b"%PDF-<p>memoria</p>"
+    assert len(maquetados) == 2
+    assert len(list(tmp_path.glob("*/*.pdf"))) == 2
+
+
+def test_sin_pedirlo_no_se_guarda_nada_en_disco(monkeypatch, settings, tmp_path):
+    """Contratos y cartas llevan DNI e IBAN: no pueden quedarse en la caché."""
+    from core import pdf as core_pdf
+
+    settings.PDF_PROCESOS = 0
+    settings.PDF_CACHE_DIR = str(tmp_path)
+    settings.PDF_CACHE_MAX_BYTES = 1024 * 1024
+    maquetados = []
+    monkeypatch.setattr(core_pdf, "_render_local", lambda html, base_url=None: maquetados.append(html) or b"%PDF-")
+
+    core_pdf.render_pdf("<p>contrato</p>")
+    core_pdf.render_pdf("<p>contrato</p>")
+
+    assert len(maquetados) == 2
+    assert list(tmp_path.rglob("*")) == []
+
+
+def test_la_cache_desaloja_lo_menos_usado(monkeypatch, settings, tmp_path):
+    import os
+
+    from core import pdf as core_pdf
+
+    settings.PDF_PROCESOS = 0
+    settings.PDF_CACHE_DIR = str(tmp_path)
+    settings.PDF_CACHE_MAX_BYTES = 250
+    monkeypatch.setattr(core_pdf, "_ocupado_estimado", None)
+    monkeypatch.setattr(core_pdf, "_render_local", lambda html, base_url=None: html.encode().ljust(100, b"."))
+
+    for i, nombre in enumerate(["viejo", "usado", "nuevo"]):
+        core_pdf.render_pdf(nombre, cachear=True)
+        ruta = core_pdf._ruta_cache(tmp_path, core_pdf.clave_pdf(nombre))
+        os.utime(ruta, (1000 + i, 1000 + i))
+    os.utime(core_pdf._ruta_cache(tmp_path, core_pdf.clave_pdf("usado")), (2000, 2000))
+    core_pdf.render_pdf("otro", cachear=True)
+
+    quedan = {ruta.stem for ruta in tmp_path.glob("*/*.pdf")}
+    assert core_pdf.clave_pdf("viejo") not in quedan
+    assert core_pdf.clave_pdf("usado") in quedan
+    assert sum(ruta.stat().st_size for ruta in tmp_path.glob("*/*.pdf")) <= 250
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+
+from core.models import GastoProyecto, IngresoProyecto, Participacion, ProyectoMetricas
+from core.services.financial_dashboard import FinancialDashboardService
+from core.services.project_metrics import (
+    current_project_metrics,
+    dump_metric_row,
+    load_metric_row,
+    refresh_project_metrics,
+)
+
+from .factories import ClienteFactory, ProyectoFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def _rentable_project():
+    project = ProyectoFactory(nombre="Proyecto materializado", estado="vendido")
+    GastoProyecto.objects.create(
+        proyecto=project,
+        fecha=date(2026, 1, 1),
+        categoria="adquisicion",
+        concepto="Compraventa inmueble",
+        importe=Decimal("100000.00"),
+        importe_estimado=Decimal("100000.00"),
+        importe_real=Decimal("100000.00"),
+        estado="confirmado",
+        imputable_inversores=True,
+        pagado=True,
+    )
+    IngresoProyecto.objects.create(
+        proyecto=project,
+        fecha=date(2026, 6, 1),
+        tipo="venta",
+        concepto="Venta final",
+        importe=Decimal("140000.00"),
+        importe_estimado=Decimal("140000.00"),
+        importe_real=Decimal("140000.00"),
+        estado="confirmado",
+        imputable_inversores=True,
+        pagado=True,
+    )
+    Participacion.objects.create(
+        proyecto=project,
+        cliente=ClienteFactory(),
+        importe_invertido=Decimal("60000.00"),
+        estado="confirmada",
+    )
+    return project
+
+
+def test_metric_row_round_trips_through_json_keeping_decimals():
+    project = _rentable_project()
+    metricas = refresh_project_metrics(project.id)
+    metricas.refresh_from_db()
+
+    row = load_metric_row(metricas.datos)
+
+    assert row["capital_captado"] == Decimal("60000.00")
+    assert isinstance(row["investment_return"]["retorno_total"], Decimal)
+    assert dump_metric_row(row) == metricas.datos
+    assert metricas.roi_landing == pytest.approx(40.0)
+
+
+def test_dashboard_reads_stored_row_instead_of_recalculating(direccion_user):
+    project = _rentable_project()
+    refresh_project_metrics(project.id)
+    expected = FinancialDashboardService(direccion_user).build()["projects"]
+
+    with patch("core.views._resultado_desde_memoria", side_effect=AssertionError("must use stored row")):
+        payload = FinancialDashboardService(direccion_user).build()
+
+    assert payload["projects"] == expected
+
+
+def test_writes_drop_the_stored_row_and_refresh_it_on_commit(django_capture_on_commit_callbacks):
+    project = _rentable_project()
+    refresh_project_metrics(project.id)
+    assert project.id in current_project_metrics([project.id])
+
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        GastoProyecto.objects.create(
+            proyecto=project,
+            fecha=date(2026, 2, 1),
+            categoria="reforma",
+            concepto="Reforma",
+            importe=Decimal("10000.00"),
+            importe_real=Decimal("10000.00"),
+            estado="confirmado",
+            imputable_inversores=True,
+            pagado=True,
+        )
+    assert not ProyectoMetricas.objects.filter(proyecto=project).exists()
+
+    for callback in callbacks:
+        callback()
+
+    metricas = current_project_metrics([project.id])[project.id]
+    assert metricas.datos["gastos_real_total"] == pytest.approx(110000.0)
+
+
+def test_rows_from_another_configuration_are_ignored(settings):
+    project = _rentable_project()
+    refresh_project_metrics(project.id)
+
+    settings.MEMORIA_BENEFICIO_NETO_DESDE_TRANSMISION = not settings.MEMORIA_BENEFICIO_NETO_DESDE_TRANSMISION
+
+    assert current_project_metrics([project.id]) == {}
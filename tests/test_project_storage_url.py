@@ -484,3 +484,48 @@ def test_proyecto_ingreso_justificante_uses_storage_url_helper(monkeypatch):
 
     assert response.status_code == 200
     assert payload == {"ok": True, "justificante_url": "signed://ingreso.pdf"}
+
+
+@pytest.fixture
+def _s3_settings(settings, monkeypatch):
+    settings.AWS_STORAGE_BUCKET_NAME = "bucket"
+    settings.AWS_ACCESS_KEY_ID = "key"
+    settings.AWS_SECRET_ACCESS_KEY = "secret"
+    settings.AWS_S3_REGION_NAME = "eu-west-1"
+    calls = {"clients": 0, "signatures": 0}
+
+    class _Client:
+        def generate_presigned_url(self, operation, Params, ExpiresIn):
+            calls["signatures"] += 1
+            return f"https://s3/{Params['Key']}?n={calls['signatures']}"
+
+    def _fake_client(*args, **kwargs):
+        calls["clients"] += 1
+        return _Client()
+
+    monkeypatch.setattr(core_views.boto3, "client", _fake_client)
+    core_views._s3_client.cache_clear()
+    core_views._s3_url_memo.clear()
+    yield calls
+    core_views._s3_client.cache_clear()
+    core_views._s3_url_memo.clear()
+
+
+def test_s3_presigned_url_reuses_one_client_across_keys(_s3_settings):
+    urls = [core_views._s3_presigned_url(f"doc-{i}.pdf") for i in range(40)]
+
+    assert len(set(urls)) == 40
+    assert _s3_settings == {"clients": 1, "signatures": 40}
+
+
+def test_s3_presigned_url_memoizes_within_the_expiry_bucket(_s3_settings, monkeypatch):
+    monkeypatch.setattr(core_views.time, "time", lambda: 10_000.0)
+    first = core_views._s3_presigned_url("doc.pdf", expires_seconds=3600)
+    second = core_views._s3_presigned_url("doc.pdf", expires_seconds=3600)
+
+    monkeypatch.setattr(core_views.time, "time", lambda: 10_000.0 + 900)
+    third = core_views._s3_presigned_url("doc.pdf", expires_seconds=3600)
+
+    assert first == second
+    assert third != first
+    assert _s3_settings["signatures"] == 2
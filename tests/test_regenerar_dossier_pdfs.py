@@ -0,0 +1,119 @@
+from io import BytesIO, StringIO
+
+import pytest
+from django.core.management import call_command
+from pypdf import PdfWriter
+
+from core import views as core_views
+from core.management.commands import regenerar_dossier_pdfs
+from core.models import DocumentoProyecto
+
+from .factories import ProyectoFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def _pdf_en_blanco():
+    writer = PdfWriter()
+    writer.add_blank_page(width=200, height=200)
+    buffer = BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def generados(monkeypatch, settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    llamadas = []
+    monkeypatch.setattr(
+        core_views,
+        "_build_presentacion_pdf",
+        lambda request, context: llamadas.append(context["titulo"]) or _pdf_en_blanco(),
+    )
+    return llamadas
+
+
+def _regenerar(*args):
+    out = StringIO()
+    call_command("regenerar_dossier_pdfs", "--apply", *args, stdout=out)
+    return out.getvalue()
+
+
+def test_incremental_salta_los_proyectos_sin_cambios(generados):
+    proyecto = ProyectoFactory(nombre="Calle Mayor")
+
+    assert "CREATED" in _regenerar("--incremental", "--ids", str(proyecto.id))
+    salida = _regenerar("--incremental", "--ids", str(proyecto.id))
+
+    assert f"{proyecto.id};UNCHANGED;" in salida
+    assert len(generados) == 1
+    dossier = DocumentoProyecto.objects.get(proyecto=proyecto, categoria="presentacion")
+    assert len(dossier.huella_entradas) == 64
+
+
+def test_incremental_regenera_si_cambian_los_datos_o_el_estilo(generados):
+    proyecto = ProyectoFactory(nombre="Calle Mayor")
+    _regenerar("--incremental", "--ids", str(proyecto.id))
+
+    proyecto.nombre = "Calle Mayor 2"
+    proyecto.save()
+    assert "CREATED" in _regenerar("--incremental", "--ids", str(proyecto.id))
+    assert "CREATED" in _regenerar("--incremental", "--estilo", "madrid", "--ids", str(proyecto.id))
+
+    assert len(generados) == 3
+
+
+def test_incremental_compara_con_el_dossier_vigente_no_con_uno_viejo(generados):
+    proyecto = ProyectoFactory(nombre="Calle Mayor")
+    _regenerar("--incremental", "--ids", str(proyecto.id))
+    proyecto.nombre = "Calle Mayor 2"
+    proyecto.save()
+    _regenerar("--incremental", "--ids", str(proyecto.id))
+
+    # Vuelta a los datos del primero: el vigente se hizo con los del segundo.
+    proyecto.nombre = "Calle Mayor"
+    proyecto.save()
+    salida = _regenerar("--incremental", "--ids", str(proyecto.id))
+
+    assert f"{proyecto.id};CREATED" in salida
+    assert generados == ["Calle Mayor", "Calle Mayor 2", "Calle Mayor"]
+
+
+def test_sin_incremental_siempre_regenera(generados):
+    proyecto = ProyectoFactory()
+
+    _regenerar("--ids", str(proyecto.id))
+    _regenerar("--ids", str(proyecto.id))
+
+    assert len(generados) == 2
+
+
+class _GrupoEnLinea:
+    """Sustituto del grupo de procesos: mismo reparto, en este proceso."""
+
+    creados = []
+
+    def __init__(self, max_workers, **kwargs):
+        self.max_workers = max_workers
+        _GrupoEnLinea.creados.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def map(self, fn, *iterables):
+        return map(fn, *iterables)
+
+
+def test_jobs_reparte_los_proyectos_en_un_grupo_de_procesos(generados, monkeypatch):
+    proyectos = [ProyectoFactory() for _ in range(3)]
+    _GrupoEnLinea.creados = []
+    monkeypatch.setattr(regenerar_dossier_pdfs, "ProcessPoolExecutor", _GrupoEnLinea)
+
+    salida = _regenerar("--jobs", "2", "--ids", *[str(p.id) for p in proyectos])
+
+    assert [g.max_workers for g in _GrupoEnLinea.creados] == [2]
+    assert "created=3" in salida
+    assert DocumentoProyecto.objects.filter(categoria="presentacion").count() == 3